@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import argparse
+import json
+from pathlib import Path
+import sys
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.nlp import (  # noqa: E402
+    NLP_ENGINES,
+    SPACY_BATCH_SIZE,
+    SPACY_DEFAULT_PROFILE,
+    analyze_cooking_request,
+    analyze_cooking_requests,
+    get_default_engine,
+)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Replay a query log (one query per line) through the NLP analyzer.")
+    parser.add_argument("log_path", type=Path)
+    parser.add_argument("--output", type=Path, help="write one JSON analysis per line")
+    parser.add_argument("--profile", default=SPACY_DEFAULT_PROFILE)
+    parser.add_argument("--engine", default=get_default_engine(), choices=NLP_ENGINES)
+    parser.add_argument("--batch-size", type=int, default=SPACY_BATCH_SIZE)
+    parser.add_argument("--n-process", type=int, default=1)
+    parser.add_argument("--compare-loop", action="store_true", help="also time one analyze_cooking_request per text")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    texts = [line.strip() for line in args.log_path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not texts:
+        print("Query log is empty.")
+        return 1
+
+    try:
+        # Warm-up: model loading should not count towards the batch timing.
+        analyze_cooking_request(texts[0], profile=args.profile, engine=args.engine)
+        started = time.perf_counter()
+        results = analyze_cooking_requests(
+            texts,
+            profile=args.profile,
+            batch_size=args.batch_size,
+            n_process=args.n_process,
+            engine=args.engine,
+        )
+    except RuntimeError as exc:
+        print(f"NLP model is not available: {exc}")
+        return 1
+    batch_seconds = time.perf_counter() - started
+    print(f"batch: {len(texts)} texts in {batch_seconds:.2f}s ({len(texts) / batch_seconds:.0f} texts/s)")
+
+    if args.compare_loop:
+        started = time.perf_counter()
+        for text in texts:
+            analyze_cooking_request(text, profile=args.profile, engine=args.engine)
+        loop_seconds = time.perf_counter() - started
+        print(f"loop: {len(texts)} texts in {loop_seconds:.2f}s ({len(texts) / loop_seconds:.0f} texts/s)")
+        print(f"speedup: x{loop_seconds / batch_seconds:.1f}")
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as handle:
+            for text, result in zip(texts, results):
+                handle.write(json.dumps({"text": text, **result}, ensure_ascii=False) + "\n")
+        print(f"analyses written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
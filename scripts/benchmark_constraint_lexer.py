@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import random
+import sys
+import timeit
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import nlp  # noqa: E402
+from src.app_service import get_demo_scenarios, get_sample_queries  # noqa: E402
+from tests.test_nlp import CONSTRAINT_FRAGMENTS, LEGACY_CONSTRAINT_EXTRACTORS  # noqa: E402
+
+
+GENERATED_QUERIES = 2000
+REPEATS = 7
+
+
+def _corpora():
+    rng = random.Random(0)
+    sample = list(get_sample_queries()) + [item["query"] for item in get_demo_scenarios() if item["query"]]
+    generated = [
+        " ".join(rng.choice(CONSTRAINT_FRAGMENTS) for _ in range(rng.randint(1, 6)))
+        for _ in range(GENERATED_QUERIES)
+    ]
+    return {"sample": sample * (GENERATED_QUERIES // len(sample)), "generated": generated}
+
+
+def _legacy(text):
+    # Every old extractor normalized the text on its own.
+    return {field: extract(nlp._normalize(text)) for field, extract in LEGACY_CONSTRAINT_EXTRACTORS.items()}
+
+
+def _lexer(text):
+    # Timed without the per-query cache, i.e. one real scan per query.
+    return nlp._scan_constraints.__wrapped__(nlp._normalize(text))
+
+
+def _microseconds_per_query(function, queries):
+    best = min(timeit.repeat(lambda: [function(query) for query in queries], number=1, repeat=REPEATS))
+    return best * 1e6 / len(queries)
+
+
+def main():
+    print(f"{'corpus':<10} {'legacy us':>10} {'lexer us':>10} {'speedup':>8}")
+    for name, queries in _corpora().items():
+        legacy = _microseconds_per_query(_legacy, queries)
+        lexer = _microseconds_per_query(_lexer, queries)
+        print(f"{name:<10} {legacy:>10.2f} {lexer:>10.2f} {legacy / lexer:>7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import resource
+import statistics
+import sys
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import nlp  # noqa: E402
+
+
+BENCHMARK_QUERIES = [
+    "подбери ужин с курицей",
+    "подбери завтрак с яйцом",
+    "рецепты без молока и орехов",
+    "что приготовить из картофеля и грибов",
+    "низкокалорийный салат до 400 ккал на двоих",
+    "похожие на плов с говядиной",
+    "у меня есть рис, морковь и лук",
+    "вегетарианский суп с чечевицей",
+    "десерт без сахара и глютена",
+    "покажи 3 рецепта пасты с томатами",
+]
+REPEATS = 50
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _load(engine):
+    before = _max_rss_mb()
+    started = time.perf_counter()
+    if engine == "spacy":
+        nlp._load_spacy(nlp.SPACY_DEFAULT_PROFILE)
+    else:
+        nlp._load_morph()
+    return (time.perf_counter() - started) * 1000.0, _max_rss_mb() - before
+
+
+def _latencies(engine):
+    samples = []
+    for _ in range(REPEATS):
+        for query in BENCHMARK_QUERIES:
+            started = time.perf_counter()
+            nlp.analyze_cooking_request(query, engine=engine)
+            samples.append((time.perf_counter() - started) * 1000.0)
+    return samples
+
+
+def _lemma_agreement():
+    scores = []
+    for query in BENCHMARK_QUERIES:
+        spacy_lemmas = set(nlp.analyze_cooking_request(query, engine="spacy")["lemmas"])
+        morph_lemmas = set(nlp.analyze_cooking_request(query, engine="pymorphy3")["lemmas"])
+        union = spacy_lemmas | morph_lemmas
+        scores.append(len(spacy_lemmas & morph_lemmas) / len(union) if union else 1.0)
+    return statistics.mean(scores)
+
+
+def main():
+    # pymorphy3 goes first: max RSS only grows, so the smaller engine must be measured before spaCy.
+    rows = []
+    for engine in ["pymorphy3", "spacy"]:
+        try:
+            load_ms, rss_mb = _load(engine)
+        except RuntimeError as exc:
+            print(f"{engine}: not available ({exc})")
+            continue
+        samples = sorted(_latencies(engine))
+        rows.append(
+            (
+                engine,
+                load_ms,
+                rss_mb,
+                statistics.median(samples),
+                samples[int(len(samples) * 0.95) - 1],
+            )
+        )
+
+    print(f"{'engine':<10} {'load ms':>9} {'+RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for engine, load_ms, rss_mb, p50, p95 in rows:
+        print(f"{engine:<10} {load_ms:>9.1f} {rss_mb:>8.1f} {p50:>8.3f} {p95:>8.3f}")
+    if len(rows) == 2:
+        print(f"lemma agreement (mean Jaccard): {_lemma_agreement():.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
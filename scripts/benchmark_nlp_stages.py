@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import argparse
+import json
+from pathlib import Path
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import nlp  # noqa: E402
+from src.app_service import get_demo_scenarios, get_git_summary, get_sample_queries  # noqa: E402
+from src.recommender import ARTIFACTS_DIR, get_recipe_knowledge_graph  # noqa: E402
+
+
+STAGES = ("lemmas", "constraints", "keywords", "entities", "negation", "pantry", "mode")
+GENERATED_QUERIES = 200
+REPEATS = 5
+GENERATED_PARTS = (
+    ("подбери", "покажи 3 рецепта", "что приготовить на", "посоветуй", "хочу"),
+    ("ужин", "завтрак", "обед", "перекус", "салат", "суп", "десерт", "плов"),
+    ("с курицей", "с говядиной", "с рисом", "с грибами", "из картофеля", "с сыром и томатами", ""),
+    ("без молока", "без орехов и глютена", "кроме лука", "исключи сахар", ""),
+    ("до 500 ккал", "около 400 ккал", "300-600 ккал", "низкокалорийный", ""),
+    ("на двоих", "на 4 порции", "для детей", ""),
+)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Per-stage latency and allocations of analyze_cooking_request on a fixed query corpus."
+    )
+    parser.add_argument("--engine", default=nlp.get_default_engine(), choices=nlp.NLP_ENGINES)
+    parser.add_argument("--profile", default=nlp.SPACY_DEFAULT_PROFILE)
+    parser.add_argument("--generated", type=int, default=GENERATED_QUERIES, help="number of generated queries")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", type=Path, help="JSON results (default: artifacts/benchmarks/nlp_stages_<commit>.json)")
+    parser.add_argument("--baseline", type=Path, help="earlier JSON results to compare against")
+    return parser.parse_args()
+
+
+def _corpus(generated):
+    rng = random.Random(0)
+    queries = list(get_sample_queries()) + [item["query"] for item in get_demo_scenarios() if item["query"]]
+    for _ in range(generated):
+        parts = (rng.choice(options) for options in GENERATED_PARTS)
+        queries.append(" ".join(part for part in parts if part))
+    return queries
+
+
+def _run_stages(text, catalogs, profile, engine, measure):
+    """The steps of analyze_cooking_request in order; `measure(stage, function)` runs and records each one."""
+    # Per-query memos would otherwise make every repeat after the first look free.
+    nlp._keyword_hits.cache_clear()
+    nlp._scan_constraints.cache_clear()
+    ingredients, allergens, recipes = catalogs
+
+    lemmas = measure("lemmas", lambda: nlp._extract_lemmas(text, profile, engine))
+    search_text = f"{text} {' '.join(lemmas['lemmas'])}" if lemmas["lemmas"] else text
+    constraints = measure("constraints", lambda: nlp._scan_constraints(nlp._normalize(text)))
+    meal_type, diet_tags = measure("keywords", lambda: (nlp._detect_meal_type(text), nlp._detect_diet_tags(text)))
+    mentioned, datasets = measure(
+        "entities",
+        lambda: (
+            nlp._extract_graph_entities(search_text, ingredients, allergens, recipes),
+            nlp._extract_dataset_entities(search_text),
+        ),
+    )
+    excluded_ingredients, excluded_allergens = measure(
+        "negation", lambda: nlp._extract_negative_entities(text, ingredients, allergens)
+    )
+    pantry = measure("pantry", lambda: nlp._extract_pantry_ingredients(text))
+    entities = {
+        "ingredients": [item for item in mentioned["ingredients"] if item not in excluded_ingredients],
+        "allergens": [item for item in mentioned["allergens"] if item not in excluded_allergens],
+        "recipes": mentioned["recipes"],
+        "datasets": datasets,
+    }
+    query_mode, intent = measure(
+        "mode", lambda: (nlp._detect_query_mode(text, entities, pantry), nlp._classify_cooking_intent(text))
+    )
+    return {
+        "query_mode": query_mode,
+        "intent": intent,
+        "entities": entities,
+        "exclude_ingredients": excluded_ingredients,
+        "exclude_allergens": excluded_allergens,
+        "pantry_ingredients": pantry,
+        "max_results": constraints["max_results"],
+        "servings": constraints["servings"],
+        "meal_type": meal_type,
+        "diet_tags": diet_tags,
+    }
+
+
+def _diverging_query(queries, data_source, catalogs, profile, engine):
+    """First query on which the stage breakdown no longer reproduces analyze_cooking_request, if any."""
+    for text in queries:
+        staged = _run_stages(text, catalogs, profile, engine, lambda stage, function: function())
+        result = nlp.analyze_cooking_request(text, data_source, profile=profile, engine=engine)
+        expected = {
+            "query_mode": result["query_mode"],
+            "intent": result["intent"],
+            "entities": result["entities"],
+            "exclude_ingredients": result["filters"]["exclude_ingredients"],
+            "exclude_allergens": result["filters"]["exclude_allergens"],
+            "pantry_ingredients": result["filters"]["pantry_ingredients"],
+            "max_results": result["filters"]["max_results"],
+            "servings": result["constraints"]["servings"],
+            "meal_type": result["meal_type"],
+            "diet_tags": result["diet_tags"],
+        }
+        if staged != expected:
+            return text
+    return None
+
+
+def _latencies(queries, catalogs, profile, engine, repeats):
+    samples = {stage: [] for stage in STAGES + ("total",)}
+
+    def measure(stage, function):
+        started = time.perf_counter()
+        value = function()
+        samples[stage].append((time.perf_counter() - started) * 1000.0)
+        return value
+
+    for _ in range(repeats):
+        for text in queries:
+            started = time.perf_counter()
+            _run_stages(text, catalogs, profile, engine, measure)
+            samples["total"].append((time.perf_counter() - started) * 1000.0)
+    return samples
+
+
+def _allocations(queries, catalogs, profile, engine):
+    # A separate pass: tracemalloc slows everything down and would distort the latencies.
+    peaks = {stage: [] for stage in STAGES}
+
+    def measure(stage, function):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        value = function()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks[stage].append((peak - before) / 1024.0)
+        return value
+
+    tracemalloc.start()
+    try:
+        for text in queries:
+            _run_stages(text, catalogs, profile, engine, measure)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def _summary(samples, peaks):
+    stages = {}
+    for stage, values in samples.items():
+        ordered = sorted(values)
+        stages[stage] = {
+            "mean_ms": round(statistics.mean(ordered), 4),
+            "p99_ms": round(ordered[max(0, int(len(ordered) * 0.99) - 1)], 4),
+        }
+        if stage in peaks:
+            stages[stage]["alloc_mean_kb"] = round(statistics.mean(peaks[stage]), 2)
+            stages[stage]["alloc_max_kb"] = round(max(peaks[stage]), 2)
+    return stages
+
+
+def _print_report(stages, baseline=None):
+    print(f"{'stage':<12} {'mean ms':>9} {'p99 ms':>9} {'alloc KB':>9} {'max KB':>9} {'vs base':>8}")
+    for stage, row in stages.items():
+        delta = ""
+        base = (baseline or {}).get(stage)
+        if base and base["mean_ms"]:
+            delta = f"{(row['mean_ms'] / base['mean_ms'] - 1.0) * 100.0:+.0f}%"
+        alloc = f"{row['alloc_mean_kb']:>9.2f} {row['alloc_max_kb']:>9.2f}" if "alloc_mean_kb" in row else " " * 19
+        print(f"{stage:<12} {row['mean_ms']:>9.4f} {row['p99_ms']:>9.4f} {alloc} {delta:>8}")
+
+
+def main():
+    args = _parse_args()
+    queries = _corpus(args.generated)
+    data_source = get_recipe_knowledge_graph()
+    catalogs = nlp._graph_catalogs(data_source)
+    try:
+        engine = nlp._resolve_engine(args.engine, args.profile)
+    except RuntimeError as exc:
+        print(f"NLP engine is not available: {exc}")
+        return 1
+    diverging = _diverging_query(queries, data_source, catalogs, args.profile, args.engine)
+    if diverging is not None:
+        print(f"Stage breakdown no longer matches analyze_cooking_request (query: {diverging!r}); update STAGES.")
+        return 1
+
+    samples = _latencies(queries, catalogs, args.profile, args.engine, args.repeats)
+    stages = _summary(samples, _allocations(queries, catalogs, args.profile, args.engine))
+    git = get_git_summary()
+    results = {
+        "commit": git["commit"],
+        "dirty": not git["is_clean"],
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "engine": engine,
+        "profile": args.profile,
+        "data_source": "recipe_graph" if data_source is not None else "none",
+        "query_count": len(queries),
+        "repeats": args.repeats,
+        "stages": stages,
+    }
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["stages"]
+    _print_report(stages, baseline)
+
+    output = args.output or ARTIFACTS_DIR / "benchmarks" / f"nlp_stages_{git['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"results: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+from contextlib import closing
+import json
+from pathlib import Path
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import recommender  # noqa: E402
+
+
+BENCHMARK_QUERIES = [
+    ("egg", None),
+    ("rice", None),
+    ("chicken rice", None),
+    ("beef pilaf", None),
+    ("tomato soup", None),
+    ("cheese omelette", None),
+    ("greek salad with feta", None),
+    ("potato", "ужин"),
+    ("oat", "завтрак"),
+    ("chocolate cake", None),
+]
+REPEATS = 20
+LEGACY_TOKENIZER = "unicode61"
+
+
+def _benchmark_fts_queries():
+    queries = []
+    for query_text, meal_type in BENCHMARK_QUERIES:
+        profile = recommender._dataset_query_profile(query_text, meal_type=meal_type)
+        queries.extend(recommender._build_fts_queries(profile, meal_type))
+    return list(dict.fromkeys(queries))
+
+
+def _as_prefix_query(fts_query):
+    # The query builder before porter stemming sent every term as an open-ended `term*` wildcard.
+    return re.sub(r"\b([a-z0-9]+)\b(?!:)", r"\1*", fts_query)
+
+
+def _read_indexed_rows(shard_paths):
+    for path in shard_paths:
+        with closing(sqlite3.connect(str(path))) as conn:
+            for row_id, body in conn.execute("SELECT id, body FROM recipenlg_docs ORDER BY id"):
+                item = recommender._decode_recipe_document(body)
+                yield (
+                    row_id,
+                    item["title"],
+                    " ".join(item["ingredients"]),
+                    " ".join(item["ner"]),
+                    " ".join(item["category_tags"]),
+                )
+
+
+def _build_variant(path, tokenizer, prefix, shard_paths):
+    prefix_option = f", prefix='{prefix}'" if prefix else ""
+    with closing(sqlite3.connect(str(path))) as conn:
+        conn.execute(
+            "CREATE VIRTUAL TABLE recipenlg_fts USING fts5("
+            f"title, ingredients_text, ner_text, category_tags, content='', tokenize='{tokenizer}'{prefix_option})"
+        )
+        conn.executemany(
+            "INSERT INTO recipenlg_fts(rowid, title, ingredients_text, ner_text, category_tags) VALUES (?, ?, ?, ?, ?)",
+            _read_indexed_rows(shard_paths),
+        )
+        conn.execute("INSERT INTO recipenlg_fts(recipenlg_fts) VALUES ('optimize')")
+        conn.commit()
+
+
+def _time_queries(path, fts_queries):
+    timings = []
+    hits = 0
+    with closing(sqlite3.connect(str(path))) as conn:
+        for _ in range(REPEATS):
+            for fts_query in fts_queries:
+                started = time.perf_counter()
+                rows = conn.execute(
+                    "SELECT rowid FROM recipenlg_fts WHERE recipenlg_fts MATCH ? ORDER BY bm25(recipenlg_fts) LIMIT ?",
+                    (fts_query, recommender.RECIPE_NLG_SEARCH_POOL),
+                ).fetchall()
+                timings.append((time.perf_counter() - started) * 1000.0)
+                hits += len(rows)
+    timings.sort()
+    return {
+        "queries": len(fts_queries),
+        "repeats": REPEATS,
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 3),
+        "total_ms": round(sum(timings), 1),
+        "hits_per_run": hits // REPEATS,
+    }
+
+
+def main():
+    status = recommender.ensure_recipenlg_search_index()
+    if not status["serving"]:
+        print(f"RecipeNLG search index is not available: {status.get('last_error')}")
+        return 1
+
+    stem_queries = _benchmark_fts_queries()
+    prefix_queries = [_as_prefix_query(query) for query in stem_queries]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        before_path = Path(temp_dir) / "before.sqlite3"
+        after_path = Path(temp_dir) / "after.sqlite3"
+        _build_variant(before_path, LEGACY_TOKENIZER, "", status["shard_paths"])
+        _build_variant(after_path, recommender.RECIPE_NLG_FTS_TOKENIZER, recommender.RECIPE_NLG_FTS_PREFIX, status["shard_paths"])
+        report = {
+            "row_count": status["row_count"],
+            "before": {"tokenizer": LEGACY_TOKENIZER, "query": "term*", **_time_queries(before_path, prefix_queries)},
+            "after": {
+                "tokenizer": recommender.RECIPE_NLG_FTS_TOKENIZER,
+                "prefix": recommender.RECIPE_NLG_FTS_PREFIX,
+                "query": "stem",
+                **_time_queries(after_path, stem_queries),
+            },
+        }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,14 +7,42 @@ ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from src.recommender import ensure_recipenlg_search_index  # noqa: E402
+from src.recommender import get_search_index_status, start_search_index_build  # noqa: E402
+
+
+PROGRESS_INTERVAL_SECONDS = 5.0
+
+
+def _format_progress(build):
+    eta = build.get("eta_seconds")
+    bytes_total = build.get("bytes_total") or 0
+    percent = 100.0 * build.get("bytes_done", 0) / bytes_total if bytes_total else 0.0
+    return (
+        f"[{build.get('state')}] rows: {build.get('rows_done', 0)} ({percent:.1f}%), "
+        f"{build.get('rows_per_sec', 0.0)} rows/s, "
+        f"ETA: {f'{eta:.0f}s' if eta is not None else 'n/a'}, "
+        f"skipped: {build.get('rows_skipped', 0)}"
+    )
 
 
 def main():
-    status = ensure_recipenlg_search_index(force_rebuild="--force" in sys.argv[1:])
+    thread = start_search_index_build(force_rebuild="--force" in sys.argv[1:])
+    reported_resume = False
+    while thread.is_alive():
+        thread.join(PROGRESS_INTERVAL_SECONDS)
+        build = get_search_index_status()["build"]
+        if build.get("state") != "running":
+            continue
+        if build.get("resumed_from_rows") and not reported_resume:
+            print(f"Resumed from checkpoint at {build['resumed_from_rows']} rows.")
+            reported_resume = True
+        print(_format_progress(build), flush=True)
+
+    status = get_search_index_status(refresh=True)
     print("RecipeNLG search index status:")
-    for key in ["ready", "needs_rebuild", "row_count", "path", "last_error", "built_at"]:
+    for key in ["ready", "needs_rebuild", "row_count", "cluster_count", "shard_count", "path", "last_error", "built_at"]:
         print(f"- {key}: {status.get(key)}")
+    print(f"- build: {_format_progress(status['build'])}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import sys
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.recipe_vectors import (  # noqa: E402
+    build_ingredient_substitutions,
+    build_recipe_ann_index,
+    build_recipe_embeddings,
+    build_recipe_knowledge_graph,
+    build_recipe_neighbors,
+    load_recipe_term_matrix,
+)
+from src.recommender import ensure_recipenlg_search_index, recipe_vector_terms  # noqa: E402
+
+
+def main():
+    status = ensure_recipenlg_search_index()
+    if not status["ready"]:
+        print(f"RecipeNLG search index is not ready: {status.get('last_error')}")
+        return 1
+
+    started = time.monotonic()
+
+    def progress(done, total):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"neighbors: {done}/{total} recipes, {done / elapsed:.0f} recipes/s", flush=True)
+
+    result = build_recipe_neighbors(progress=progress)
+    print("RecipeNLG neighbors table:")
+    for key, value in result.items():
+        print(f"- {key}: {value}")
+
+    word_matrix = load_recipe_term_matrix(recipe_vector_terms)
+    for title, build in [("RecipeNLG ANN index", build_recipe_ann_index), ("RecipeNLG embeddings", build_recipe_embeddings)]:
+        result = build(matrix=word_matrix)
+        print(f"{title}:")
+        for key, value in result.items():
+            print(f"- {key}: {value}")
+
+    result = build_ingredient_substitutions()
+    print("RecipeNLG ingredient substitutions:")
+    for key, value in result.items():
+        print(f"- {key}: {value}")
+
+    result = build_recipe_knowledge_graph()
+    print("RecipeNLG knowledge graph:")
+    for key, value in result.items():
+        print(f"- {key}: {len(value) if key == 'aliases' else value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import sys
+
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.recommender import build_recipenlg_snapshot  # noqa: E402
+
+
+def _format_progress(rows, offset, bytes_total):
+    percent = 100.0 * offset / bytes_total if bytes_total else 0.0
+    return f"rows: {rows} ({percent:.1f}%)"
+
+
+def main():
+    try:
+        result = build_recipenlg_snapshot(progress=lambda *args: print(_format_progress(*args), flush=True))
+    except RuntimeError as exc:
+        print(f"RecipeNLG snapshot was not built: {exc}")
+        return 1
+    print("RecipeNLG columnar snapshot:")
+    for key in ["path", "row_count", "valid_row_count", "source_size", "built_at"]:
+        print(f"- {key}: {result.get(key)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,39 @@
 from fastapi import FastAPI, File, UploadFile
 
 try:
-    from .app_service import handle_chat_message, handle_image_message, get_demo_day_report, get_runtime_status
-    from .api_schemas import ChatRequest, ChatResponse, DemoReportResponse, HealthResponse, StatusResponse
+    from .app_service import (
+        get_demo_day_report,
+        get_runtime_status,
+        handle_chat_message,
+        handle_image_message,
+        handle_pantry_request,
+    )
+    from .api_schemas import (
+        ChatRequest,
+        ChatResponse,
+        DemoReportResponse,
+        HealthResponse,
+        PantryRequest,
+        PantryResponse,
+        StatusResponse,
+    )
 except ImportError:
-    from app_service import handle_chat_message, handle_image_message, get_demo_day_report, get_runtime_status
-    from api_schemas import ChatRequest, ChatResponse, DemoReportResponse, HealthResponse, StatusResponse
+    from app_service import (
+        get_demo_day_report,
+        get_runtime_status,
+        handle_chat_message,
+        handle_image_message,
+        handle_pantry_request,
+    )
+    from api_schemas import (
+        ChatRequest,
+        ChatResponse,
+        DemoReportResponse,
+        HealthResponse,
+        PantryRequest,
+        PantryResponse,
+        StatusResponse,
+    )
 
 
 def create_app():
@@ -31,6 +59,10 @@ def create_app():
     def chat(payload: ChatRequest):
         return handle_chat_message(payload.message)
 
+    @app.post("/recipes/pantry", response_model=PantryResponse)
+    def pantry_recipes(payload: PantryRequest):
+        return handle_pantry_request(payload.ingredients, payload.exclude_ingredients, payload.limit)
+
     @app.post("/image/analyze")
     async def analyze_image(file: UploadFile = File(...)):
         image_bytes = await file.read()
@@ -15,6 +15,19 @@ class ChatResponse(BaseModel):
     query_bucket: str = ""
 
 
+class PantryRequest(BaseModel):
+    ingredients: list[str] = Field(..., min_length=1, description="Продукты, которые есть у пользователя")
+    exclude_ingredients: list[str] = Field(default_factory=list, description="Продукты, которые нужно исключить")
+    limit: int = Field(8, ge=1, le=20, description="Сколько рецептов вернуть")
+
+
+class PantryResponse(BaseModel):
+    ok: bool
+    query: str
+    response: str
+    recipes: list[dict[str, Any]] = Field(default_factory=list)
+
+
 class StatusResponse(BaseModel):
     datasets: dict[str, Any]
     nlp: dict[str, Any]
@@ -5,11 +5,13 @@ import subprocess
 
 try:
     from .logic import process_text_interaction
-    from .nlp import analyze_cooking_request, get_spacy_status, warmup_spacy_model
-    from .pipeline import run_image_pipeline
+    from .nlp import get_spacy_status, parse_cooking_request, warmup_spacy_model
+    from .pipeline import run_image_pipeline, run_pantry_pipeline
     from .recommender import (
         get_translation_status,
         get_recipenlg_preview,
+        get_recipenlg_snapshot,
+        get_recipe_knowledge_graph,
         get_search_index_status,
         recipenlg_csv_path,
         translate_to_en,
@@ -17,11 +19,13 @@ try:
     from .vision import get_vision_status
 except ImportError:
     from logic import process_text_interaction
-    from nlp import analyze_cooking_request, get_spacy_status, warmup_spacy_model
-    from pipeline import run_image_pipeline
+    from nlp import get_spacy_status, parse_cooking_request, warmup_spacy_model
+    from pipeline import run_image_pipeline, run_pantry_pipeline
     from recommender import (
         get_translation_status,
         get_recipenlg_preview,
+        get_recipenlg_snapshot,
+        get_recipe_knowledge_graph,
         get_search_index_status,
         recipenlg_csv_path,
         translate_to_en,
@@ -89,8 +93,9 @@ def _history_key(query_text):
     return re.sub(r"\s+", " ", str(query_text or "").strip().lower())
 
 
-def _semantic_query_bucket(query_text):
-    parsed = analyze_cooking_request(query_text)
+def _semantic_query_bucket(query_text, parsed=None):
+    if parsed is None:
+        parsed = parse_cooking_request(query_text)
     parts = []
     service_lemmas = {
         "рецепт", "подобрать", "подбери", "приготовить", "посоветовать",
@@ -137,11 +142,11 @@ def _semantic_query_bucket(query_text):
     return "|".join(dict.fromkeys(parts))
 
 
-def _build_chat_context(query_text, chat_state):
+def _build_chat_context(query_text, chat_state, parsed=None):
     if not isinstance(chat_state, dict):
         return None, None
 
-    query_key = _semantic_query_bucket(query_text)
+    query_key = _semantic_query_bucket(query_text, parsed)
     context = {}
     previous_titles = chat_state.get("query_recipe_history", {}).get(query_key, [])
     if previous_titles:
@@ -208,11 +213,20 @@ def handle_chat_message(text, context=None):
 
     chat_context = context
     query_key = None
+    # Request-scoped parse: the bucket key and the text pipeline share one analysis of the message.
+    parsed = None
+    # RecipeNLG knowledge graph when its artifact is built, otherwise None (no graph entities).
+    try:
+        data_source = get_recipe_knowledge_graph()
+    except (OSError, ValueError, KeyError):
+        # A partial or mid-swap graph artifact costs the graph entities, not the answer.
+        data_source = None
     if isinstance(context, dict) and any(key in context for key in ["query_recipe_history", "last_recipe_title"]):
-        chat_context, query_key = _build_chat_context(clean_text, context)
+        parsed = parse_cooking_request(clean_text, data_source)
+        chat_context, query_key = _build_chat_context(clean_text, context, parsed)
 
     try:
-        interaction = process_text_interaction(clean_text, None, context=chat_context)
+        interaction = process_text_interaction(clean_text, data_source, context=chat_context, parsed=parsed)
     except Exception as exc:  # pragma: no cover - runtime safeguard
         return _error_response(clean_text, f"Ошибка обработки запроса: {exc}")
 
@@ -229,6 +243,36 @@ def handle_chat_message(text, context=None):
     }
 
 
+def handle_pantry_request(ingredients, exclude_ingredients=None, limit=8):
+    pantry = [str(item).strip() for item in ingredients or [] if str(item).strip()]
+    if not pantry:
+        return _error_response("", "Передайте хотя бы один ингредиент.")
+
+    query = ", ".join(pantry)
+    try:
+        result = run_pantry_pipeline(pantry, exclude_ingredients=exclude_ingredients, limit=max(1, min(20, int(limit))))
+    except Exception as exc:  # pragma: no cover - runtime safeguard
+        return _error_response(query, f"Ошибка подбора рецептов: {exc}")
+
+    ranked = result["stages"]["decision"]["ranked"]
+    return {
+        "ok": True,
+        "query": query,
+        "response": result["response"],
+        "recipes": [
+            {
+                "title": item["title"],
+                "title_ru": item.get("title_ru", ""),
+                "pantry_coverage": item["pantry_coverage"],
+                "matched_count": item["matched_count"],
+                "ingredient_count": item["ingredient_count"],
+                "missing_ingredients": item["missing_ingredients"],
+            }
+            for item in ranked
+        ],
+    }
+
+
 def handle_image_message(image_bytes):
     if not image_bytes:
         return {
@@ -272,6 +316,7 @@ def get_api_catalog():
         {"method": "GET", "path": "/status", "purpose": "Статус NLP/CV, переводчика и датасетов"},
         {"method": "GET", "path": "/demo/report", "purpose": "Сводка по критериям защиты и AI-сложности"},
         {"method": "POST", "path": "/chat", "purpose": "Обработка текстового запроса"},
+        {"method": "POST", "path": "/recipes/pantry", "purpose": "Рецепты из имеющихся продуктов"},
         {"method": "POST", "path": "/image/analyze", "purpose": "Анализ изображения блюда"},
     ]
 
@@ -333,6 +378,9 @@ def get_external_dataset_data():
 
 @lru_cache(maxsize=1)
 def _count_recipenlg_rows(recipenlg_path):
+    snapshot = get_recipenlg_snapshot(Path(recipenlg_path))
+    if snapshot is not None:
+        return snapshot["valid_row_count"]
     with open(recipenlg_path, "r", encoding="utf-8", errors="ignore") as file:
         return max(sum(1 for _ in file) - 1, 0)
 
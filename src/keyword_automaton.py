@@ -0,0 +1,54 @@
+from collections import deque
+
+
+def build_keyword_automaton(patterns):
+    """Aho-Corasick automaton over (pattern, payload) pairs; empty patterns are ignored.
+
+    Returned as plain lists so it can be cached and shared between threads: `goto` holds the trie
+    transitions per node, `fail` the failure links and `outputs` the (length, payload) pairs that
+    end at each node, already merged along the failure chain.
+    """
+    goto = [{}]
+    fail = [0]
+    outputs = [[]]
+    for pattern, payload in patterns:
+        if not pattern:
+            continue
+        node = 0
+        for char in pattern:
+            child = goto[node].get(char)
+            if child is None:
+                child = len(goto)
+                goto[node][char] = child
+                goto.append({})
+                fail.append(0)
+                outputs.append([])
+            node = child
+        outputs[node].append((len(pattern), payload))
+
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for char, child in goto[node].items():
+            queue.append(child)
+            state = fail[node]
+            while state and char not in goto[state]:
+                state = fail[state]
+            fail[child] = goto[state].get(char, 0)
+            if outputs[fail[child]]:
+                outputs[child] = outputs[child] + outputs[fail[child]]
+    return {"goto": goto, "fail": fail, "outputs": outputs}
+
+
+def find_keywords(automaton, text):
+    """Yield (start, payload) for every pattern occurrence in `text`, overlapping ones included."""
+    goto = automaton["goto"]
+    fail = automaton["fail"]
+    outputs = automaton["outputs"]
+    node = 0
+    for position, char in enumerate(text):
+        while node and char not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(char, 0)
+        for length, payload in outputs[node]:
+            yield position - length + 1, payload
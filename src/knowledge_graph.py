@@ -0,0 +1,86 @@
+from collections.abc import Mapping
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+GRAPH_NODE_TYPES = ("ingredient", "allergen", "recipe")
+
+
+class _NodeView(Mapping):
+    """Read-only `graph.nodes` with the networkx access pattern: iterate names, `nodes[name]` -> attributes."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node):
+        return self._graph.node_attributes(self._graph.node_ids[node])
+
+    def __iter__(self):
+        return iter(self._graph.names)
+
+    def __len__(self):
+        return len(self._graph.names)
+
+
+class RecipeKnowledgeGraph:
+    """Ingredient/allergen/recipe graph as a CSR adjacency over interned node ids.
+
+    Edges are stored in both directions; `graph["version"]` is the index build the graph was derived
+    from, so NLP catalog indexes built from it are invalidated together with the index.
+    """
+
+    def __init__(self, names, node_types, indptr, indices, weights, aliases=None, version=None):
+        self.names = [str(name) for name in names]
+        self.node_ids = {name: node_id for node_id, name in enumerate(self.names)}
+        self.node_types = np.asarray(node_types, dtype=np.uint8)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.aliases = dict(aliases or {})
+        self.graph = {"version": version}
+        self.nodes = _NodeView(self)
+
+    def node_attributes(self, node_id):
+        name = self.names[node_id]
+        return {"type": GRAPH_NODE_TYPES[self.node_types[node_id]], "aliases": self.aliases.get(name, [])}
+
+    def neighbors(self, node, node_type=None):
+        """Neighbour names, strongest edge first, optionally restricted to one node type."""
+        node_id = self.node_ids[node]
+        start, stop = int(self.indptr[node_id]), int(self.indptr[node_id + 1])
+        neighbor_ids = self.indices[start:stop]
+        weights = self.weights[start:stop]
+        if node_type is not None:
+            keep = self.node_types[neighbor_ids] == GRAPH_NODE_TYPES.index(node_type)
+            neighbor_ids, weights = neighbor_ids[keep], weights[keep]
+        order = np.argsort(-weights, kind="stable")
+        return [self.names[neighbor_id] for neighbor_id in neighbor_ids[order].tolist()]
+
+    def to_networkx(self):
+        """networkx copy of the graph for ad-hoc analysis; networkx is only needed for this view."""
+        import networkx as nx  # pylint: disable=import-outside-toplevel
+
+        graph = nx.Graph(version=self.graph["version"])
+        for node_id, name in enumerate(self.names):
+            graph.add_node(name, **self.node_attributes(node_id))
+        sources = np.repeat(np.arange(len(self.names)), np.diff(self.indptr))
+        for source, target, weight in zip(sources.tolist(), self.indices.tolist(), self.weights.tolist()):
+            if source < target:
+                graph.add_edge(self.names[source], self.names[target], weight=weight)
+        return graph
+
+
+def load_knowledge_graph(path, version=None):
+    path = Path(path)
+    metadata = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    return RecipeKnowledgeGraph(
+        np.load(path / "names.npy").tolist(),
+        np.load(path / "node_types.npy"),
+        np.load(path / "indptr.npy", mmap_mode="r"),
+        np.load(path / "indices.npy", mmap_mode="r"),
+        np.load(path / "weights.npy", mmap_mode="r"),
+        aliases=metadata.get("aliases", {}),
+        version=version if version is not None else metadata.get("index_build_id"),
+    )
@@ -103,7 +103,7 @@ def _pipeline_recipe_title(pipeline_result):
     return ""
 
 
-def process_text_interaction(text, data_source, context=None):
+def process_text_interaction(text, data_source, context=None, parsed=None):
     if text is None:
         return {"response": "Я не знаю такого термина", "recipe_title": ""}
 
@@ -170,6 +170,7 @@ def process_text_interaction(text, data_source, context=None):
         data_source,
         debug=False,
         exclude_titles=(context or {}).get("exclude_titles", []),
+        parsed=parsed,
     )
     if pipeline_result.get("handled"):
         return {
@@ -179,6 +179,12 @@ def render_sidebar():
         st.success(f"Поисковый индекс RecipeNLG готов ({search_index.get('row_count', 0)} строк).")
     elif search_index.get("needs_rebuild"):
         st.warning("Поисковый индекс RecipeNLG отсутствует или устарел. Первый поиск может занять больше времени.")
+    index_build = search_index.get("build", {})
+    if index_build.get("state") == "running":
+        st.caption(
+            f"Фоновая сборка индекса: {index_build.get('rows_done', 0)} строк, "
+            f"{index_build.get('elapsed_seconds', 0.0)} с (поколение {search_index.get('generation', 0)})."
+        )
     if search_index.get("last_error"):
         st.caption(f"Статус индекса: {search_index['last_error']}")
 
@@ -1,12 +1,46 @@
-from collections import Counter
-from difflib import get_close_matches
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+import copy
 from functools import lru_cache
 import importlib.util
+import os
 import re
 import sys
+import threading
+import time
+import weakref
+
+try:
+    from .keyword_automaton import build_keyword_automaton, find_keywords
+    from .typo_index import build_typo_index, lookup_close_key
+except ImportError:
+    from keyword_automaton import build_keyword_automaton, find_keywords
+    from typo_index import build_typo_index, lookup_close_key
 
 
 RESULT_LIMIT_DEFAULT = 8
+SPACY_MODEL_NAME = "ru_core_news_sm"
+# Components excluded per profile. The analyzer reads only lemmas and doc.ents, so the dependency
+# parser is never needed; "lemmas" also drops NER for latency-critical callers.
+SPACY_PROFILES = {
+    "full": [],
+    "default": ["parser"],
+    "lemmas": ["parser", "ner"],
+}
+SPACY_DEFAULT_PROFILE = "default"
+SPACY_BATCH_SIZE = 256
+# "auto" uses spaCy when its model loads and falls back to the pymorphy3 lemmatizer otherwise.
+NLP_ENGINES = ("auto", "spacy", "pymorphy3")
+NLP_DEFAULT_ENGINE = "auto"
+# Deployment override of the default engine, e.g. NLP_ENGINE=pymorphy3 on hosts without the spaCy model.
+NLP_ENGINE_ENV = "NLP_ENGINE"
+# After a failed spaCy load, "auto" stays on pymorphy3 this long before trying spaCy again.
+NLP_ENGINE_RETRY_SECONDS = 60.0
+MORPH_LEMMA_CACHE_SIZE = 50000
+PARSE_CACHE_SIZE = 512
+PARSE_CACHE_TTL_SECONDS = 600
+CATALOG_INDEX_CACHE_SIZE = 4
+CATALOG_NODE_TYPES = ("ingredient", "allergen", "recipe")
 
 SERVINGS_WORDS = {
     "одного": 1,
@@ -44,6 +78,120 @@ MEAL_ALIASES = {
     "перекус": "перекус",
 }
 
+DIET_KEYWORDS = (
+    ("веган", "vegan"),
+    ("вегетариан", "vegetarian"),
+    ("безглютен", "gluten_free"),
+    ("пп", "healthy"),
+    ("диет", "diet"),
+    ("без сахара", "no_sugar"),
+    ("без молока", "dairy_free"),
+    ("кето", "keto"),
+    ("белков", "high_protein"),
+)
+
+# Checked in order: the first rule with any keyword in the query wins.
+INTENT_KEYWORDS = (
+    ("Работа с датасетами", ("датасет", "dataset")),
+    ("Поиск похожих рецептов", ("похож", "аналог", "что похоже", "similar")),
+    ("Фильтрация по аллергенам", ("без ", "аллерг", "не переношу", "исключи", "убери")),
+    ("Фильтрация по калорийности", ("ккал", "калори", "низкокал", "высококал")),
+    ("Рекомендация рецепта", ("что приготовить", "посоветуй", "подбери", "напиши рецепт")),
+    ("Поиск рецепта по параметрам", ("рецепт", "блюдо", "ингредиент")),
+)
+
+QUERY_MODE_KEYWORDS = {
+    "similarity": ("похож", "похожие", "аналог", "что похоже", "similar"),
+    "listing": ("покажи", "список", "какие", "перечисли"),
+    "dataset": ("датасет", "dataset"),
+    "allergen": ("аллерген",),
+    "ingredient": ("ингредиент",),
+    "recipe": ("рецепт",),
+    "dataset_info": ("что такое", "инфо", "подроб", "ссылка", "где скачать", "о датасете"),
+    "recipe_info": ("состав", "калор", "что в", "инфо", "подроб"),
+    "allergen_info": ("что такое", "опас", "аллерген", "чем опас"),
+    "ingredient_info": ("где используется", "с чем", "в каких рецептах", "из чего"),
+    "recommendation": ("что приготовить", "подбери", "посоветуй", "рецепт", "блюдо", "приготов"),
+    "nutrition": ("ккал", "калори"),
+}
+
+PANTRY_MARKERS = [
+    "у меня есть",
+    "у меня только",
+    "есть только",
+    "в холодильнике",
+    "что приготовить из",
+    "что можно приготовить из",
+    "приготовить из",
+]
+PANTRY_FILLER_WORDS = ("есть", "только", "лишь")
+# "у меня есть аллергия на орехи" / "у меня есть вопрос про плов" are not a list of products.
+PANTRY_NON_INGREDIENT_STEMS = (
+    "аллерг",
+    "непереносим",
+    "вопрос",
+    "проблем",
+    "иде",
+    "просьб",
+    "пожелан",
+    "задач",
+    "врем",
+    "рецепт",
+    "план",
+)
+
+CALORIE_MAX_MARKERS = ("до", "меньше", "не более")
+CALORIE_MIN_MARKERS = ("от", "больше", "не менее")
+CALORIE_AROUND_MARKERS = ("около", "примерно", "~")
+SERVINGS_UNITS = ("порц", "чел", "персон", "people", "serving")
+RESULT_LIMIT_VERBS = ("покажи", "дай", "подбери", "предложи", "выведи")
+RESULT_LIMIT_UNITS = ("рецепт", "вариант", "блюд")
+# Checked in order: segments are reported marker by marker, as the scopes were always listed.
+NEGATION_MARKERS = ("без", "кроме", "исключи", "убери", "не добавляй")
+NEGATION_SCOPE_END_CHARS = ".?!"
+NEGATION_SCOPE_END_WORDS = ("на", "до", "от", "для")
+
+
+def _alternation(words):
+    return "|".join(re.escape(word) for word in words)
+
+
+_CONSTRAINT_TRIGGER_WORDS = (
+    CALORIE_MAX_MARKERS
+    + CALORIE_MIN_MARKERS
+    + CALORIE_AROUND_MARKERS
+    + RESULT_LIMIT_VERBS
+    + NEGATION_MARKERS
+    + ("топ", "на", "низкокал", "высококал")
+)
+_CONSTRAINT_TRIGGER_CHARS = "".join(sorted({word[0] for word in _CONSTRAINT_TRIGGER_WORDS}))
+
+# One scan of a normalized query for every numeric constraint and negation scope. A token consumes only
+# its trigger word and reads the rest in lookaheads, so triggers never hide one another and each kind's
+# first token is where the old per-constraint re.search would have matched. The leading class rejects
+# positions where no token can start before any alternative is tried.
+CONSTRAINT_LEXER = re.compile(
+    rf"""
+    (?=[\d\x20{re.escape(NEGATION_SCOPE_END_CHARS + _CONSTRAINT_TRIGGER_CHARS)}])
+    (?:(?P<number>(?<!\d)\d+(?=\s*[-–]\s*(?P<range_high>\d{{2,4}})\s*ккал
+        |\s*(?P<unit>{_alternation(SERVINGS_UNITS + RESULT_LIMIT_UNITS)})))
+    |(?P<bound>(?:{_alternation(CALORIE_MAX_MARKERS + CALORIE_MIN_MARKERS + CALORIE_AROUND_MARKERS)})
+        (?=\s*(?P<bound_value>\d{{2,4}})(?P<bound_kcal>\s*ккал)?))
+    |(?P<limit_verb>(?:{_alternation(RESULT_LIMIT_VERBS)})
+        (?=\s*(?P<verb_limit>\d{{1,2}})\s*(?:{_alternation(RESULT_LIMIT_UNITS)})))
+    |(?P<limit_top>топ(?=\s*(?P<top_limit>\d{{1,2}})))
+    |(?P<servings_word>на(?=\s+(?P<servings_value>{_alternation(SERVINGS_WORDS)})))
+    |(?P<negation>(?:{_alternation(NEGATION_MARKERS)})(?=\x20))
+    |(?P<scope_end>[{re.escape(NEGATION_SCOPE_END_CHARS)}]
+        |\x20(?=(?:{_alternation(NEGATION_SCOPE_END_WORDS)})\x20))
+    |(?P<low_calorie>низкокал)
+    |(?P<high_calorie>высококал))
+    """,
+    re.VERBOSE,
+)
+LIST_SEPARATOR = re.compile(r",| и |/|;")
+
+
 DATASET_CATALOG = (
     {
         "name": "RecipeNLG Dataset",
@@ -97,17 +245,47 @@ def _dedupe_keep_order(items):
     return result
 
 
-def _extract_matches(query, candidates, cutoff=0.83):
-    if not candidates:
+def _compile_catalog(items, aliases=()):
+    normalized = {}
+    for item in items:
+        normalized[_normalize(item)] = item
+    # Aliases (e.g. Russian stems of English graph nodes) never shadow a real name.
+    for alias, item in aliases:
+        normalized.setdefault(_normalize(alias), item)
+    entries = list(normalized.items())
+    real_keys = {_normalize(item) for item in items}
+    return {
+        "items": list(items),
+        "normalized": normalized,
+        # Alias stems ("рис", "лук") only match from the start of a word: "нарисуй" is not rice.
+        "alias_ids": {index for index, (key, _) in enumerate(entries) if key not in real_keys},
+        "typo_index": build_typo_index(key for key, _ in entries),
+        "automaton": build_keyword_automaton(
+            (key, (index, value)) for index, (key, value) in enumerate(entries)
+        ),
+    }
+
+
+def _catalog_hits(catalog, query_norm):
+    # Values in catalog order, as a scan over the catalog would return them.
+    alias_ids = catalog["alias_ids"]
+    hits = {
+        payload
+        for start, payload in find_keywords(catalog["automaton"], query_norm)
+        if payload[0] not in alias_ids or start == 0 or not query_norm[start - 1].isalnum()
+    }
+    # An item and its alias may both match; report the item once.
+    return list(dict.fromkeys(value for _, value in sorted(hits)))
+
+
+def _extract_matches(query, catalog, cutoff=0.83):
+    if not catalog["items"]:
         return []
 
-    normalized = {_normalize(item): item for item in candidates}
+    normalized = catalog["normalized"]
     query_norm = _normalize(query)
 
-    direct = []
-    for key, value in normalized.items():
-        if key in query_norm:
-            direct.append(value)
+    direct = _catalog_hits(catalog, query_norm)
     if direct:
         return _dedupe_keep_order(direct)
 
@@ -115,9 +293,9 @@ def _extract_matches(query, candidates, cutoff=0.83):
     for token in _tokenize(query_norm):
         if len(token) < 3:
             continue
-        matched = get_close_matches(token, list(normalized.keys()), n=1, cutoff=cutoff)
-        if matched:
-            close.append(normalized[matched[0]])
+        matched = lookup_close_key(catalog["typo_index"], token, cutoff)
+        if matched is not None:
+            close.append(normalized[matched])
     return _dedupe_keep_order(close)
 
 
@@ -135,27 +313,60 @@ def _dataset_alias_index():
     return alias_index
 
 
+@lru_cache(maxsize=1)
+def _dataset_typo_index():
+    return build_typo_index(_dataset_alias_index())
+
+
+@lru_cache(maxsize=1)
+def _keyword_automaton():
+    """One automaton over every static keyword table; payloads are (category, table position, value)."""
+    patterns = []
+    for position, (intent, keywords) in enumerate(INTENT_KEYWORDS):
+        patterns.extend((keyword, ("intent", position, intent)) for keyword in keywords)
+    for group, keywords in QUERY_MODE_KEYWORDS.items():
+        patterns.extend((keyword, ("mode", 0, group)) for keyword in keywords)
+    for position, (alias, meal) in enumerate(MEAL_ALIASES.items()):
+        patterns.append((alias, ("meal", position, meal)))
+    for position, (needle, tag) in enumerate(DIET_KEYWORDS):
+        patterns.append((needle, ("diet", position, tag)))
+    for position, (alias, canonical) in enumerate(ALLERGEN_ALIASES.items()):
+        patterns.append((alias, ("allergen_alias", position, canonical)))
+    for position, (alias, canonical) in enumerate(_dataset_alias_index().items()):
+        patterns.append((alias, ("dataset", position, canonical)))
+    return build_keyword_automaton(patterns)
+
+
+@lru_cache(maxsize=256)
+def _keyword_hits(query):
+    """Single pass over a normalized query: category -> matched values in table order."""
+    hits = set(payload for _, payload in find_keywords(_keyword_automaton(), query))
+    grouped = {}
+    for category, _, value in sorted(hits):
+        grouped.setdefault(category, []).append(value)
+    return grouped
+
+
+def _keyword_values(query, category):
+    return _keyword_hits(query).get(category, [])
+
+
 def _extract_dataset_entities(text):
     alias_index = _dataset_alias_index()
     if not alias_index:
         return []
 
     query = _normalize(text)
-    matches = []
-
-    for alias, canonical in alias_index.items():
-        if alias and alias in query:
-            matches.append(canonical)
+    matches = list(_keyword_values(query, "dataset"))
     if matches:
         return _dedupe_keep_order(matches)
 
-    alias_keys = list(alias_index.keys())
     for token in _tokenize(query):
         if len(token) < 4:
             continue
-        close = get_close_matches(token, alias_keys, n=1, cutoff=0.88)
-        if close:
-            matches.append(alias_index[close[0]])
+        close = lookup_close_key(_dataset_typo_index(), token, 0.88)
+        if close is not None:
+            matches.append(alias_index[close])
 
     return _dedupe_keep_order(matches)
 
@@ -168,30 +379,64 @@ def _dataset_by_name(dataset_name):
     return None
 
 
-def _extract_calorie_constraints(text):
-    query = _normalize(text)
-
-    range_match = re.search(r"(\d{2,4})\s*[-–]\s*(\d{2,4})\s*ккал", query)
-    if range_match:
-        low = int(range_match.group(1))
-        high = int(range_match.group(2))
+def _lex_constraints(query):
+    """First match per constraint kind, negation scope starts as (marker rank, offset) and scope end offsets."""
+    first = {}
+    negations = []
+    scope_ends = []
+    for match in CONSTRAINT_LEXER.finditer(query):
+        kind = match.lastgroup
+        if kind == "number":
+            # The old patterns matched the last 4 (range) or 2 (servings, count) digits of a longer number.
+            digits = match.group("number")
+            unit = match.group("unit")
+            if unit is None:
+                if len(digits) >= 2:
+                    first.setdefault("range", (int(digits[-4:]), int(match.group("range_high"))))
+            elif unit.startswith(SERVINGS_UNITS):
+                first.setdefault("servings", int(digits[-2:]))
+            else:
+                first.setdefault("limit_count", int(digits[-2:]))
+        elif kind == "bound":
+            marker = match.group("bound")
+            if marker in CALORIE_MAX_MARKERS:
+                first.setdefault("max", int(match.group("bound_value")))
+            elif marker in CALORIE_MIN_MARKERS:
+                first.setdefault("min", int(match.group("bound_value")))
+            elif match.group("bound_kcal") is not None:
+                first.setdefault("around", int(match.group("bound_value")))
+        elif kind == "limit_verb":
+            first.setdefault(kind, int(match.group("verb_limit")))
+        elif kind == "limit_top":
+            first.setdefault(kind, int(match.group("top_limit")))
+        elif kind == "servings_word":
+            first.setdefault(kind, SERVINGS_WORDS[match.group("servings_value")])
+        elif kind == "negation":
+            # The scope starts after the marker and the space that follows it.
+            negations.append((NEGATION_MARKERS.index(match.group("negation")), match.end() + 1))
+        elif kind == "scope_end":
+            scope_ends.append(match.start())
+        else:
+            first.setdefault(kind, True)
+    return first, negations, scope_ends
+
+
+def _calorie_constraints(first):
+    if "range" in first:
+        low, high = first["range"]
         return min(low, high), max(low, high), int((low + high) / 2)
 
-    max_match = re.search(r"(до|меньше|не более)\s*(\d{2,4})", query)
-    min_match = re.search(r"(от|больше|не менее)\s*(\d{2,4})", query)
-    around_match = re.search(r"(около|примерно|~)\s*(\d{2,4})\s*ккал", query)
-
-    max_cal = int(max_match.group(2)) if max_match else None
-    min_cal = int(min_match.group(2)) if min_match else None
-    target = int(around_match.group(2)) if around_match else None
+    max_cal = first.get("max")
+    min_cal = first.get("min")
+    target = first.get("around")
 
     if target is not None and min_cal is None and max_cal is None:
         min_cal = max(0, target - 100)
         max_cal = target + 100
 
-    if max_cal is None and "низкокал" in query:
+    if max_cal is None and "low_calorie" in first:
         max_cal = 450
-    if min_cal is None and "высококал" in query:
+    if min_cal is None and "high_calorie" in first:
         min_cal = 600
 
     if target is None and min_cal is not None and max_cal is not None:
@@ -200,126 +445,118 @@ def _extract_calorie_constraints(text):
     return min_cal, max_cal, target
 
 
-def _extract_servings(text):
-    query = _normalize(text)
+def _negative_segments(query, negations, scope_ends):
+    if not negations:
+        return ()
+    segments = []
+    for _, scope_start in sorted(negations):
+        # A scope runs up to the first sentence end or constraint word after the marker.
+        next_end = bisect_left(scope_ends, scope_start)
+        scope_end = scope_ends[next_end] if next_end < len(scope_ends) else len(query)
+        for part in LIST_SEPARATOR.split(query[scope_start:scope_end]):
+            cleaned = part.strip()
+            if len(cleaned) >= 3:
+                segments.append(cleaned)
+    return tuple(_dedupe_keep_order(segments))
+
+
+@lru_cache(maxsize=256)
+def _scan_constraints(query):
+    """Calories, servings, result limit and negation scopes of a normalized query from one lexer pass."""
+    first, negations, scope_ends = _lex_constraints(query)
+    servings = first.get("servings", first.get("servings_word"))
+    limit = first.get("limit_verb", first.get("limit_top", first.get("limit_count")))
+    return {
+        "calories": _calorie_constraints(first),
+        "servings": servings,
+        "max_results": RESULT_LIMIT_DEFAULT if limit is None else max(1, min(20, limit)),
+        "negative_segments": _negative_segments(query, negations, scope_ends),
+    }
 
-    digit_match = re.search(r"(\d{1,2})\s*(порц|чел|персон|people|servings?)", query)
-    if digit_match:
-        return int(digit_match.group(1))
 
-    word_match = re.search(r"на\s+(одного|одну|один|одной|двоих|двух|троих|трех|четверых|четырех)", query)
-    if word_match:
-        return SERVINGS_WORDS.get(word_match.group(1))
+def _extract_calorie_constraints(text):
+    return _scan_constraints(_normalize(text))["calories"]
 
-    return None
+
+def _extract_servings(text):
+    return _scan_constraints(_normalize(text))["servings"]
 
 
 def _detect_meal_type(text):
-    query = _normalize(text)
-    for key, meal in MEAL_ALIASES.items():
-        if key in query:
-            return meal
-    return None
+    meals = _keyword_values(_normalize(text), "meal")
+    return meals[0] if meals else None
 
 
 def _detect_diet_tags(text):
-    query = _normalize(text)
-    tags = []
-    pairs = [
-        ("веган", "vegan"),
-        ("вегетариан", "vegetarian"),
-        ("безглютен", "gluten_free"),
-        ("пп", "healthy"),
-        ("диет", "diet"),
-        ("без сахара", "no_sugar"),
-        ("без молока", "dairy_free"),
-        ("кето", "keto"),
-        ("белков", "high_protein"),
-    ]
-    for needle, tag in pairs:
-        if needle in query:
-            tags.append(tag)
-    return tags
+    return list(_keyword_values(_normalize(text), "diet"))
 
 
 def _extract_result_limit(text):
-    query = _normalize(text)
-
-    patterns = [
-        r"(?:покажи|дай|подбери|предложи|выведи)\s*(\d{1,2})\s*(?:рецепт|вариант|блюд)",
-        r"топ\s*(\d{1,2})",
-        r"(\d{1,2})\s*(?:рецепт|вариант|блюд)",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, query)
-        if match:
-            value = int(match.group(1))
-            return max(1, min(20, value))
-
-    return RESULT_LIMIT_DEFAULT
+    return _scan_constraints(_normalize(text))["max_results"]
 
 
 def _classify_cooking_intent(text):
-    query = _normalize(text)
+    intents = _keyword_values(_normalize(text), "intent")
+    return intents[0] if intents else "Свободный кулинарный запрос"
 
-    if "датасет" in query or "dataset" in query:
-        return "Работа с датасетами"
-    if any(token in query for token in ["похож", "аналог", "что похоже", "similar"]):
-        return "Поиск похожих рецептов"
-    if any(token in query for token in ["без ", "аллерг", "не переношу", "исключи", "убери"]):
-        return "Фильтрация по аллергенам"
-    if any(token in query for token in ["ккал", "калори", "низкокал", "высококал"]):
-        return "Фильтрация по калорийности"
-    if any(token in query for token in ["что приготовить", "посоветуй", "подбери", "напиши рецепт"]):
-        return "Рекомендация рецепта"
-    if any(token in query for token in ["рецепт", "блюдо", "ингредиент"]):
-        return "Поиск рецепта по параметрам"
-    return "Свободный кулинарный запрос"
-
-
-def _detect_query_mode(text, entities):
-    query = _normalize(text)
 
-    if any(word in query for word in ["похож", "похожие", "аналог", "что похоже", "similar"]):
+def _detect_query_mode(text, entities, pantry_ingredients=None):
+    groups = set(_keyword_values(_normalize(text), "mode"))
+
+    if "similarity" in groups:
         return "similarity_search"
 
-    if any(word in query for word in ["покажи", "список", "какие", "перечисли"]):
-        if "датасет" in query or "dataset" in query:
-            return "list_datasets"
-        if "аллерген" in query:
-            return "list_allergens"
-        if "ингредиент" in query:
-            return "list_ingredients"
-        if "рецепт" in query:
-            return "list_recipes"
-
-    if entities.get("datasets") and any(
-        word in query for word in ["что такое", "инфо", "подроб", "ссылка", "где скачать", "о датасете"]
-    ):
-        return "dataset_detail"
-    if entities.get("datasets") and any(word in query for word in ["датасет", "dataset"]):
+    if pantry_ingredients:
+        return "pantry_search"
+
+    if "listing" in groups:
+        for group, mode in [
+            ("dataset", "list_datasets"),
+            ("allergen", "list_allergens"),
+            ("ingredient", "list_ingredients"),
+            ("recipe", "list_recipes"),
+        ]:
+            if group in groups:
+                return mode
+
+    if entities.get("datasets") and groups & {"dataset_info", "dataset"}:
         return "dataset_detail"
 
-    if entities.get("recipes") and any(word in query for word in ["состав", "калор", "что в", "инфо", "подроб"]):
+    if entities.get("recipes") and "recipe_info" in groups:
         return "recipe_detail"
 
-    if entities.get("allergens") and any(word in query for word in ["что такое", "опас", "аллерген", "чем опас"]):
+    if entities.get("allergens") and "allergen_info" in groups:
         return "allergen_detail"
 
-    if entities.get("ingredients") and any(word in query for word in ["где используется", "с чем", "в каких рецептах", "из чего"]):
+    if entities.get("ingredients") and "ingredient_info" in groups:
         return "ingredient_detail"
 
-    if any(word in query for word in ["что приготовить", "подбери", "посоветуй", "рецепт", "блюдо", "приготов"]):
+    if "recommendation" in groups:
         return "recipe_recommendation"
 
-    if any(word in query for word in ["ккал", "калори"]):
+    if "nutrition" in groups:
         return "nutrition_filter"
 
     return "generic"
 
 
-@lru_cache(maxsize=1)
-def _load_spacy():
+_SPACY_LATENCY = {}
+_SPACY_LATENCY_LOCK = threading.Lock()
+_PARSE_CACHE = OrderedDict()
+_PARSE_CACHE_STATS = {"hits": 0, "misses": 0}
+_PARSE_CACHE_LOCK = threading.Lock()
+# Catalog indexes per data-source version, see get_catalog_index.
+_CATALOG_INDEXES = OrderedDict()
+_CATALOG_INDEXES_LOCK = threading.Lock()
+# Profile -> monotonic time of the last failed spaCy load under "auto".
+_SPACY_FAILED_AT = {}
+_SPACY_FAILED_AT_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=len(SPACY_PROFILES))
+def _load_spacy(profile=SPACY_DEFAULT_PROFILE):
+    if profile not in SPACY_PROFILES:
+        raise ValueError(f"Неизвестный NLP-профиль: {profile}")
     try:
         import spacy  # pylint: disable=import-outside-toplevel
     except ImportError:
@@ -328,7 +565,8 @@ def _load_spacy():
         )
 
     try:
-        return spacy.load("ru_core_news_sm"), "ru_core_news_sm"
+        # `exclude` skips loading the components at all, unlike `disable`.
+        return spacy.load(SPACY_MODEL_NAME, exclude=SPACY_PROFILES[profile]), SPACY_MODEL_NAME
     except OSError as exc:
         raise RuntimeError(
             "Модель `ru_core_news_sm` не найдена. Установите: "
@@ -336,6 +574,92 @@ def _load_spacy():
         ) from exc
 
 
+def _record_spacy_latency(profile, timings):
+    with _SPACY_LATENCY_LOCK:
+        stats = _SPACY_LATENCY.setdefault(profile, {})
+        for component, elapsed_ms in timings.items():
+            entry = stats.setdefault(component, {"calls": 0, "total_ms": 0.0})
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+
+
+def get_spacy_latency():
+    """Average per-component latency in milliseconds for every profile used so far."""
+    with _SPACY_LATENCY_LOCK:
+        return {
+            profile: {
+                component: {"calls": entry["calls"], "avg_ms": round(entry["total_ms"] / entry["calls"], 3)}
+                for component, entry in stats.items()
+            }
+            for profile, stats in _SPACY_LATENCY.items()
+        }
+
+
+@lru_cache(maxsize=1)
+def _load_morph():
+    try:
+        import pymorphy3  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise RuntimeError(
+            "pymorphy3 не установлен в текущем окружении. Установите его и перезапустите приложение."
+        )
+    return pymorphy3.MorphAnalyzer(lang="ru")
+
+
+@lru_cache(maxsize=MORPH_LEMMA_CACHE_SIZE)
+def _morph_lemma(token):
+    return _load_morph().parse(token)[0].normal_form
+
+
+def _configured_engine():
+    return os.environ.get(NLP_ENGINE_ENV, "").strip().lower() or NLP_DEFAULT_ENGINE
+
+
+def get_default_engine():
+    """Engine used when the caller passes none: $NLP_ENGINE if set, NLP_DEFAULT_ENGINE otherwise."""
+    engine = _configured_engine()
+    if engine not in NLP_ENGINES:
+        raise ValueError(f"Неизвестный NLP-движок в {NLP_ENGINE_ENV}: {engine}")
+    return engine
+
+
+def _resolve_engine(engine, profile):
+    engine = engine or get_default_engine()
+    if engine not in NLP_ENGINES:
+        raise ValueError(f"Неизвестный NLP-движок: {engine}")
+    if engine != "auto":
+        return engine
+    # A loaded model is cached by _load_spacy; a failure is not cached for good, so a model installed
+    # while the app runs is picked up within NLP_ENGINE_RETRY_SECONDS.
+    with _SPACY_FAILED_AT_LOCK:
+        failed_at = _SPACY_FAILED_AT.get(profile)
+    if failed_at is not None and time.monotonic() - failed_at < NLP_ENGINE_RETRY_SECONDS:
+        return "pymorphy3"
+    try:
+        _load_spacy(profile)
+    except RuntimeError:
+        with _SPACY_FAILED_AT_LOCK:
+            _SPACY_FAILED_AT[profile] = time.monotonic()
+        return "pymorphy3"
+    with _SPACY_FAILED_AT_LOCK:
+        _SPACY_FAILED_AT.pop(profile, None)
+    return "spacy"
+
+
+def _run_spacy_pipeline(nlp, text, profile):
+    # Same as nlp(text), but every component is timed separately.
+    timings = {}
+    started = time.perf_counter()
+    doc = nlp.make_doc(text)
+    timings["tokenizer"] = (time.perf_counter() - started) * 1000.0
+    for name, component in nlp.pipeline:
+        started = time.perf_counter()
+        doc = component(doc)
+        timings[name] = (time.perf_counter() - started) * 1000.0
+    _record_spacy_latency(profile, timings)
+    return doc, {name: round(elapsed_ms, 3) for name, elapsed_ms in timings.items()}
+
+
 def get_spacy_status():
     spacy_installed = importlib.util.find_spec("spacy") is not None
     ru_model = importlib.util.find_spec("ru_core_news_sm") is not None
@@ -347,6 +671,12 @@ def get_spacy_status():
         "models": {
             "ru_core_news_sm": ru_model,
         },
+        "pymorphy_installed": importlib.util.find_spec("pymorphy3") is not None,
+        "default_engine": _configured_engine(),
+        "default_profile": SPACY_DEFAULT_PROFILE,
+        "profiles": {profile: {"excluded": excluded} for profile, excluded in SPACY_PROFILES.items()},
+        "latency_ms": get_spacy_latency(),
+        "parse_cache": get_parse_cache_stats(),
         "python_executable": sys.executable,
     }
 
@@ -359,18 +689,72 @@ def warmup_spacy_model():
         return {"ok": False, "error": str(exc)}
 
 
-def _graph_catalogs(data_source):
+def catalog_version(data_source):
+    """Version stamp of a graph data source.
+
+    Graphs that change in place should bump `graph["version"]`; without it the stamp falls back to
+    the object identity and node count.
+    """
+    if data_source is None or not hasattr(data_source, "nodes"):
+        return None
+    graph_attrs = getattr(data_source, "graph", None)
+    version = graph_attrs.get("version") if isinstance(graph_attrs, dict) else None
+    return id(data_source), version, len(data_source.nodes)
+
+
+def _build_catalog_index(data_source, version):
+    partitions = {node_type: [] for node_type in CATALOG_NODE_TYPES}
+    aliases = {node_type: [] for node_type in CATALOG_NODE_TYPES}
+    nodes = data_source.nodes if data_source is not None else {}
+    # One pass over the graph for all node types.
+    for node in nodes:
+        attributes = nodes[node]
+        items = partitions.get(attributes.get("type"))
+        if items is None:
+            continue
+        items.append(node)
+        aliases[attributes["type"]].extend((alias, node) for alias in attributes.get("aliases", ()))
+    return {
+        "version": version,
+        "node_count": len(nodes),
+        "partitions": partitions,
+        "catalogs": {
+            node_type: _compile_catalog(items, aliases[node_type]) for node_type, items in partitions.items()
+        },
+    }
+
+
+@lru_cache(maxsize=1)
+def _empty_catalog_index():
+    return _build_catalog_index(None, None)
+
+
+def get_catalog_index(data_source):
+    """Node-type partitions of a graph data source with pre-normalized keys and matchers.
+
+    Built once per graph version (see catalog_version) and shared by every request against it.
+    """
     if data_source is None or not hasattr(data_source, "nodes"):
-        return [], [], []
+        return _empty_catalog_index()
 
-    ingredients = [
-        node for node in data_source.nodes if data_source.nodes[node].get("type") == "ingredient"
-    ]
-    allergens = [
-        node for node in data_source.nodes if data_source.nodes[node].get("type") == "allergen"
-    ]
-    recipes = [node for node in data_source.nodes if data_source.nodes[node].get("type") == "recipe"]
-    return ingredients, allergens, recipes
+    version = catalog_version(data_source)
+    with _CATALOG_INDEXES_LOCK:
+        cached = _CATALOG_INDEXES.get(version)
+    # The version embeds id(data_source); the weak reference guards against a reused id.
+    if cached is not None and cached[0]() is data_source:
+        return cached[1]
+
+    index = _build_catalog_index(data_source, version)
+    with _CATALOG_INDEXES_LOCK:
+        _CATALOG_INDEXES[version] = (weakref.ref(data_source), index)
+        while len(_CATALOG_INDEXES) > CATALOG_INDEX_CACHE_SIZE:
+            _CATALOG_INDEXES.popitem(last=False)
+    return index
+
+
+def _graph_catalogs(data_source):
+    catalogs = get_catalog_index(data_source)["catalogs"]
+    return tuple(catalogs[node_type] for node_type in CATALOG_NODE_TYPES)
 
 
 def _extract_graph_entities(text, ingredients, allergens, recipes):
@@ -381,10 +765,14 @@ def _extract_graph_entities(text, ingredients, allergens, recipes):
     }
 
 
-def _extract_with_spacy(text):
-    nlp, model_name = _load_spacy()
+def _extract_with_spacy(text, profile=SPACY_DEFAULT_PROFILE):
+    nlp, model_name = _load_spacy(profile)
+
+    doc, timings = _run_spacy_pipeline(nlp, text, profile)
+    return _spacy_doc_result(doc, model_name, profile, timings)
 
-    doc = nlp(text)
+
+def _spacy_doc_result(doc, model_name, profile, timings):
     lemmas = []
     named_entities = []
 
@@ -403,50 +791,97 @@ def _extract_with_spacy(text):
     lemma_counter = Counter(lemmas)
     return {
         "engine": f"spacy:{model_name}",
+        "profile": profile,
         "lemmas": [lemma for lemma, _ in lemma_counter.most_common(15)],
         "named_entities": _dedupe_keep_order(named_entities),
+        "timings_ms": timings,
     }
 
 
+def _extract_with_pymorphy(text):
+    # Alphabetic runs only, like token.is_alpha in the spaCy engine; no NER in this engine.
+    started = time.perf_counter()
+    tokens = re.findall(r"[^\W\d_]+", text)
+    tokenized = time.perf_counter()
+    lemmas = [lemma for lemma in (_morph_lemma(token.lower()) for token in tokens) if len(lemma) >= 3]
+    timings = {
+        "tokenizer": (tokenized - started) * 1000.0,
+        "lemmatizer": (time.perf_counter() - tokenized) * 1000.0,
+    }
+    _record_spacy_latency("pymorphy3", timings)
+    return {
+        "engine": "pymorphy3",
+        "profile": None,
+        "lemmas": [lemma for lemma, _ in Counter(lemmas).most_common(15)],
+        "named_entities": [],
+        "timings_ms": {name: round(elapsed_ms, 3) for name, elapsed_ms in timings.items()},
+    }
+
+
+def _extract_lemmas(text, profile, engine):
+    if _resolve_engine(engine, profile) == "pymorphy3":
+        return _extract_with_pymorphy(text)
+    return _extract_with_spacy(text, profile)
+
+
 def _extract_negative_segments(text):
-    query = _normalize(text)
-    markers = ["без ", "кроме ", "исключи ", "убери ", "не добавляй "]
-    segments = []
+    return list(_scan_constraints(_normalize(text))["negative_segments"])
+
 
-    for marker in markers:
-        start = 0
-        while True:
-            idx = query.find(marker, start)
-            if idx == -1:
+def _pantry_marker_match(query):
+    """Earliest pantry marker in the query (the longest one on ties), as (start, marker)."""
+    matches = []
+    for marker in PANTRY_MARKERS:
+        idx = query.find(marker)
+        while idx != -1:
+            end = idx + len(marker)
+            if (idx == 0 or not query[idx - 1].isalnum()) and not query[end : end + 1].isalnum():
+                matches.append((idx, -len(marker), marker))
                 break
-            fragment = query[idx + len(marker) :]
-            for delimiter in [".", "?", "!", " на ", " до ", " от ", " для "]:
-                cut_idx = fragment.find(delimiter)
-                if cut_idx != -1:
-                    fragment = fragment[:cut_idx]
-            parts = re.split(r",| и |/|;", fragment)
-            for part in parts:
-                cleaned = part.strip()
-                if len(cleaned) >= 3:
-                    segments.append(cleaned)
-            start = idx + len(marker)
+            idx = query.find(marker, idx + 1)
+    if not matches:
+        return None
+    idx, _, marker = min(matches)
+    return idx, marker
+
+
+def _extract_pantry_ingredients(text):
+    query = _normalize(text)
+    match = _pantry_marker_match(query)
+    if match is None:
+        return []
+
+    idx, marker = match
+    fragment = query[idx + len(marker) :]
+    for delimiter in [".", "?", "!", " без ", " кроме ", " на ", " до ", " для ", " что "]:
+        cut_idx = fragment.find(delimiter)
+        if cut_idx != -1:
+            fragment = fragment[:cut_idx]
+
+    items = []
+    for part in LIST_SEPARATOR.split(fragment):
+        words = part.strip(" :-").split()
+        while words and words[0] in PANTRY_FILLER_WORDS:
+            words.pop(0)
+        cleaned = " ".join(words)
+        if len(cleaned) < 3 or f"{cleaned} ".startswith(PANTRY_NON_INGREDIENT_STEMS):
+            continue
+        items.append(cleaned)
 
-    return _dedupe_keep_order(segments)
+    return _dedupe_keep_order(items)
 
 
 def _resolve_allergen_aliases(text, allergen_catalog):
-    if not allergen_catalog:
+    if not allergen_catalog["items"]:
         return []
 
-    normalized_catalog = {_normalize(item): item for item in allergen_catalog}
-    query = _normalize(text)
+    normalized_catalog = allergen_catalog["normalized"]
     resolved = []
 
-    for alias, canonical in ALLERGEN_ALIASES.items():
-        if alias in query:
-            canonical_key = _normalize(canonical)
-            if canonical_key in normalized_catalog:
-                resolved.append(normalized_catalog[canonical_key])
+    for canonical in _keyword_values(_normalize(text), "allergen_alias"):
+        canonical_key = _normalize(canonical)
+        if canonical_key in normalized_catalog:
+            resolved.append(normalized_catalog[canonical_key])
     return _dedupe_keep_order(resolved)
 
 
@@ -463,42 +898,44 @@ def _extract_negative_entities(text, ingredients, allergens):
     return _dedupe_keep_order(excluded_ingredients), _dedupe_keep_order(excluded_allergens)
 
 
-def analyze_cooking_request(text, data_source=None):
-    text = str(text or "").strip()
-    if not text:
-        return {
-            "engine": "none",
-            "query_mode": "generic",
-            "intent": "Пустой запрос",
-            "entities": {"ingredients": [], "allergens": [], "recipes": [], "datasets": []},
-            "filters": {
-                "include_ingredients": [],
-                "exclude_ingredients": [],
-                "exclude_allergens": [],
-                "max_results": RESULT_LIMIT_DEFAULT,
-            },
-            "constraints": {
-                "min_calories": None,
-                "max_calories": None,
-                "target_calories": None,
-                "servings": None,
-            },
-            "meal_type": None,
-            "diet_tags": [],
-            "lemmas": [],
-            "named_entities": [],
-            "warnings": [],
-        }
+def _empty_analysis(profile):
+    return {
+        "engine": "none",
+        "query_mode": "generic",
+        "intent": "Пустой запрос",
+        "entities": {"ingredients": [], "allergens": [], "recipes": [], "datasets": []},
+        "filters": {
+            "include_ingredients": [],
+            "exclude_ingredients": [],
+            "exclude_allergens": [],
+            "pantry_ingredients": [],
+            "max_results": RESULT_LIMIT_DEFAULT,
+        },
+        "constraints": {
+            "min_calories": None,
+            "max_calories": None,
+            "target_calories": None,
+            "servings": None,
+        },
+        "meal_type": None,
+        "diet_tags": [],
+        "lemmas": [],
+        "named_entities": [],
+        "nlp_profile": profile,
+        "nlp_timings_ms": {},
+        "warnings": [],
+    }
 
-    spacy_result = _extract_with_spacy(text)
 
-    min_cal, max_cal, target_cal = _extract_calorie_constraints(text)
-    servings = _extract_servings(text)
+def _analysis_from_spacy(text, spacy_result, catalogs):
+    constraints = _scan_constraints(_normalize(text))
+    min_cal, max_cal, target_cal = constraints["calories"]
+    servings = constraints["servings"]
     meal_type = _detect_meal_type(text)
     diet_tags = _detect_diet_tags(text)
-    result_limit = _extract_result_limit(text)
+    result_limit = constraints["max_results"]
 
-    ingredients_catalog, allergens_catalog, recipes_catalog = _graph_catalogs(data_source)
+    ingredients_catalog, allergens_catalog, recipes_catalog = catalogs
 
     search_text = text
     if spacy_result["lemmas"]:
@@ -511,6 +948,7 @@ def analyze_cooking_request(text, data_source=None):
     excluded_ingredients, excluded_allergens = _extract_negative_entities(
         text, ingredients_catalog, allergens_catalog
     )
+    pantry_ingredients = _extract_pantry_ingredients(text)
 
     positive_ingredients = [
         item for item in mentioned_entities.get("ingredients", []) if item not in excluded_ingredients
@@ -526,7 +964,7 @@ def analyze_cooking_request(text, data_source=None):
         "datasets": dataset_entities,
     }
 
-    query_mode = _detect_query_mode(text, entities)
+    query_mode = _detect_query_mode(text, entities, pantry_ingredients)
     intent = _classify_cooking_intent(text)
 
     warnings = []
@@ -546,6 +984,7 @@ def analyze_cooking_request(text, data_source=None):
             "include_ingredients": positive_ingredients,
             "exclude_ingredients": excluded_ingredients,
             "exclude_allergens": excluded_allergens,
+            "pantry_ingredients": pantry_ingredients,
             "max_results": result_limit,
         },
         "constraints": {
@@ -558,10 +997,103 @@ def analyze_cooking_request(text, data_source=None):
         "diet_tags": diet_tags,
         "lemmas": spacy_result["lemmas"],
         "named_entities": spacy_result["named_entities"],
+        "nlp_profile": spacy_result["profile"],
+        "nlp_timings_ms": spacy_result["timings_ms"],
         "warnings": warnings,
     }
 
 
+def analyze_cooking_request(text, data_source=None, profile=SPACY_DEFAULT_PROFILE, engine=None):
+    """Parse a cooking request.
+
+    `profile` picks the spaCy components (see SPACY_PROFILES); `engine` is one of NLP_ENGINES,
+    get_default_engine() when omitted.
+    """
+    text = str(text or "").strip()
+    if not text:
+        return _empty_analysis(profile)
+
+    spacy_result = _extract_lemmas(text, profile, engine)
+    return _analysis_from_spacy(text, spacy_result, _graph_catalogs(data_source))
+
+
+def analyze_cooking_requests(
+    texts,
+    data_source=None,
+    profile=SPACY_DEFAULT_PROFILE,
+    batch_size=SPACY_BATCH_SIZE,
+    n_process=1,
+    engine=None,
+):
+    """Batch version of analyze_cooking_request: one dict per text, in input order.
+
+    Texts go through `nlp.pipe`, so the model runs on whole batches instead of one doc at a time;
+    `n_process > 1` forks worker processes and only pays off on large logs (thousands of texts).
+    Per-component timings are not available inside `pipe`, so `nlp_timings_ms` holds the batch
+    time split evenly per doc under "pipe".
+    """
+    texts = [str(text or "").strip() for text in texts]
+    results = [None if text else _empty_analysis(profile) for text in texts]
+    positions = [index for index, text in enumerate(texts) if text]
+    if not positions:
+        return results
+
+    catalogs = _graph_catalogs(data_source)
+    if _resolve_engine(engine, profile) == "pymorphy3":
+        # Lemmas are memoized per token, so a plain loop is already the fast path here.
+        for index in positions:
+            results[index] = _analysis_from_spacy(texts[index], _extract_with_pymorphy(texts[index]), catalogs)
+        return results
+
+    nlp, model_name = _load_spacy(profile)
+    started = time.perf_counter()
+    docs = list(nlp.pipe((texts[index] for index in positions), batch_size=batch_size, n_process=n_process))
+    per_doc_ms = (time.perf_counter() - started) * 1000.0 / len(docs)
+    for index, doc in zip(positions, docs):
+        _record_spacy_latency(profile, {"pipe": per_doc_ms})
+        spacy_result = _spacy_doc_result(doc, model_name, profile, {"pipe": round(per_doc_ms, 3)})
+        results[index] = _analysis_from_spacy(texts[index], spacy_result, catalogs)
+    return results
+
+
+def parse_cooking_request(text, data_source=None, profile=SPACY_DEFAULT_PROFILE, engine=None):
+    """analyze_cooking_request behind a bounded LRU cache with a TTL.
+
+    Keyed by whitespace-normalized text, profile, engine and data-source version; every caller gets
+    its own copy, so mutating the result never leaks into the cache.
+    """
+    text = " ".join(str(text or "").split())
+    engine = engine or get_default_engine()
+    key = (text, profile, engine, catalog_version(data_source))
+    now = time.monotonic()
+    with _PARSE_CACHE_LOCK:
+        entry = _PARSE_CACHE.get(key)
+        if entry is not None and now - entry[0] < PARSE_CACHE_TTL_SECONDS:
+            _PARSE_CACHE.move_to_end(key)
+            _PARSE_CACHE_STATS["hits"] += 1
+            return copy.deepcopy(entry[1])
+        _PARSE_CACHE_STATS["misses"] += 1
+
+    result = analyze_cooking_request(text, data_source, profile, engine)
+    with _PARSE_CACHE_LOCK:
+        _PARSE_CACHE[key] = (now, result)
+        _PARSE_CACHE.move_to_end(key)
+        while len(_PARSE_CACHE) > PARSE_CACHE_SIZE:
+            _PARSE_CACHE.popitem(last=False)
+    return copy.deepcopy(result)
+
+
+def get_parse_cache_stats():
+    with _PARSE_CACHE_LOCK:
+        return {"size": len(_PARSE_CACHE), "max_size": PARSE_CACHE_SIZE, **_PARSE_CACHE_STATS}
+
+
+def clear_parse_cache():
+    with _PARSE_CACHE_LOCK:
+        _PARSE_CACHE.clear()
+        _PARSE_CACHE_STATS.update(hits=0, misses=0)
+
+
 def _line(title, values):
     if values:
         return f"- {title}: {', '.join(values)}"
@@ -587,6 +1119,7 @@ def analyze_text_message(text, data_source=None):
         "Извлеченные фильтры:",
         _line("Исключить ингредиенты", filters.get("exclude_ingredients", [])),
         _line("Исключить аллергены", filters.get("exclude_allergens", [])),
+        _line("Есть в наличии", filters.get("pantry_ingredients", [])),
         f"- Максимум результатов: {filters.get('max_results', RESULT_LIMIT_DEFAULT)}",
         "",
         "Ограничения и параметры:",
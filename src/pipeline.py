@@ -1,20 +1,24 @@
 try:
-    from .nlp import analyze_cooking_request, get_known_datasets
+    from .nlp import get_known_datasets, parse_cooking_request
     from .recommender import (
         get_recipenlg_preview,
+        ingredient_substitutes,
         join_items,
         localize_recipenlg_item,
         rank_recipenlg_candidates,
+        rank_recipenlg_pantry,
         recipenlg_ready,
     )
     from .vision import analyze_food_photo
 except ImportError:
-    from nlp import analyze_cooking_request, get_known_datasets
+    from nlp import get_known_datasets, parse_cooking_request
     from recommender import (
         get_recipenlg_preview,
+        ingredient_substitutes,
         join_items,
         localize_recipenlg_item,
         rank_recipenlg_candidates,
+        rank_recipenlg_pantry,
         recipenlg_ready,
     )
     from vision import analyze_food_photo
@@ -90,6 +94,69 @@ def _format_dataset_similarity_response(query_text, ranked, debug=False):
     return "\n".join(lines)
 
 
+def _format_dataset_pantry_response(pantry_ingredients, ranked, debug=False):
+    lines = [f"Рецепты из RecipeNLG из того, что есть ({', '.join(pantry_ingredients)}):"]
+    for idx, item in enumerate(ranked, start=1):
+        if debug:
+            lines.append(f"{idx}. {item['title_ru']} (coverage: {item['pantry_coverage']}) - {item['match_reason']}")
+        else:
+            lines.append(f"{idx}. {item['title_ru']} - {item['match_reason']}")
+    return "\n".join(lines)
+
+
+def run_pantry_pipeline(pantry_ingredients, exclude_ingredients=None, exclude_titles=None, limit=8, debug=False):
+    pantry_ingredients = [str(item).strip() for item in pantry_ingredients or [] if str(item).strip()]
+    exclude_ingredients = exclude_ingredients or []
+    ranked = []
+    if pantry_ingredients and recipenlg_ready():
+        ranked = rank_recipenlg_pantry(
+            pantry_ingredients,
+            exclude_ingredients=exclude_ingredients,
+            exclude_titles=exclude_titles,
+            limit=limit,
+        )
+    if ranked:
+        response = _format_dataset_pantry_response(pantry_ingredients, ranked, debug=debug)
+    else:
+        response = (
+            "Не нашел рецептов в RecipeNLG из этих продуктов. "
+            "Попробуйте перечислить ингредиенты через запятую."
+        )
+    return {
+        "handled": True,
+        "response": response,
+        "stages": {
+            "rules": {
+                "pantry_ingredients": pantry_ingredients,
+                "exclude_ingredients": exclude_ingredients,
+                "candidate_count_after": len(ranked),
+            },
+            "decision": {
+                "mode": "pantry_search",
+                "strategy": "recipenlg_pantry_containment",
+                "ranked": ranked,
+            },
+        },
+    }
+
+
+def _substitution_suggestions(exclude_ingredients):
+    suggestions = {}
+    for entry in exclude_ingredients:
+        substitutes = ingredient_substitutes(entry)
+        if substitutes:
+            suggestions[entry] = substitutes
+    return suggestions
+
+
+def _format_substitution_suggestions(suggestions):
+    lines = [
+        f"Чем заменить {entry}: {', '.join(item['ingredient_ru'] for item in substitutes)}."
+        for entry, substitutes in suggestions.items()
+    ]
+    return "\n".join(lines)
+
+
 def _format_dataset_recipe_response(item, debug=False):
     localized = localize_recipenlg_item(item, with_details=True)
     ingredients_text = localized.get("ingredients_ru_text", "нет данных")
@@ -121,12 +188,14 @@ def _format_dataset_preview_response():
     return "\n".join(lines)
 
 
-def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
+def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None, parsed=None):
+    """`parsed` is the caller's analysis of this same text, so a chat turn is parsed only once."""
     text = str(text or "").strip()
     if not text:
         return {"handled": False, "response": None, "stages": {}}
 
-    parsed = analyze_cooking_request(text, data_source)
+    if parsed is None:
+        parsed = parse_cooking_request(text, data_source)
     mode = parsed.get("query_mode", "generic")
     entities = parsed.get("entities", {})
     filters = parsed.get("filters", {})
@@ -158,6 +227,17 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
             "stages": {"input": text, "nlp": parsed, "rules": {}, "decision": {"mode": mode}},
         }
 
+    if mode == "pantry_search" and filters.get("pantry_ingredients"):
+        result = run_pantry_pipeline(
+            filters["pantry_ingredients"],
+            exclude_ingredients=exclude_ingredients,
+            exclude_titles=exclude_titles,
+            limit=limit,
+            debug=debug,
+        )
+        result["stages"] = {"input": text, "nlp": parsed, **result["stages"]}
+        return result
+
     if mode == "list_recipes" and min_cal is None and max_cal is None and not include_ingredients:
         response = _format_dataset_preview_response()
         return {
@@ -175,9 +255,11 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
                 exclude_titles=exclude_titles,
                 meal_type=meal_type,
                 limit=limit,
+                similar_to_seed=True,
             )
             if dataset_ranked:
                 response = _format_dataset_similarity_response(text, dataset_ranked, debug=debug)
+                seed = next((item for item in dataset_ranked if item.get("neighbor_seed")), None)
                 return {
                     "handled": True,
                     "response": response,
@@ -190,8 +272,12 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
                         },
                         "decision": {
                             "mode": "similarity_search",
-                            "seed_recipe": None,
                             "strategy": "recipenlg_cosine_fuzzy",
+                            # "neighbors" when the query named a recipe with precomputed neighbours, else "query".
+                            "similarity_source": (
+                                "neighbors" if any("neighbor_score" in item for item in dataset_ranked) else "query"
+                            ),
+                            "seed_recipe": seed["title"] if seed else None,
                             "ranked": dataset_ranked,
                         },
                     },
@@ -216,6 +302,7 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
     )
 
     if wants_recommendation and recipenlg_ready():
+        substitutions = _substitution_suggestions(exclude_ingredients)
         dataset_ranked = rank_recipenlg_candidates(
             text,
             include_ingredients=include_ingredients,
@@ -231,6 +318,8 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
                 if wants_list
                 else _format_dataset_recipe_response(dataset_ranked[0], debug=debug)
             )
+            if substitutions:
+                response += "\n\n" + _format_substitution_suggestions(substitutions)
             return {
                 "handled": True,
                 "response": response,
@@ -243,6 +332,7 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
                         "include_ingredients": include_ingredients,
                         "exclude_ingredients": exclude_ingredients,
                         "exclude_allergens": exclude_allergens,
+                        "substitutions": substitutions,
                         "meal_type": meal_type,
                         "min_calories": min_cal,
                         "max_calories": max_cal,
@@ -254,16 +344,19 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
                     },
                 },
             }
+        response = _build_no_results_message(
+            meal_type,
+            include_ingredients,
+            exclude_ingredients,
+            exclude_allergens,
+            min_cal,
+            max_cal,
+        )
+        if substitutions:
+            response += "\n\n" + _format_substitution_suggestions(substitutions)
         return {
             "handled": True,
-            "response": _build_no_results_message(
-                meal_type,
-                include_ingredients,
-                exclude_ingredients,
-                exclude_allergens,
-                min_cal,
-                max_cal,
-            ),
+            "response": response,
             "stages": {
                 "input": text,
                 "nlp": parsed,
@@ -271,6 +364,7 @@ def run_text_pipeline(text, data_source=None, debug=False, exclude_titles=None):
                     "include_ingredients": include_ingredients,
                     "exclude_ingredients": exclude_ingredients,
                     "exclude_allergens": exclude_allergens,
+                    "substitutions": substitutions,
                     "meal_type": meal_type,
                     "min_calories": min_cal,
                     "max_calories": max_cal,
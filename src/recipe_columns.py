@@ -0,0 +1,152 @@
+from array import array
+from functools import lru_cache
+import json
+import os
+from pathlib import Path
+import shutil
+import time
+
+import numpy as np
+
+
+COLUMN_SNAPSHOT_FORMAT = "1"
+COLUMN_SNAPSHOT_WRITE_BUFFER = 1 << 20
+COLUMN_SNAPSHOT_READ_BLOCK = 4096
+
+
+def _column_file_name(column):
+    # CSV headers are free text; keep file names to a safe alphabet.
+    return "".join(char if char.isalnum() else "_" for char in column.lower()) or "column"
+
+
+def write_column_snapshot(target_dir, rows, columns, metadata):
+    """Store rows as one UTF-8 heap per column plus offset/length arrays, then swap the directory in.
+
+    `rows` yields (row, source_end_offset); a None row is kept as an invalid record so row numbers
+    stay aligned with the source file.
+    """
+    target_dir = Path(target_dir)
+    temp_dir = target_dir.with_name(f"{target_dir.name}.tmp")
+    old_dir = target_dir.with_name(f"{target_dir.name}.old")
+    for path in [temp_dir, old_dir]:
+        shutil.rmtree(path, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+
+    file_names = {column: _column_file_name(column) for column in columns}
+    heaps = {
+        column: open(temp_dir / f"{file_names[column]}.heap", "wb", buffering=COLUMN_SNAPSHOT_WRITE_BUFFER)
+        for column in columns
+    }
+    heap_sizes = {column: 0 for column in columns}
+    offsets = {column: array("q") for column in columns}
+    lengths = {column: array("i") for column in columns}
+    end_offsets = array("q")
+    valid = array("B")
+    try:
+        for row, end_offset in rows:
+            end_offsets.append(end_offset)
+            valid.append(row is not None)
+            for column in columns:
+                data = str((row or {}).get(column) or "").encode("utf-8")
+                heaps[column].write(data)
+                offsets[column].append(heap_sizes[column])
+                lengths[column].append(len(data))
+                heap_sizes[column] += len(data)
+    finally:
+        for heap in heaps.values():
+            heap.close()
+
+    for column in columns:
+        np.save(temp_dir / f"{file_names[column]}.offsets.npy", np.frombuffer(offsets[column], dtype=np.int64))
+        np.save(temp_dir / f"{file_names[column]}.lengths.npy", np.frombuffer(lengths[column], dtype=np.int32))
+    np.save(temp_dir / "source_end_offsets.npy", np.frombuffer(end_offsets, dtype=np.int64))
+    np.save(temp_dir / "valid.npy", np.frombuffer(valid, dtype=np.uint8))
+    metadata = dict(
+        metadata,
+        format=COLUMN_SNAPSHOT_FORMAT,
+        columns=file_names,
+        row_count=len(end_offsets),
+        valid_row_count=int(sum(valid)),
+        built_at=str(int(time.time())),
+    )
+    (temp_dir / "meta.json").write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if target_dir.exists():
+        os.replace(target_dir, old_dir)
+    os.replace(temp_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return {"path": str(target_dir), **metadata}
+
+
+def read_column_snapshot_metadata(snapshot_dir):
+    try:
+        metadata = json.loads((Path(snapshot_dir) / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return metadata if metadata.get("format") == COLUMN_SNAPSHOT_FORMAT else {}
+
+
+def _map_heap(path):
+    # np.memmap refuses empty files, and an empty column has nothing to map anyway.
+    if path.stat().st_size == 0:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+@lru_cache(maxsize=2)
+def open_column_snapshot(snapshot_dir, built_at):
+    """Memory-mapped view of a snapshot; `built_at` keys the cache so a rebuilt snapshot is reopened."""
+    snapshot_dir = Path(snapshot_dir)
+    metadata = read_column_snapshot_metadata(snapshot_dir)
+    columns = {}
+    for column, file_name in metadata.get("columns", {}).items():
+        columns[column] = {
+            "offsets": np.load(snapshot_dir / f"{file_name}.offsets.npy", mmap_mode="r"),
+            "lengths": np.load(snapshot_dir / f"{file_name}.lengths.npy", mmap_mode="r"),
+            "heap": _map_heap(snapshot_dir / f"{file_name}.heap"),
+        }
+    return {
+        "metadata": metadata,
+        "row_count": int(metadata.get("row_count", 0)),
+        "valid_row_count": int(metadata.get("valid_row_count", 0)),
+        "source_end_offsets": np.load(snapshot_dir / "source_end_offsets.npy", mmap_mode="r"),
+        "valid": np.load(snapshot_dir / "valid.npy", mmap_mode="r"),
+        "columns": columns,
+    }
+
+
+def column_value(snapshot, column, row):
+    data = snapshot["columns"][column]
+    offset = int(data["offsets"][row])
+    return data["heap"][offset : offset + int(data["lengths"][row])].tobytes().decode("utf-8")
+
+
+def _column_block(data, start, stop):
+    offsets = data["offsets"][start:stop].tolist()
+    lengths = data["lengths"][start:stop].tolist()
+    if not offsets:
+        return []
+    base = offsets[0]
+    # One copy of the block's heap range, then plain bytes slicing per value.
+    block = data["heap"][base : offsets[-1] + lengths[-1]].tobytes()
+    return [block[offset - base : offset - base + length].decode("utf-8") for offset, length in zip(offsets, lengths)]
+
+
+def iter_snapshot_rows(snapshot, columns, start=0, stop=None):
+    """Yield (row, source_end_offset) like a CSV reader would; invalid records come back as None."""
+    stop = snapshot["row_count"] if stop is None else min(stop, snapshot["row_count"])
+    for block_start in range(start, stop, COLUMN_SNAPSHOT_READ_BLOCK):
+        block_stop = min(block_start + COLUMN_SNAPSHOT_READ_BLOCK, stop)
+        values = [_column_block(snapshot["columns"][column], block_start, block_stop) for column in columns]
+        valid = snapshot["valid"][block_start:block_stop].tolist()
+        end_offsets = snapshot["source_end_offsets"][block_start:block_stop].tolist()
+        for position, end_offset in enumerate(end_offsets):
+            if not valid[position]:
+                yield None, end_offset
+                continue
+            yield {column: column_values[position] for column, column_values in zip(columns, values)}, end_offset
+
+
+def snapshot_row_for_offset(snapshot, source_offset):
+    """Index of the first record that ends after `source_offset` (a resume point in the source file)."""
+    return int(np.searchsorted(snapshot["source_end_offsets"], source_offset, side="right"))
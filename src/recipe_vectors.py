@@ -0,0 +1,716 @@
+from contextlib import closing
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+try:
+    from .knowledge_graph import GRAPH_NODE_TYPES
+    from .recommender import (
+        DATASET_TOKEN_ALIASES,
+        RECIPE_NLG_ANN_DIMENSIONS,
+        RECIPE_NLG_ANN_HASH_BITS,
+        RECIPE_NLG_ANN_TABLE_BITS,
+        RECIPE_NLG_ANN_TABLES,
+        STOP_TOKENS,
+        get_search_index_status,
+        iter_indexed_recipes,
+        recipe_feature_ids,
+        recipe_feature_signs,
+        recipe_ingredient_names,
+        recipe_vector_bucket_codes,
+        recipe_vector_terms,
+        recipenlg_ann_path,
+        recipenlg_embeddings_path,
+        recipenlg_graph_path,
+        recipenlg_neighbors_path,
+        recipenlg_substitutions_path,
+        tokenize,
+    )
+except ImportError:
+    from knowledge_graph import GRAPH_NODE_TYPES
+    from recommender import (
+        DATASET_TOKEN_ALIASES,
+        RECIPE_NLG_ANN_DIMENSIONS,
+        RECIPE_NLG_ANN_HASH_BITS,
+        RECIPE_NLG_ANN_TABLE_BITS,
+        RECIPE_NLG_ANN_TABLES,
+        STOP_TOKENS,
+        get_search_index_status,
+        iter_indexed_recipes,
+        recipe_feature_ids,
+        recipe_feature_signs,
+        recipe_ingredient_names,
+        recipe_vector_bucket_codes,
+        recipe_vector_terms,
+        recipenlg_ann_path,
+        recipenlg_embeddings_path,
+        recipenlg_graph_path,
+        recipenlg_neighbors_path,
+        recipenlg_substitutions_path,
+        tokenize,
+    )
+
+
+RECIPE_NEIGHBORS_TOP_K = 50
+# Candidate neighbours come from the postings of a recipe's rarest terms; long postings are truncated.
+RECIPE_NEIGHBORS_PROBE_TERMS = 4
+RECIPE_NEIGHBORS_MAX_POSTINGS = 2000
+RECIPE_NEIGHBORS_WRITE_BATCH = 20000
+RECIPE_ANN_BUILD_CHUNK = 100000
+RECIPE_EMBEDDING_DIMENSIONS = 64
+RECIPE_EMBEDDING_OVERSAMPLE = 10
+RECIPE_EMBEDDING_POWER_ITERATIONS = 2
+RECIPE_EMBEDDING_MIN_DF = 2
+RECIPE_EMBEDDING_SEED = 20240923
+# Substitutions are mined among the most frequent ingredients only; the PMI matrix is dense over that vocabulary.
+RECIPE_SUBSTITUTION_VOCAB = 2000
+RECIPE_SUBSTITUTION_MIN_DF = 5
+RECIPE_SUBSTITUTION_MIN_PAIR = 3
+RECIPE_SUBSTITUTION_TOP_K = 10
+RECIPE_GRAPH_MAX_INGREDIENTS = 3000
+RECIPE_GRAPH_MAX_RECIPES = 2000
+RECIPE_GRAPH_MIN_DF = 5
+RECIPE_GRAPH_MIN_TITLE_COUNT = 2
+RECIPE_GRAPH_MIN_INGREDIENT_SHARE = 0.3
+RECIPE_GRAPH_MIN_ALIAS_LENGTH = 4
+# Allergen nodes use the canonical names nlp.ALLERGEN_ALIASES resolves to; an ingredient belongs to an
+# allergen when one of its words starts with one of the allergen's stems.
+RECIPE_GRAPH_ALLERGENS = {
+    "Молоко": ("milk", "butter", "cheese", "cream", "yogurt", "yoghurt", "buttermilk", "parmesan", "mozzarella"),
+    "Глютен": ("flour", "bread", "pasta", "spaghetti", "macaroni", "noodle", "wheat", "barley", "rye", "cracker"),
+    "Орехи": ("nut", "almond", "walnut", "pecan", "peanut", "hazelnut", "cashew", "pistachio"),
+    "Яйца": ("egg",),
+    "Рыба": ("fish", "salmon", "tuna", "cod", "anchov", "sardine", "tilapia", "trout", "halibut"),
+    "Морепродукты": ("shrimp", "prawn", "crab", "lobster", "scallop", "clam", "mussel", "oyster", "squid"),
+    "Соя": ("soy", "tofu", "edamame", "miso"),
+    "Кунжут": ("sesame", "tahini"),
+}
+
+# Russian word stems of the most frequent RecipeNLG ingredients, matched from the start of a query word.
+# Each stem points at the first of its English names that is a node of the built graph.
+RECIPE_GRAPH_RU_ALIASES = {
+    "куриц": ("chicken", "chicken breasts", "chicken breast"),
+    "курин": ("chicken", "chicken breasts", "chicken breast"),
+    "курятин": ("chicken",),
+    "говяд": ("beef", "ground beef"),
+    "говяж": ("beef", "ground beef"),
+    "фарш": ("ground beef", "hamburger"),
+    "свин": ("pork", "pork chops"),
+    "индейк": ("turkey",),
+    "бекон": ("bacon",),
+    "ветчин": ("ham",),
+    "колбас": ("sausage",),
+    "рыб": ("fish",),
+    "лосос": ("salmon",),
+    "тунец": ("tuna",),
+    "тунц": ("tuna",),
+    "креветк": ("shrimp",),
+    "яйц": ("eggs", "egg"),
+    "яичн": ("eggs", "egg"),
+    "молок": ("milk",),
+    "сыр": ("cheese", "cheddar cheese"),
+    "творог": ("cottage cheese",),
+    "сметан": ("sour cream",),
+    "сливк": ("whipping cream", "heavy cream", "cream"),
+    "йогурт": ("yogurt", "plain yogurt"),
+    "рис": ("rice", "cooked rice"),
+    "гречк": ("buckwheat",),
+    "овсян": ("oats", "rolled oats", "oatmeal"),
+    "мук": ("flour",),
+    "хлеб": ("bread",),
+    "макарон": ("macaroni", "pasta"),
+    "спагетти": ("spaghetti",),
+    "лапш": ("noodles",),
+    "картоф": ("potatoes", "potato"),
+    "картошк": ("potatoes", "potato"),
+    "лук": ("onion", "onions"),
+    "чеснок": ("garlic",),
+    "морков": ("carrots", "carrot"),
+    "помидор": ("tomatoes", "tomato"),
+    "томат": ("tomatoes", "tomato", "tomato sauce"),
+    "огур": ("cucumber", "cucumbers"),
+    "капуст": ("cabbage",),
+    "брокколи": ("broccoli",),
+    "гриб": ("mushrooms", "mushroom"),
+    "шампиньон": ("mushrooms", "mushroom"),
+    "шпинат": ("spinach",),
+    "кабач": ("zucchini",),
+    "цукини": ("zucchini",),
+    "баклажан": ("eggplant",),
+    "тыкв": ("pumpkin",),
+    "свекл": ("beets",),
+    "сельдер": ("celery",),
+    "перц": ("green pepper", "pepper"),
+    "кукуруз": ("corn",),
+    "горош": ("peas",),
+    "горох": ("peas",),
+    "фасол": ("beans",),
+    "чечевиц": ("lentils",),
+    "авокадо": ("avocado",),
+    "яблок": ("apples", "apple"),
+    "банан": ("bananas", "banana"),
+    "клубник": ("strawberries",),
+    "лимон": ("lemon", "lemon juice"),
+    "апельсин": ("orange", "orange juice"),
+    "ананас": ("pineapple",),
+    "кокос": ("coconut",),
+    "изюм": ("raisins",),
+    "орех": ("nuts", "walnuts", "pecans"),
+    "арахис": ("peanuts", "peanut butter"),
+    "шоколад": ("chocolate", "chocolate chips"),
+    "какао": ("cocoa",),
+    "сахар": ("sugar",),
+    "ванил": ("vanilla",),
+    "кориц": ("cinnamon",),
+    "имбир": ("ginger",),
+    "петрушк": ("parsley",),
+    "укроп": ("dill",),
+    "базилик": ("basil",),
+    "майонез": ("mayonnaise",),
+    "горчиц": ("mustard",),
+    "кетчуп": ("catsup", "ketchup"),
+    "уксус": ("vinegar",),
+    "соев": ("soy sauce",),
+    "оливков": ("olive oil",),
+}
+
+
+def _recipe_terms(item):
+    terms = [f"t:{token}" for token in tokenize(item.get("title", "")) if len(token) >= 3 and token not in STOP_TOKENS]
+    terms.extend(f"i:{name}" for name in recipe_ingredient_names(item.get("ner", [])))
+    return list(dict.fromkeys(terms))
+
+
+def _recipe_ingredients(item):
+    return recipe_ingredient_names(item.get("ner", []))
+
+
+def load_recipe_term_matrix(recipe_terms=_recipe_terms, with_titles=False):
+    """Binary recipe x term matrix (title words and NER ingredients by default) of the serving index, in CSR form.
+
+    With `with_titles`, rows also get interned title ids ("title_ids"); "titles" keeps the first spelling
+    of every normalized title.
+    """
+    status = get_search_index_status()
+    term_ids = {}
+    title_ids = {}
+    titles = []
+    row_ids = []
+    row_title_ids = []
+    cluster_ids = []
+    indptr = [0]
+    indices = []
+    for row_id, cluster_id, item in iter_indexed_recipes():
+        row_ids.append(row_id)
+        cluster_ids.append(cluster_id)
+        for term in recipe_terms(item):
+            indices.append(term_ids.setdefault(term, len(term_ids)))
+        indptr.append(len(indices))
+        if with_titles:
+            title = str(item.get("title", "")).strip()
+            title_id = title_ids.setdefault(" ".join(tokenize(title)), len(title_ids))
+            if title_id == len(titles):
+                titles.append(title)
+            row_title_ids.append(title_id)
+
+    terms = [""] * len(term_ids)
+    for term, term_id in term_ids.items():
+        terms[term_id] = term
+    matrix = {
+        "build_id": status.get("build_id"),
+        "row_ids": np.asarray(row_ids, dtype=np.int64),
+        "cluster_ids": np.asarray(cluster_ids, dtype=np.int64),
+        "indptr": np.asarray(indptr, dtype=np.int64),
+        "indices": np.asarray(indices, dtype=np.int32),
+        "terms": terms,
+    }
+    if with_titles:
+        matrix["title_ids"] = np.asarray(row_title_ids, dtype=np.int32)
+        matrix["titles"] = titles
+    return matrix
+
+
+def _tfidf_rows(matrix):
+    """Idf weights per term and L2-normalized tf-idf values aligned with matrix['indices']."""
+    row_count = len(matrix["row_ids"])
+    df = np.bincount(matrix["indices"], minlength=len(matrix["terms"])).astype(np.float32)
+    idf = np.log((row_count + 1.0) / (df + 1.0)) + 1.0
+    values = idf[matrix["indices"]]
+    lengths = np.diff(matrix["indptr"])
+    owners = np.repeat(np.arange(row_count), lengths)
+    norms = np.sqrt(np.bincount(owners, weights=values * values, minlength=row_count))
+    values = values / np.maximum(norms[owners], 1e-12)
+    return idf, values.astype(np.float32)
+
+
+def _term_postings(matrix):
+    order = np.argsort(matrix["indices"], kind="stable")
+    owners = np.repeat(np.arange(len(matrix["row_ids"])), np.diff(matrix["indptr"]))
+    counts = np.bincount(matrix["indices"], minlength=len(matrix["terms"]))
+    term_indptr = np.concatenate([[0], np.cumsum(counts)])
+    return term_indptr, owners[order]
+
+
+def _gather_ranges(starts, stops):
+    lengths = stops - starts
+    if not len(lengths) or lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+def _row_neighbors(row, matrix, values, idf, postings, scratch, top_k):
+    indptr = matrix["indptr"]
+    indices = matrix["indices"]
+    term_indptr, posting_rows = postings
+    start, stop = indptr[row], indptr[row + 1]
+    row_terms = indices[start:stop]
+    if not len(row_terms):
+        return []
+
+    probe_terms = row_terms[np.argsort(-idf[row_terms], kind="stable")[:RECIPE_NEIGHBORS_PROBE_TERMS]]
+    probe = [
+        posting_rows[term_indptr[term] : min(term_indptr[term + 1], term_indptr[term] + RECIPE_NEIGHBORS_MAX_POSTINGS)]
+        for term in probe_terms
+    ]
+    candidates = np.unique(np.concatenate(probe))
+    cluster_ids = matrix["cluster_ids"]
+    candidates = candidates[cluster_ids[candidates] != cluster_ids[row]]
+    if not len(candidates):
+        return []
+
+    # Sparse dot products against the candidates through a dense scratch copy of the query row.
+    scratch[row_terms] = values[start:stop]
+    positions = _gather_ranges(indptr[candidates], indptr[candidates + 1])
+    owners = np.repeat(np.arange(len(candidates)), np.diff(indptr)[candidates])
+    scores = np.bincount(owners, weights=scratch[indices[positions]] * values[positions], minlength=len(candidates))
+    scratch[row_terms] = 0.0
+
+    keep = min(len(candidates), top_k * 3)
+    best = np.argpartition(-scores, keep - 1)[:keep]
+    best = best[np.lexsort((matrix["row_ids"][candidates[best]], -scores[best]))]
+    neighbors = []
+    seen_clusters = set()
+    for position in best:
+        if scores[position] <= 0.0:
+            break
+        candidate = candidates[position]
+        if cluster_ids[candidate] in seen_clusters:
+            continue
+        seen_clusters.add(cluster_ids[candidate])
+        neighbors.append((int(matrix["row_ids"][candidate]), float(scores[position])))
+        if len(neighbors) >= top_k:
+            break
+    return neighbors
+
+
+def build_recipe_neighbors(top_k=RECIPE_NEIGHBORS_TOP_K, matrix=None, progress=None):
+    """Precompute the top-k tf-idf cosine neighbours of every recipe into the neighbors table."""
+    matrix = matrix if matrix is not None else load_recipe_term_matrix()
+    if not matrix["build_id"]:
+        raise RuntimeError("RecipeNLG search index is not built")
+
+    idf, values = _tfidf_rows(matrix)
+    postings = _term_postings(matrix)
+    scratch = np.zeros(len(matrix["terms"]), dtype=np.float32)
+    target_path = recipenlg_neighbors_path()
+    temp_path = target_path.with_suffix(".tmp.sqlite3")
+    if temp_path.exists():
+        temp_path.unlink()
+
+    row_count = len(matrix["row_ids"])
+    with closing(sqlite3.connect(str(temp_path))) as conn:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            """
+            CREATE TABLE recipenlg_neighbors (
+                recipe_id INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                neighbor_id INTEGER NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (recipe_id, rank)
+            ) WITHOUT ROWID
+            """
+        )
+        pending = []
+        for row in range(row_count):
+            recipe_id = int(matrix["row_ids"][row])
+            for rank, (neighbor_id, score) in enumerate(
+                _row_neighbors(row, matrix, values, idf, postings, scratch, top_k), start=1
+            ):
+                pending.append((recipe_id, rank, neighbor_id, round(score, 6)))
+            if len(pending) >= RECIPE_NEIGHBORS_WRITE_BATCH or row == row_count - 1:
+                conn.executemany(
+                    "INSERT INTO recipenlg_neighbors(recipe_id, rank, neighbor_id, score) VALUES (?, ?, ?, ?)",
+                    pending,
+                )
+                pending = []
+                if progress is not None:
+                    progress(row + 1, row_count)
+        conn.executemany(
+            "INSERT INTO meta(key, value) VALUES (?, ?)",
+            [
+                ("index_build_id", matrix["build_id"]),
+                ("top_k", str(top_k)),
+                ("recipe_count", str(row_count)),
+                ("term_count", str(len(matrix["terms"]))),
+                ("built_at", str(int(time.time()))),
+            ],
+        )
+        conn.commit()
+    os.replace(temp_path, target_path)
+    return {
+        "path": str(target_path),
+        "recipe_count": row_count,
+        "term_count": len(matrix["terms"]),
+        "top_k": top_k,
+    }
+
+
+def _sparse_dot(indptr, indices, dense, values=None):
+    """CSR matrix (binary unless values are given) times a dense matrix, in row chunks to bound memory."""
+    row_count = len(indptr) - 1
+    result = np.zeros((row_count, dense.shape[1]), dtype=np.float32)
+    for chunk_start in range(0, row_count, RECIPE_ANN_BUILD_CHUNK):
+        chunk_stop = min(chunk_start + RECIPE_ANN_BUILD_CHUNK, row_count)
+        rows = np.arange(chunk_start, chunk_stop)
+        rows = rows[indptr[rows + 1] > indptr[rows]]
+        if not len(rows):
+            continue
+        start, stop = indptr[chunk_start], indptr[chunk_stop]
+        chunk = dense[indices[start:stop]]
+        if values is not None:
+            chunk = chunk * values[start:stop, None]
+        result[rows] = np.add.reduceat(chunk, indptr[rows] - start, axis=0)
+    return result
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _write_artifact_dir(target_path, arrays, metadata):
+    """Write .npy arrays and meta.json into a fresh directory and swap it in place of the previous one."""
+    temp_path = target_path.with_name(f"{target_path.name}.tmp")
+    old_path = target_path.with_name(f"{target_path.name}.old")
+    for path in [temp_path, old_path]:
+        shutil.rmtree(path, ignore_errors=True)
+    temp_path.mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(temp_path / f"{name}.npy", np.ascontiguousarray(array))
+    metadata = dict(metadata, built_at=str(int(time.time())))
+    (temp_path / "meta.json").write_text(json.dumps(metadata, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    # Directories cannot be replaced atomically: move the old one aside first. Readers keep their memory maps.
+    if target_path.exists():
+        os.replace(target_path, old_path)
+    os.replace(temp_path, target_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return {"path": str(target_path), **metadata}
+
+
+def build_recipe_ann_index(matrix=None):
+    """Random-projection LSH index over hashed recipe word vectors, stored as .npy files for memory mapping."""
+    matrix = matrix if matrix is not None else load_recipe_term_matrix(recipe_vector_terms)
+    if not matrix["build_id"]:
+        raise RuntimeError("RecipeNLG search index is not built")
+
+    row_count = len(matrix["row_ids"])
+    term_features = recipe_feature_ids(matrix["terms"])
+    feature_df = np.bincount(term_features[matrix["indices"]], minlength=1 << RECIPE_NLG_ANN_HASH_BITS)
+    idf = np.where(feature_df > 0, np.log((row_count + 1.0) / (feature_df + 1.0)) + 1.0, 0.0).astype(np.float32)
+    term_vectors = recipe_feature_signs(term_features) * idf[term_features][:, None]
+    vectors = _normalize_rows(_sparse_dot(matrix["indptr"], matrix["indices"], term_vectors))
+    codes = recipe_vector_bucket_codes(vectors)
+    bucket_rows = np.argsort(codes, axis=0, kind="stable").T.astype(np.int32)
+    bucket_keys = np.take_along_axis(codes.T, bucket_rows, axis=1)
+
+    return _write_artifact_dir(
+        recipenlg_ann_path(),
+        {
+            "row_ids": matrix["row_ids"],
+            "cluster_ids": matrix["cluster_ids"],
+            "vectors": vectors.astype(np.float16),
+            "idf": idf,
+            "bucket_keys": bucket_keys,
+            "bucket_rows": bucket_rows,
+        },
+        {
+            "index_build_id": matrix["build_id"],
+            "recipe_count": row_count,
+            "term_count": len(matrix["terms"]),
+            "dimensions": RECIPE_NLG_ANN_DIMENSIONS,
+            "tables": RECIPE_NLG_ANN_TABLES,
+            "table_bits": RECIPE_NLG_ANN_TABLE_BITS,
+        },
+    )
+
+
+def _randomized_svd(matrix, values, rank):
+    """Rank-k SVD of a sparse CSR matrix by randomized range finding with power iterations (Halko et al.)."""
+    indptr, indices = matrix["indptr"], matrix["indices"]
+    term_count = len(matrix["terms"])
+    # Transposed copy for A.T @ Y products.
+    order = np.argsort(indices, kind="stable")
+    owners = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    t_indptr = np.concatenate([[0], np.cumsum(np.bincount(indices, minlength=term_count))])
+    t_indices, t_values = owners[order], values[order]
+
+    rng = np.random.default_rng(RECIPE_EMBEDDING_SEED)
+    sketch = rng.standard_normal((term_count, rank + RECIPE_EMBEDDING_OVERSAMPLE)).astype(np.float32)
+    basis = np.linalg.qr(_sparse_dot(indptr, indices, sketch, values))[0]
+    for _ in range(RECIPE_EMBEDDING_POWER_ITERATIONS):
+        term_basis = np.linalg.qr(_sparse_dot(t_indptr, t_indices, basis, t_values))[0]
+        basis = np.linalg.qr(_sparse_dot(indptr, indices, term_basis, values))[0]
+    projected = _sparse_dot(t_indptr, t_indices, basis, t_values).T
+    small_u, singular_values, vt = np.linalg.svd(projected, full_matrices=False)
+    return basis @ (small_u[:, :rank] * singular_values[:rank]), vt[:rank].T, singular_values[:rank]
+
+
+def build_recipe_embeddings(matrix=None, rank=RECIPE_EMBEDDING_DIMENSIONS):
+    """LSA embeddings: truncated SVD of the tf-idf recipe x word matrix, stored as a float16 memmap."""
+    matrix = matrix if matrix is not None else load_recipe_term_matrix(recipe_vector_terms)
+    if not matrix["build_id"]:
+        raise RuntimeError("RecipeNLG search index is not built")
+
+    row_count = len(matrix["row_ids"])
+    df = np.bincount(matrix["indices"], minlength=len(matrix["terms"]))
+    # Words seen in a single recipe only add noise to the decomposition.
+    idf = np.where(df >= RECIPE_EMBEDDING_MIN_DF, np.log((row_count + 1.0) / (df + 1.0)) + 1.0, 0.0).astype(np.float32)
+    values = idf[matrix["indices"]]
+    lengths = np.diff(matrix["indptr"])
+    norms = np.sqrt(np.bincount(np.repeat(np.arange(row_count), lengths), weights=values * values, minlength=row_count))
+    values = (values / np.maximum(np.repeat(norms, lengths), 1e-12)).astype(np.float32)
+
+    rank = max(1, min(rank, row_count, len(matrix["terms"])))
+    recipe_vectors, term_vectors, singular_values = _randomized_svd(matrix, values, rank)
+    row_order = np.argsort(matrix["row_ids"], kind="stable")
+    return _write_artifact_dir(
+        recipenlg_embeddings_path(),
+        {
+            "row_ids": matrix["row_ids"][row_order],
+            "embeddings": _normalize_rows(recipe_vectors[row_order]).astype(np.float16),
+            "term_vectors": term_vectors.astype(np.float32),
+            "idf": idf,
+            "terms": np.asarray(matrix["terms"], dtype=str),
+        },
+        {
+            "index_build_id": matrix["build_id"],
+            "recipe_count": row_count,
+            "term_count": len(matrix["terms"]),
+            "dimensions": rank,
+            "singular_values": [round(float(value), 4) for value in singular_values],
+        },
+    )
+
+
+def _ingredient_pair_counts(indptr, indices, vocab_size):
+    """Symmetric vocab x vocab counts of recipes where two ingredients occur together."""
+    row_ends = np.repeat(indptr[1:], np.diff(indptr))
+    positions = np.arange(len(indices))
+    counts = np.zeros(vocab_size * vocab_size, dtype=np.int64)
+    offset = 1
+    # Pairs (p, p + offset) inside one row, for growing offsets; positions in short rows drop out early.
+    while True:
+        positions = positions[row_ends[positions] - positions > offset]
+        if not len(positions):
+            break
+        left, right = indices[positions], indices[positions + offset]
+        counts += np.bincount(left * vocab_size + right, minlength=vocab_size * vocab_size)
+        counts += np.bincount(right * vocab_size + left, minlength=vocab_size * vocab_size)
+        offset += 1
+    return counts.reshape(vocab_size, vocab_size)
+
+
+def build_ingredient_substitutions(
+    matrix=None,
+    vocab_size=RECIPE_SUBSTITUTION_VOCAB,
+    min_df=RECIPE_SUBSTITUTION_MIN_DF,
+    min_pair=RECIPE_SUBSTITUTION_MIN_PAIR,
+    top_k=RECIPE_SUBSTITUTION_TOP_K,
+):
+    """Ingredient co-occurrence PPMI matrix and, per ingredient, the ingredients used in the same contexts."""
+    matrix = matrix if matrix is not None else load_recipe_term_matrix(_recipe_ingredients)
+    if not matrix["build_id"]:
+        raise RuntimeError("RecipeNLG search index is not built")
+
+    recipe_count = len(matrix["row_ids"])
+    df = np.bincount(matrix["indices"], minlength=len(matrix["terms"]))
+    vocab = np.argsort(-df, kind="stable")[:vocab_size]
+    vocab = vocab[df[vocab] >= min_df]
+    remap = np.full(len(matrix["terms"]), -1, dtype=np.int64)
+    remap[vocab] = np.arange(len(vocab))
+    mapped = remap[matrix["indices"]]
+    kept = mapped >= 0
+    row_owners = np.repeat(np.arange(recipe_count), np.diff(matrix["indptr"]))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(row_owners[kept], minlength=recipe_count))])
+    counts = _ingredient_pair_counts(indptr, mapped[kept], len(vocab))
+
+    vocab_df = df[vocab].astype(np.float64)
+    with np.errstate(divide="ignore"):
+        pmi = np.log(counts * float(recipe_count) / np.outer(vocab_df, vocab_df))
+    ppmi = np.where(counts >= min_pair, np.maximum(pmi, 0.0), 0.0).astype(np.float32)
+
+    # Substitutes share contexts (second-order similarity of PPMI rows) but rarely appear in the same recipe.
+    contexts = _normalize_rows(ppmi)
+    similarity = contexts @ contexts.T
+    together = counts / np.maximum(np.minimum.outer(vocab_df, vocab_df), 1.0)
+    scores = similarity * (1.0 - np.minimum(together, 1.0))
+    np.fill_diagonal(scores, 0.0)
+    keep = min(top_k, max(len(vocab) - 1, 0))
+    substitutes = np.full((len(vocab), top_k), -1, dtype=np.int32)
+    substitute_scores = np.zeros((len(vocab), top_k), dtype=np.float32)
+    if keep:
+        best = np.argsort(-scores, axis=1, kind="stable")[:, :keep]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        substitutes[:, :keep] = np.where(best_scores > 0.0, best, -1)
+        substitute_scores[:, :keep] = np.maximum(best_scores, 0.0)
+
+    pmi_rows, pmi_columns = np.nonzero(ppmi)
+    return _write_artifact_dir(
+        recipenlg_substitutions_path(),
+        {
+            "names": np.asarray([matrix["terms"][term_id] for term_id in vocab], dtype=str),
+            "df": df[vocab],
+            "pmi_indptr": np.concatenate([[0], np.cumsum(np.bincount(pmi_rows, minlength=len(vocab)))]),
+            "pmi_indices": pmi_columns.astype(np.int32),
+            "pmi_values": ppmi[pmi_rows, pmi_columns],
+            "substitutes": substitutes,
+            "substitute_scores": substitute_scores,
+        },
+        {
+            "index_build_id": matrix["build_id"],
+            "recipe_count": recipe_count,
+            "ingredient_count": len(vocab),
+            "pmi_nonzero": len(pmi_rows),
+            "top_k": top_k,
+        },
+    )
+
+
+def _allergen_ingredient_edges(names):
+    """(allergen index, ingredient index) arrays for RECIPE_GRAPH_ALLERGENS stems found in ingredient words."""
+    allergen_ids = []
+    ingredient_ids = []
+    for allergen_id, stems in enumerate(RECIPE_GRAPH_ALLERGENS.values()):
+        for ingredient_id, name in enumerate(names):
+            if any(word.startswith(stems) for word in name.split()):
+                allergen_ids.append(allergen_id)
+                ingredient_ids.append(ingredient_id)
+    return np.asarray(allergen_ids, dtype=np.int64), np.asarray(ingredient_ids, dtype=np.int64)
+
+
+def _graph_aliases(node_names):
+    """Russian stems for English graph nodes: RECIPE_GRAPH_RU_ALIASES, then unambiguous DATASET_TOKEN_ALIASES."""
+    aliases = {}
+    normalized_nodes = {name.lower(): name for name in node_names}
+    for stem, targets in RECIPE_GRAPH_RU_ALIASES.items():
+        node = next((normalized_nodes[target] for target in targets if target in normalized_nodes), None)
+        if node is not None:
+            aliases.setdefault(node, []).append(stem)
+    covered = {stem for stems in aliases.values() for stem in stems}
+    for stem, targets in DATASET_TOKEN_ALIASES.items():
+        if stem in covered or len(stem) < RECIPE_GRAPH_MIN_ALIAS_LENGTH or len(targets) != 1:
+            continue
+        node = normalized_nodes.get(targets[0])
+        if node is not None:
+            aliases.setdefault(node, []).append(stem)
+    return aliases
+
+
+def build_recipe_knowledge_graph(
+    matrix=None,
+    max_ingredients=RECIPE_GRAPH_MAX_INGREDIENTS,
+    max_recipes=RECIPE_GRAPH_MAX_RECIPES,
+    min_df=RECIPE_GRAPH_MIN_DF,
+    min_title_count=RECIPE_GRAPH_MIN_TITLE_COUNT,
+    min_share=RECIPE_GRAPH_MIN_INGREDIENT_SHARE,
+):
+    """Ingredient/allergen/recipe graph from the index NER data, stored as a CSR adjacency.
+
+    Ingredients are the most frequent NER names, recipes the most repeated titles (a dish cooked in many
+    variants); a recipe links to the ingredients used by at least `min_share` of its variants.
+    """
+    matrix = matrix if matrix is not None else load_recipe_term_matrix(_recipe_ingredients, with_titles=True)
+    if not matrix["build_id"]:
+        raise RuntimeError("RecipeNLG search index is not built")
+
+    df = np.bincount(matrix["indices"], minlength=len(matrix["terms"]))
+    vocab = np.argsort(-df, kind="stable")[:max_ingredients]
+    vocab = vocab[df[vocab] >= min_df]
+    ingredient_names = [matrix["terms"][term_id] for term_id in vocab]
+
+    title_counts = np.bincount(matrix["title_ids"], minlength=len(matrix["titles"]))
+    ingredient_keys = set(ingredient_names)
+    chosen_titles = [
+        title_id
+        for title_id in np.argsort(-title_counts, kind="stable").tolist()
+        if title_counts[title_id] >= min_title_count
+        and tokenize(matrix["titles"][title_id])
+        and " ".join(tokenize(matrix["titles"][title_id])) not in ingredient_keys
+    ][:max_recipes]
+
+    recipe_names = [matrix["titles"][title_id] for title_id in chosen_titles]
+    names = ingredient_names + list(RECIPE_GRAPH_ALLERGENS) + recipe_names
+    node_types = np.concatenate(
+        [
+            np.full(len(ingredient_names), GRAPH_NODE_TYPES.index("ingredient")),
+            np.full(len(RECIPE_GRAPH_ALLERGENS), GRAPH_NODE_TYPES.index("allergen")),
+            np.full(len(chosen_titles), GRAPH_NODE_TYPES.index("recipe")),
+        ]
+    ).astype(np.uint8)
+    allergen_offset = len(ingredient_names)
+    recipe_offset = allergen_offset + len(RECIPE_GRAPH_ALLERGENS)
+
+    # Recipe -> ingredient shares: count (title, ingredient) pairs over every variant of a chosen title.
+    ingredient_nodes = np.full(len(matrix["terms"]), -1, dtype=np.int64)
+    ingredient_nodes[vocab] = np.arange(len(vocab))
+    title_nodes = np.full(len(matrix["titles"]), -1, dtype=np.int64)
+    title_nodes[chosen_titles] = np.arange(len(chosen_titles))
+    row_titles = np.repeat(title_nodes[matrix["title_ids"]], np.diff(matrix["indptr"]))
+    row_ingredients = ingredient_nodes[matrix["indices"]]
+    kept = (row_titles >= 0) & (row_ingredients >= 0)
+    pair_keys, pair_counts = np.unique(row_titles[kept] * len(vocab) + row_ingredients[kept], return_counts=True)
+    pair_titles, pair_ingredients = np.divmod(pair_keys, max(len(vocab), 1))
+    shares = pair_counts / title_counts[np.asarray(chosen_titles, dtype=np.int64)[pair_titles]]
+    strong = shares >= min_share
+
+    allergen_ids, allergen_ingredients = _allergen_ingredient_edges(ingredient_names)
+    sources = np.concatenate([pair_titles[strong] + recipe_offset, allergen_ids + allergen_offset])
+    targets = np.concatenate([pair_ingredients[strong], allergen_ingredients])
+    # Allergen edges are weighted by how common the ingredient is, so the usual suspects come first.
+    prevalence = df[vocab][allergen_ingredients] / max(len(matrix["row_ids"]), 1)
+    weights = np.concatenate([shares[strong], prevalence]).astype(np.float32)
+
+    # Undirected: store every edge in both directions, grouped by source node.
+    edge_sources = np.concatenate([sources, targets])
+    edge_targets = np.concatenate([targets, sources])
+    edge_weights = np.concatenate([weights, weights])
+    order = np.argsort(edge_sources, kind="stable")
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(edge_sources, minlength=len(names)))])
+
+    return _write_artifact_dir(
+        recipenlg_graph_path(),
+        {
+            "names": np.asarray(names, dtype=str),
+            "node_types": node_types,
+            "indptr": indptr.astype(np.int64),
+            "indices": edge_targets[order].astype(np.int32),
+            "weights": edge_weights[order],
+        },
+        {
+            "index_build_id": matrix["build_id"],
+            "ingredient_count": len(ingredient_names),
+            "allergen_count": len(RECIPE_GRAPH_ALLERGENS),
+            "recipe_count": len(chosen_titles),
+            "edge_count": int(len(sources)),
+            "aliases": _graph_aliases(names),
+        },
+    )
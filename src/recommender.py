@@ -1,13 +1,30 @@
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from difflib import SequenceMatcher
 from functools import lru_cache
 from pathlib import Path
 import ast
 import csv
+import json
 import math
+import os
+import random
 import re
+import socket
 import sqlite3
+import struct
+import threading
 import time
+import zlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows runtime
+    fcntl = None
+    import msvcrt
 
 try:
     from deep_translator import GoogleTranslator, MyMemoryTranslator
@@ -16,9 +33,25 @@ except ImportError:  # pragma: no cover - optional runtime import
     MyMemoryTranslator = None
 
 try:
+    from .knowledge_graph import load_knowledge_graph
     from .nlp import get_known_datasets
+    from .recipe_columns import (
+        iter_snapshot_rows,
+        open_column_snapshot,
+        read_column_snapshot_metadata,
+        snapshot_row_for_offset,
+        write_column_snapshot,
+    )
 except ImportError:
+    from knowledge_graph import load_knowledge_graph
     from nlp import get_known_datasets
+    from recipe_columns import (
+        iter_snapshot_rows,
+        open_column_snapshot,
+        read_column_snapshot_metadata,
+        snapshot_row_for_offset,
+        write_column_snapshot,
+    )
 
 
 MEAL_HINTS = {
@@ -32,7 +65,44 @@ RECIPE_NLG_CHUNK_SIZE = 50000
 RECIPE_NLG_MAX_CANDIDATES = 120
 RECIPE_NLG_SEARCH_POOL = 320
 RECIPE_NLG_INDEX_BATCH_SIZE = 5000
-RECIPE_NLG_INDEX_SCHEMA_VERSION = "2"
+RECIPE_NLG_INDEX_SCHEMA_VERSION = "6"
+RECIPE_NLG_DOC_COMPRESSION_LEVEL = 6
+# Preset zlib dictionary: short recipe documents compress poorly without shared context.
+RECIPE_NLG_DOC_ZDICT = " ".join(
+    [
+        '"Gathered","Recipes1M",',
+        "pkg. can oz. lb. chopped minced sliced diced softened melted beaten large small medium",
+        "salt pepper sugar brown sugar butter margarine flour eggs milk water onion garlic oil",
+        "cheese chicken beef cream sour cream vanilla baking powder baking soda",
+        "Preheat oven to 350\u00b0. Bake at 350\u00b0 for minutes. Mix well. Stir in Add the",
+        'Serve. Combine all ingredients. until and with in a large bowl. ","',
+        '1/2 c. ","1 c. ","1 tsp. ","1/2 tsp. ","1 Tbsp. ","2 c. ","1 (8 oz.) ',
+    ]
+).encode("utf-8")
+RECIPE_NLG_INDEX_SHARDS = 1
+RECIPE_NLG_FTS_TOKENIZER = "porter unicode61"
+RECIPE_NLG_FTS_PREFIX = "2 3 4"
+RECIPE_NLG_SHARD_QUERY_WORKERS = 8
+RECIPE_NLG_STATUS_RECHECK_SECONDS = 5.0
+RECIPE_NLG_RRF_K = 60
+RECIPE_NLG_MINHASH_PERMUTATIONS = 32
+RECIPE_NLG_MINHASH_BANDS = 8
+RECIPE_NLG_DUPLICATE_THRESHOLD = 0.7
+RECIPE_NLG_MINHASH_SEED = 20240611
+RECIPE_NLG_SEED_TITLE_SCORE = 1.5
+# Hashed word vectors are reduced to 64 dims with one sign bit per bit of a 64-bit feature hash.
+RECIPE_NLG_ANN_HASH_BITS = 20
+RECIPE_NLG_ANN_DIMENSIONS = 64
+RECIPE_NLG_ANN_TABLES = 8
+RECIPE_NLG_ANN_TABLE_BITS = 12
+RECIPE_NLG_ANN_MAX_PROBE = 60000
+RECIPE_NLG_ANN_CANDIDATES = 40
+# Vector-only hits may take at most 1/4 of the requested candidates; the rest stays lexical.
+RECIPE_NLG_ANN_SHARE_DIVISOR = 4
+RECIPE_NLG_ANN_SEED = 20240917
+RECIPE_NLG_SUBSTITUTES_LIMIT = 3
+RECIPE_NLG_PANTRY_STAPLES = {"salt", "water", "pepper", "black pepper", "salt and pepper", "ice"}
+_MINHASH_PRIME = (1 << 61) - 1
 TRANSLATE_CHUNK_LIMIT = 4500
 STOP_TOKENS = {
     "что",
@@ -149,6 +219,12 @@ DATASET_TOKEN_ALIASES = {
     "ужин": ["dinner", "chicken", "beef", "fish"],
     "завтр": ["breakfast", "egg", "omelette", "pancake"],
     "десерт": ["dessert", "cake", "cookie"],
+    "морков": ["carrot"],
+    "лук": ["onion"],
+    "чеснок": ["garlic"],
+    "помидор": ["tomato"],
+    "томат": ["tomato"],
+    "огур": ["cucumber"],
 }
 TRANSLATION_FILLER_PATTERNS = [
     r"\bчто\s+похоже\s+на\b",
@@ -168,7 +244,35 @@ _TRANSLATION_RUNTIME = {
     "ru": {"provider": None, "last_error": None},
     "en": {"provider": None, "last_error": None},
 }
-_SEARCH_INDEX_RUNTIME = {"backend": "sqlite_fts5", "last_error": None}
+_SEARCH_INDEX_RUNTIME = {
+    "backend": "sqlite_fts5",
+    "last_error": None,
+    "generation": 0,
+    "index_signature": None,
+    "build_lock": None,
+    "build_lock_checked_at": 0.0,
+}
+_SEARCH_INDEX_BUILD = {
+    "state": "idle",
+    "force_rebuild": False,
+    # A forced rebuild requested while another build was running; the build thread runs it next.
+    "force_pending": False,
+    "rows_done": 0,
+    "rows_skipped": 0,
+    "resumed_from_rows": 0,
+    "bytes_done": 0,
+    "bytes_total": 0,
+    "rows_per_sec": 0.0,
+    "eta_seconds": None,
+    "started_at": None,
+    "finished_at": None,
+    "last_error": None,
+}
+_SEARCH_INDEX_STATE_LOCK = threading.Lock()
+_SEARCH_INDEX_BUILD_LOCK = threading.Lock()
+_SEARCH_INDEX_BUILD_THREAD = {"thread": None, "accepting": False}
+_SEARCH_CONNECTION_POOL = {"generation": 0, "idle": {}}
+_SEARCH_INDEX_STATUS_CACHE = {"status": None, "signature": None, "checked_at": 0.0}
 
 
 def normalize(text):
@@ -205,7 +309,7 @@ def recipenlg_csv_path():
 
 
 def recipenlg_ready():
-    return recipenlg_csv_path() is not None
+    return _cached_search_index_status()["source_path"] is not None
 
 
 def _parse_list_like(value):
@@ -437,28 +541,86 @@ def _dataset_query_tokens(query_text, include_ingredients=None, meal_type=None):
     )["query_tokens"]
 
 
-@lru_cache(maxsize=1)
-def get_recipenlg_preview(limit=10):
+def recipenlg_snapshot_path():
+    return ARTIFACTS_DIR / "recipenlg_columns"
+
+
+def _recipenlg_source_metadata(dataset_path):
+    expected = _expected_index_metadata(dataset_path)
+    return {key: expected[key] for key in ["source_path", "source_size", "source_mtime_ns"]}
+
+
+def get_recipenlg_snapshot(dataset_path=None):
+    """Memory-mapped columnar snapshot of the RecipeNLG CSV, or None when it is missing or older than the CSV."""
+    dataset_path = dataset_path or recipenlg_csv_path()
+    if dataset_path is None:
+        return None
+    metadata = read_column_snapshot_metadata(recipenlg_snapshot_path())
+    source = _recipenlg_source_metadata(dataset_path)
+    if not metadata or any(metadata.get(key) != value for key, value in source.items()):
+        return None
+    try:
+        return open_column_snapshot(str(recipenlg_snapshot_path()), metadata["built_at"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def build_recipenlg_snapshot(progress=None):
+    """One pass over the CSV into per-column string heaps; later bulk scans skip the CSV parser."""
     dataset_path = recipenlg_csv_path()
     if dataset_path is None:
-        return []
+        raise RuntimeError("RecipeNLG CSV not found")
+    fieldnames, header_offset = _read_csv_header(dataset_path)
+    bytes_total = dataset_path.stat().st_size
+
+    def rows():
+        for row_number, (row, offset) in enumerate(_iter_csv_rows(dataset_path, fieldnames, header_offset), start=1):
+            if progress is not None and row_number % RECIPE_NLG_CHUNK_SIZE == 0:
+                progress(row_number, offset, bytes_total)
+            yield row, offset
+
+    return write_column_snapshot(
+        recipenlg_snapshot_path(),
+        rows(),
+        [name for name in fieldnames if name],
+        {**_recipenlg_source_metadata(dataset_path), "fieldnames": fieldnames},
+    )
 
-    preview = []
+
+def iter_recipenlg_records(columns, limit=None):
+    """Well-formed RecipeNLG rows restricted to `columns`, from the snapshot when it is current."""
+    snapshot = get_recipenlg_snapshot()
+    if snapshot is not None and all(column in snapshot["columns"] for column in columns):
+        for row, _ in iter_snapshot_rows(snapshot, columns, stop=limit):
+            if row is not None:
+                yield row
+        return
+
+    dataset_path = recipenlg_csv_path()
+    if dataset_path is None:
+        return
     with open(dataset_path, "r", encoding="utf-8", errors="ignore") as file:
         reader = csv.DictReader(file)
         for idx, row in enumerate(reader):
-            title = str(row.get("title", "")).strip()
-            ingredients = _parse_list_like(row.get("ingredients", ""))
-            if title:
-                preview.append(
-                    {
-                        "title": title,
-                        "title_ru": translate_to_ru(title),
-                        "ingredient_count": len(ingredients),
-                    }
-                )
-            if idx + 1 >= limit:
+            yield {column: row.get(column, "") for column in columns}
+            if limit is not None and idx + 1 >= limit:
                 break
+
+
+@lru_cache(maxsize=1)
+def get_recipenlg_preview(limit=10):
+    preview = []
+    for row in iter_recipenlg_records(["title", "ingredients"], limit=limit):
+        title = str(row.get("title", "")).strip()
+        ingredients = _parse_list_like(row.get("ingredients", ""))
+        if title:
+            preview.append(
+                {
+                    "title": title,
+                    "title_ru": translate_to_ru(title),
+                    "ingredient_count": len(ingredients),
+                }
+            )
     return preview
 
 
@@ -507,37 +669,218 @@ def _compute_dataset_tags(title, ingredients_text, ner_text):
 
 
 def _index_metadata(path):
+    if not Path(path).exists():
+        return {}
     try:
-        with sqlite3.connect(str(path)) as conn:
+        with closing(sqlite3.connect(str(path))) as conn:
             rows = conn.execute("SELECT key, value FROM meta").fetchall()
     except sqlite3.Error:
         return {}
     return {str(key): str(value) for key, value in rows}
 
 
+def _artifact_index_build_id(path):
+    if not Path(path).exists():
+        return None
+    try:
+        with closing(sqlite3.connect(str(path))) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'index_build_id'").fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
 def _expected_index_metadata(dataset_path):
     stats = dataset_path.stat()
     return {
         "schema_version": RECIPE_NLG_INDEX_SCHEMA_VERSION,
         "source_path": str(dataset_path.resolve()),
+        "fts_tokenizer": f"{RECIPE_NLG_FTS_TOKENIZER}; prefix={RECIPE_NLG_FTS_PREFIX}",
         "source_size": str(stats.st_size),
         "source_mtime_ns": str(getattr(stats, "st_mtime_ns", int(stats.st_mtime * 1_000_000_000))),
     }
 
 
-def get_search_index_status():
-    dataset_path = recipenlg_csv_path()
+def _search_index_build_snapshot():
+    with _SEARCH_INDEX_STATE_LOCK:
+        snapshot = dict(_SEARCH_INDEX_BUILD)
+    if snapshot["started_at"] is not None:
+        finished_at = snapshot["finished_at"] or time.time()
+        elapsed = max(finished_at - snapshot["started_at"], 0.0)
+        snapshot["elapsed_seconds"] = round(elapsed, 1)
+    else:
+        snapshot["elapsed_seconds"] = 0.0
+    return snapshot
+
+
+def _search_index_lock_path():
+    return RECIPE_NLG_INDEX_PATH.with_suffix(".lock")
+
+
+def recipenlg_neighbors_path():
+    return RECIPE_NLG_INDEX_PATH.with_name(f"{RECIPE_NLG_INDEX_PATH.stem}.neighbors.sqlite3")
+
+
+def recipenlg_ann_path():
+    return RECIPE_NLG_INDEX_PATH.with_name(f"{RECIPE_NLG_INDEX_PATH.stem}.ann")
+
+
+def recipenlg_embeddings_path():
+    return RECIPE_NLG_INDEX_PATH.with_name(f"{RECIPE_NLG_INDEX_PATH.stem}.embeddings")
+
+
+def recipenlg_substitutions_path():
+    return RECIPE_NLG_INDEX_PATH.with_name(f"{RECIPE_NLG_INDEX_PATH.stem}.substitutions")
+
+
+def recipenlg_graph_path():
+    return RECIPE_NLG_INDEX_PATH.with_name(f"{RECIPE_NLG_INDEX_PATH.stem}.graph")
+
+
+def _artifact_dir_metadata(path):
+    try:
+        return json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _lock_file_windows(file, blocking):  # pragma: no cover - Windows runtime
+    file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+
+
+def _lock_file(file, blocking):
+    if fcntl is None:  # pragma: no cover - Windows runtime
+        return _lock_file_windows(file, blocking)
+
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    try:
+        fcntl.flock(file.fileno(), flags)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unlock_file(file):
+    if fcntl is None:  # pragma: no cover - Windows runtime
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def _read_lock_owner(lock_path):
+    try:
+        text = lock_path.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if not text:
+        return None
+    try:
+        owner = json.loads(text)
+    except ValueError:
+        return None
+    return owner if isinstance(owner, dict) else None
+
+
+@contextmanager
+def _search_index_build_lock(blocking):
+    """Cross-process build coordinator: exactly one process holds the lock file while it builds."""
+    lock_path = _search_index_lock_path()
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+", encoding="utf-8") as file:
+        acquired = _lock_file(file, blocking)
+        if acquired:
+            file.seek(0)
+            file.truncate()
+            file.write(
+                json.dumps({"pid": os.getpid(), "host": socket.gethostname(), "acquired_at": int(time.time())})
+            )
+            file.flush()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                file.seek(0)
+                file.truncate()
+                file.flush()
+                _unlock_file(file)
+
+
+def _owner_process_alive(owner):
+    if owner.get("host") != socket.gethostname() or fcntl is None:
+        # Another host's (or, on Windows, any) pid cannot be probed: trust the owner record.
+        return True
+    try:
+        os.kill(int(owner.get("pid")), 0)
+    except (TypeError, ValueError, ProcessLookupError):
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _search_index_lock_status():
+    # Lock-free: the holder writes its owner record and truncates it on release, so probing the flock
+    # itself (and briefly stealing it from a concurrent non-blocking build) is never needed.
+    lock_path = _search_index_lock_path()
+    status = {"path": str(lock_path), "locked": False, "owner": None, "owned_by_current_process": False}
+    owner = _read_lock_owner(lock_path)
+    if not owner or not _owner_process_alive(owner):
+        return status
+    owned_here = owner.get("pid") == os.getpid() and owner.get("host") == socket.gethostname()
+    status.update({"locked": True, "owner": owner, "owned_by_current_process": owned_here})
+    return status
+
+
+def _file_signature(path):
+    try:
+        stats = path.stat()
+    except OSError:
+        return None
+    return (stats.st_ino, stats.st_size, getattr(stats, "st_mtime_ns", int(stats.st_mtime * 1_000_000_000)))
+
+
+def _search_index_signature():
+    # Offline artifacts are swapped in by other processes too; replacing one drains pooled connections to it.
+    return (
+        _file_signature(RECIPE_NLG_INDEX_PATH),
+        _file_signature(recipenlg_neighbors_path()),
+        _file_signature(recipenlg_ann_path() / "meta.json"),
+        _file_signature(recipenlg_embeddings_path() / "meta.json"),
+        _file_signature(recipenlg_substitutions_path() / "meta.json"),
+        _file_signature(recipenlg_graph_path() / "meta.json"),
+    )
+
+
+def _read_search_index_status(dataset_path):
     status = {
         "ready": False,
-        "backend": _SEARCH_INDEX_RUNTIME["backend"],
+        "serving": False,
         "path": str(RECIPE_NLG_INDEX_PATH),
-        "last_error": _SEARCH_INDEX_RUNTIME["last_error"],
+        "source_path": str(dataset_path) if dataset_path is not None else None,
+        "status_error": None,
         "row_count": 0,
         "built_at": None,
+        "shard_count": 0,
+        "shard_paths": [],
+        "cluster_count": 0,
+        "build_id": None,
+        "neighbors_ready": False,
+        "ann_ready": False,
+        "embeddings_ready": False,
+        "substitutions_ready": False,
+        "graph_ready": False,
         "needs_rebuild": False,
     }
     if dataset_path is None:
-        status["last_error"] = "RecipeNLG CSV not found"
+        status["status_error"] = "RecipeNLG CSV not found"
         return status
 
     if not RECIPE_NLG_INDEX_PATH.exists():
@@ -548,128 +891,919 @@ def get_search_index_status():
     expected = _expected_index_metadata(dataset_path)
     if not metadata:
         status["needs_rebuild"] = True
-        status["last_error"] = "search index metadata missing"
+        status["status_error"] = "search index metadata missing"
         return status
 
+    shard_paths = [RECIPE_NLG_INDEX_PATH] + [
+        RECIPE_NLG_INDEX_PATH.parent / name for name in _shard_file_names(metadata)
+    ]
     status["row_count"] = int(metadata.get("row_count", "0") or "0")
     status["built_at"] = metadata.get("built_at")
+    status["cluster_count"] = int(metadata.get("cluster_count", "0") or "0")
+    status["build_id"] = metadata.get("build_id")
+    # Offline artifacts are only used when they were computed from this exact index build.
+    status["neighbors_ready"] = bool(status["build_id"]) and (
+        _artifact_index_build_id(recipenlg_neighbors_path()) == status["build_id"]
+    )
+    for key, path in [
+        ("ann_ready", recipenlg_ann_path()),
+        ("embeddings_ready", recipenlg_embeddings_path()),
+        ("substitutions_ready", recipenlg_substitutions_path()),
+        ("graph_ready", recipenlg_graph_path()),
+    ]:
+        status[key] = bool(status["build_id"]) and _artifact_dir_metadata(path).get("index_build_id") == status["build_id"]
+    status["shard_count"] = len(shard_paths)
+    status["shard_paths"] = [str(path) for path in shard_paths]
+    if not all(path.exists() for path in shard_paths):
+        status["needs_rebuild"] = True
+        status["status_error"] = "search index shard missing"
+        return status
+
     status["needs_rebuild"] = any(metadata.get(key) != value for key, value in expected.items())
+    status["needs_rebuild"] = status["needs_rebuild"] or len(shard_paths) != max(1, int(RECIPE_NLG_INDEX_SHARDS))
     status["ready"] = not status["needs_rebuild"]
+    # A stale index with the current schema keeps answering queries until the rebuilt one is swapped in.
+    status["serving"] = metadata.get("schema_version") == RECIPE_NLG_INDEX_SCHEMA_VERSION
+    return status
+
+
+def _cached_search_index_status(refresh=False):
+    """Index status kept in memory and re-read only when the CSV or index file stat changes."""
+    now = time.monotonic()
+    with _SEARCH_INDEX_STATE_LOCK:
+        cached = _SEARCH_INDEX_STATUS_CACHE["status"]
+        checked_at = _SEARCH_INDEX_STATUS_CACHE["checked_at"]
+        previous_signature = _SEARCH_INDEX_STATUS_CACHE["signature"]
+    if cached is not None and not refresh and now - checked_at < RECIPE_NLG_STATUS_RECHECK_SECONDS:
+        return cached
+
+    dataset_path = recipenlg_csv_path()
+    index_signature = _search_index_signature()
+    signature = (
+        str(RECIPE_NLG_INDEX_PATH),
+        str(dataset_path) if dataset_path is not None else None,
+        _file_signature(dataset_path) if dataset_path is not None else None,
+        index_signature,
+    )
+    if cached is None or signature != previous_signature:
+        cached = _read_search_index_status(dataset_path)
+
+    # Another process may have swapped in a new index file: drain connections and caches of the old one.
+    known_index_signature = _SEARCH_INDEX_RUNTIME["index_signature"]
+    _SEARCH_INDEX_RUNTIME["index_signature"] = index_signature
+    if known_index_signature is not None and index_signature != known_index_signature:
+        _drain_search_index_runtime()
+
+    with _SEARCH_INDEX_STATE_LOCK:
+        _SEARCH_INDEX_STATUS_CACHE.update({"status": cached, "signature": signature, "checked_at": now})
+    return cached
+
+
+def get_search_index_status(refresh=False):
+    cached = _cached_search_index_status(refresh=refresh)
+    # The owner record is re-read on the same recheck interval as the cached status (no flock involved).
+    now = time.monotonic()
+    if (
+        refresh
+        or _SEARCH_INDEX_RUNTIME["build_lock"] is None
+        or now - _SEARCH_INDEX_RUNTIME["build_lock_checked_at"] >= RECIPE_NLG_STATUS_RECHECK_SECONDS
+    ):
+        _SEARCH_INDEX_RUNTIME.update({"build_lock": _search_index_lock_status(), "build_lock_checked_at": now})
+    status = {key: value for key, value in cached.items() if key != "status_error"}
+    status.update(
+        {
+            "backend": _SEARCH_INDEX_RUNTIME["backend"],
+            "last_error": cached["status_error"] or _SEARCH_INDEX_RUNTIME["last_error"],
+            "generation": _SEARCH_INDEX_RUNTIME["generation"],
+            "build": _search_index_build_snapshot(),
+            "build_lock": dict(_SEARCH_INDEX_RUNTIME["build_lock"]),
+        }
+    )
     return status
 
 
-def _open_search_index():
-    conn = sqlite3.connect(str(RECIPE_NLG_INDEX_PATH))
+def _open_search_index(path=None):
+    conn = sqlite3.connect(str(path or RECIPE_NLG_INDEX_PATH), check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def ensure_recipenlg_search_index(force_rebuild=False):
-    dataset_path = recipenlg_csv_path()
-    if dataset_path is None:
-        _SEARCH_INDEX_RUNTIME["last_error"] = "RecipeNLG CSV not found"
-        return get_search_index_status()
+def _acquire_search_connection(path):
+    key = str(path)
+    with _SEARCH_INDEX_STATE_LOCK:
+        generation = _SEARCH_INDEX_RUNTIME["generation"]
+        idle = _SEARCH_CONNECTION_POOL["idle"].get(key, [])
+        while idle:
+            conn_generation, conn = idle.pop()
+            if conn_generation == generation:
+                return conn_generation, conn
+            conn.close()
+    return generation, _open_search_index(path)
 
-    current_status = get_search_index_status()
-    if current_status["ready"] and not force_rebuild:
-        return current_status
 
-    ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
-    temp_path = RECIPE_NLG_INDEX_PATH.with_suffix(".tmp.sqlite3")
-    if temp_path.exists():
-        temp_path.unlink()
-    if force_rebuild and RECIPE_NLG_INDEX_PATH.exists():
-        RECIPE_NLG_INDEX_PATH.unlink()
+def _release_search_connection(path, conn_generation, conn):
+    with _SEARCH_INDEX_STATE_LOCK:
+        if conn_generation == _SEARCH_INDEX_RUNTIME["generation"]:
+            _SEARCH_CONNECTION_POOL["idle"].setdefault(str(path), []).append((conn_generation, conn))
+            return
+    conn.close()
+
+
+@contextmanager
+def _search_connection(path=None):
+    path = path or RECIPE_NLG_INDEX_PATH
+    conn_generation, conn = _acquire_search_connection(path)
+    try:
+        yield conn
+    finally:
+        _release_search_connection(path, conn_generation, conn)
+
+
+def _drain_search_index_runtime():
+    with _SEARCH_INDEX_STATE_LOCK:
+        _SEARCH_INDEX_RUNTIME["generation"] += 1
+        _SEARCH_CONNECTION_POOL["generation"] = _SEARCH_INDEX_RUNTIME["generation"]
+        stale = [conn for idle in _SEARCH_CONNECTION_POOL["idle"].values() for _, conn in idle]
+        _SEARCH_CONNECTION_POOL["idle"] = {}
+        _SEARCH_INDEX_STATUS_CACHE["status"] = None
+    for conn in stale:
+        conn.close()
+    _search_recipenlg_candidates_cached.cache_clear()
+
+
+def _update_build_progress(**values):
+    with _SEARCH_INDEX_STATE_LOCK:
+        _SEARCH_INDEX_BUILD.update(values)
+
+
+def _shard_for_title(title, shard_count):
+    # Hashing the normalized title keeps same-title recipes in one shard.
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(normalize(title).encode("utf-8")) % shard_count
+
+
+def _shard_file_names(metadata):
+    try:
+        names = json.loads(metadata.get("shard_files", "[]") or "[]")
+    except ValueError:
+        return []
+    return [str(name) for name in names] if isinstance(names, list) else []
+
+
+def _configure_build_connection(conn):
+    # Keep the rollback journal so a killed build leaves the last checkpoint intact for resuming.
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _create_search_index_tables(conn):
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    # Contentless FTS: only searchable fields are tokenized, full recipes live in recipenlg_docs.
+    # Porter stems both indexed and query terms, so searches never need open-ended `token*` wildcards.
+    conn.execute(
+        f"""
+        CREATE VIRTUAL TABLE recipenlg_fts USING fts5(
+            title,
+            ingredients_text,
+            ner_text,
+            category_tags,
+            content='',
+            tokenize='{RECIPE_NLG_FTS_TOKENIZER}',
+            prefix='{RECIPE_NLG_FTS_PREFIX}'
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE recipenlg_docs (
+            id INTEGER PRIMARY KEY,
+            cluster_id INTEGER NOT NULL,
+            ingredient_count INTEGER NOT NULL,
+            body BLOB NOT NULL
+        )
+        """
+    )
+    # Integer posting lists of normalized NER ingredients; recipe_size makes containment scoring index-only.
+    conn.execute(
+        """
+        CREATE TABLE recipenlg_postings (
+            ingredient_id INTEGER NOT NULL,
+            recipe_id INTEGER NOT NULL,
+            recipe_size INTEGER NOT NULL,
+            PRIMARY KEY (ingredient_id, recipe_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _create_ingredient_vocab_table(conn):
+    # The vocabulary is global across shards, so it lives in the main file only.
+    conn.execute("CREATE TABLE recipenlg_ingredients (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, head TEXT NOT NULL)")
+    conn.execute("CREATE INDEX recipenlg_ingredients_head ON recipenlg_ingredients(head)")
+
+
+def _create_cluster_tables(conn, schema="main"):
+    # Build-time only: LSH buckets and representative signatures live in a side file so a resumed
+    # build keeps assigning the same clusters, and the served index does not carry them.
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.recipenlg_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            cluster_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {schema}.recipenlg_minhash (cluster_id INTEGER PRIMARY KEY, signature BLOB NOT NULL)"
+    )
+
+
+def _encode_recipe_document(title, ingredients, directions, ner, category_tags, source):
+    payload = json.dumps(
+        [title, ingredients, directions, ner, category_tags, source],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    compressor = zlib.compressobj(RECIPE_NLG_DOC_COMPRESSION_LEVEL, zdict=RECIPE_NLG_DOC_ZDICT)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def _decode_recipe_document(body):
+    decompressor = zlib.decompressobj(zdict=RECIPE_NLG_DOC_ZDICT)
+    payload = decompressor.decompress(body) + decompressor.flush()
+    title, ingredients, directions, ner, category_tags, source = json.loads(payload.decode("utf-8"))
+    return {
+        "title": title,
+        "ingredients": ingredients,
+        "directions": directions,
+        "ner": ner,
+        "category_tags": category_tags,
+        "source": source,
+    }
+
+
+def _index_row(row_id, row):
+    title = str(row.get("title", "")).strip()
+    if not title:
+        return None
+    ingredients = _parse_list_like(row.get("ingredients", ""))
+    directions = _parse_list_like(row.get("directions", ""))
+    ner = _parse_list_like(row.get("NER", ""))
+    source = str(row.get("source", "")).strip()
+    ingredients_text = " ".join(ingredients)
+    ner_text = " ".join(ner)
+    category_tags = _compute_dataset_tags(title, ingredients_text, ner_text)
+    return (
+        (row_id, title, ingredients_text, ner_text, category_tags),
+        (row_id, _encode_recipe_document(title, ingredients, directions, ner, category_tags.split(), source)),
+        _minhash_signature(_recipe_shingles(title, ner or ingredients)),
+        recipe_ingredient_names(ner),
+    )
+
+
+def _singularize(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("oes"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _ingredient_head(name):
+    tokens = tokenize(name)
+    return _singularize(tokens[-1]) if tokens else ""
+
+
+def recipe_ingredient_names(ner):
+    names = []
+    for item in ner:
+        name = " ".join(tokenize(item))
+        if name and name not in RECIPE_NLG_PANTRY_STAPLES and name not in names:
+            names.append(name)
+    return names
+
+
+def recipe_vector_terms(item):
+    """Singular title and NER ingredient words: the bag of words behind approximate-neighbour vectors."""
+    words = tokenize(item.get("title", ""))
+    words.extend(word for name in recipe_ingredient_names(item.get("ner", [])) for word in name.split())
+    return list(dict.fromkeys(_singularize(word) for word in words if len(word) >= 3 and word not in STOP_TOKENS))
+
+
+def _load_ingredient_vocab(conn):
+    ids = dict(conn.execute("SELECT name, id FROM recipenlg_ingredients").fetchall())
+    return {"ids": ids, "next_id": max(ids.values(), default=0) + 1, "pending": []}
+
+
+def _ingredient_ids(names, vocab):
+    # Ids follow first appearance in CSV order, so a resumed build replays the same assignments.
+    ids = []
+    for name in names:
+        ingredient_id = vocab["ids"].get(name)
+        if ingredient_id is None:
+            ingredient_id = vocab["next_id"]
+            vocab["next_id"] += 1
+            vocab["ids"][name] = ingredient_id
+            vocab["pending"].append((ingredient_id, name, _ingredient_head(name)))
+        ids.append(ingredient_id)
+    return ids
+
+
+def _write_ingredient_vocab(conn, vocab):
+    conn.executemany("INSERT OR IGNORE INTO recipenlg_ingredients(id, name, head) VALUES (?, ?, ?)", vocab["pending"])
+    vocab["pending"].clear()
+
+
+def _recipe_shingles(title, ingredients):
+    shingles = {f"t:{token}" for token in tokenize(title)}
+    shingles.update(f"i:{normalize(item)}" for item in ingredients if str(item).strip())
+    return shingles
+
+
+@lru_cache(maxsize=1)
+def _minhash_seeds():
+    rng = random.Random(RECIPE_NLG_MINHASH_SEED)
+    return tuple(
+        (rng.randrange(1, _MINHASH_PRIME), rng.randrange(0, _MINHASH_PRIME))
+        for _ in range(RECIPE_NLG_MINHASH_PERMUTATIONS)
+    )
+
+
+def _minhash_signature(shingles):
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles] or [0]
+    return tuple(min((a * value + b) % _MINHASH_PRIME for value in hashes) for a, b in _minhash_seeds())
+
+
+def _lsh_band_buckets(signature):
+    rows = len(signature) // RECIPE_NLG_MINHASH_BANDS
+    return [
+        zlib.crc32(struct.pack(f"<{rows}Q", *signature[band * rows : (band + 1) * rows]))
+        for band in range(RECIPE_NLG_MINHASH_BANDS)
+    ]
+
+
+def _minhash_similarity(left, right):
+    return sum(1 for a, b in zip(left, right) if a == b) / max(len(left), 1)
+
+
+def _new_cluster_state():
+    return {"buckets": {}, "signatures": {}}
+
+
+def _assign_recipe_cluster(conn, row_id, signature, pending):
+    """Cluster id of a recipe: the row id of the first earlier near-duplicate, or its own row id."""
+    buckets = _lsh_band_buckets(signature)
+    owners = {}
+    for band, bucket in enumerate(buckets):
+        owner = pending["buckets"].get((band, bucket))
+        if owner is None:
+            found = conn.execute(
+                "SELECT cluster_id FROM lsh.recipenlg_lsh WHERE band = ? AND bucket = ?",
+                (band, bucket),
+            ).fetchone()
+            owner = found[0] if found else None
+        owners[band] = owner
+
+    # Only clusters founded by earlier rows count, so replaying rows after a resume is deterministic.
+    for cluster_id in sorted({owner for owner in owners.values() if owner is not None and owner <= row_id}):
+        cluster_signature = pending["signatures"].get(cluster_id)
+        if cluster_signature is None:
+            found = conn.execute(
+                "SELECT signature FROM lsh.recipenlg_minhash WHERE cluster_id = ?",
+                (cluster_id,),
+            ).fetchone()
+            if not found:
+                continue
+            cluster_signature = struct.unpack(f"<{RECIPE_NLG_MINHASH_PERMUTATIONS}Q", found[0])
+        if _minhash_similarity(signature, cluster_signature) >= RECIPE_NLG_DUPLICATE_THRESHOLD:
+            return cluster_id
+
+    pending["signatures"][row_id] = signature
+    for band, bucket in enumerate(buckets):
+        if owners[band] is None:
+            pending["buckets"][(band, bucket)] = row_id
+    return row_id
+
+
+def _write_cluster_state(conn, pending):
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh.recipenlg_lsh(band, bucket, cluster_id) VALUES (?, ?, ?)",
+        [(band, bucket, cluster_id) for (band, bucket), cluster_id in pending["buckets"].items()],
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh.recipenlg_minhash(cluster_id, signature) VALUES (?, ?)",
+        [
+            (cluster_id, struct.pack(f"<{RECIPE_NLG_MINHASH_PERMUTATIONS}Q", *signature))
+            for cluster_id, signature in pending["signatures"].items()
+        ],
+    )
+    pending["buckets"].clear()
+    pending["signatures"].clear()
+
+
+def _write_index_meta(conn, items):
+    conn.executemany("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", [(key, str(value)) for key, value in items])
 
+
+def _insert_index_batch(conn, batch):
+    conn.executemany(
+        """
+        INSERT INTO recipenlg_fts(rowid, title, ingredients_text, ner_text, category_tags)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [fts_row for fts_row, _, _ in batch],
+    )
+    conn.executemany(
+        "INSERT INTO recipenlg_docs(id, cluster_id, ingredient_count, body) VALUES (?, ?, ?, ?)",
+        [doc_row for _, doc_row, _ in batch],
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO recipenlg_postings(ingredient_id, recipe_id, recipe_size) VALUES (?, ?, ?)",
+        [posting for _, _, postings in batch for posting in postings],
+    )
+
+
+def _flush_index_batches(connections, batches, checkpoint, cluster_state, vocab):
+    # Each shard commits its rows together with the checkpoint, so every shard file is self-consistent.
+    # Cluster state and the ingredient vocabulary go through the main file's connection and commit with it.
+    _write_cluster_state(connections[0], cluster_state)
+    _write_ingredient_vocab(connections[0], vocab)
+    for conn, batch in zip(connections, batches):
+        if batch:
+            _insert_index_batch(conn, batch)
+            batch.clear()
+        _write_index_meta(conn, checkpoint.items())
+        conn.commit()
+
+
+def _read_csv_header(dataset_path):
+    with open(dataset_path, "rb") as file:
+        header = file.readline()
+    fieldnames = next(csv.reader([header.decode("utf-8", errors="ignore")]), [])
+    return fieldnames, len(header)
+
+
+def _iter_csv_rows(dataset_path, fieldnames, start_offset):
+    """Yield (row, end_offset) from a byte offset; malformed rows come back as None."""
+    with open(dataset_path, "rb") as file:
+        file.seek(start_offset)
+        consumed = [start_offset]
+
+        def lines():
+            for raw_line in file:
+                consumed[0] += len(raw_line)
+                yield raw_line.decode("utf-8", errors="ignore")
+
+        reader = csv.DictReader(lines(), fieldnames=fieldnames)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                row = None
+            yield row, consumed[0]
+
+
+def _iter_recipenlg_rows(dataset_path, fieldnames, start_offset):
+    """Rows from a CSV byte offset, read from the columnar snapshot when it mirrors this exact CSV."""
+    snapshot = get_recipenlg_snapshot(dataset_path)
+    if snapshot is None or snapshot["metadata"].get("fieldnames") != fieldnames:
+        yield from _iter_csv_rows(dataset_path, fieldnames, start_offset)
+        return
+    columns = [name for name in fieldnames if name]
+    yield from iter_snapshot_rows(snapshot, columns, start=snapshot_row_for_offset(snapshot, start_offset))
+
+
+def _build_checkpoint_meta(offset, row_id, rows, skipped):
+    return {
+        "checkpoint_offset": offset,
+        "checkpoint_row_id": row_id,
+        "checkpoint_rows": rows,
+        "checkpoint_skipped": skipped,
+    }
+
+
+def _resume_build_checkpoint(temp_paths, expected, shard_count):
+    """Checkpoint of an interrupted build of the same CSV and shard layout, or None."""
+    if not all(path.exists() for path in temp_paths + [_cluster_state_path()]):
+        return None
+    metas = [_index_metadata(path) for path in temp_paths]
+    main_meta = metas[0]
+    build_id = main_meta.get("build_id")
+    if (
+        not build_id
+        or main_meta.get("build_source") != json.dumps(expected, sort_keys=True)
+        or main_meta.get("build_shard_count") != str(shard_count)
+        or any(meta.get("build_id") != build_id or "checkpoint_row_id" not in meta for meta in metas)
+    ):
+        return None
+
+    shard_row_ids = [int(meta["checkpoint_row_id"]) for meta in metas]
+    # Resume from the shard that committed least; shards that got further skip rows they already hold.
+    start_meta = metas[shard_row_ids.index(min(shard_row_ids))]
+    return {
+        "build_id": build_id,
+        "fieldnames": json.loads(main_meta.get("build_fieldnames", "[]")),
+        "offset": int(start_meta["checkpoint_offset"]),
+        "row_id": int(start_meta["checkpoint_row_id"]),
+        "rows": int(start_meta["checkpoint_rows"]),
+        "skipped": int(start_meta["checkpoint_skipped"]),
+        "shard_row_ids": shard_row_ids,
+    }
+
+
+def _report_build_progress(row_count, skipped, offset, bytes_total, run_start):
+    elapsed = max(time.monotonic() - run_start["at"], 1e-6)
+    rows_per_sec = (row_count - run_start["rows"]) / elapsed
+    bytes_per_sec = (offset - run_start["offset"]) / elapsed
+    eta_seconds = (bytes_total - offset) / bytes_per_sec if bytes_per_sec > 0 else None
+    _update_build_progress(
+        rows_done=row_count,
+        rows_skipped=skipped,
+        bytes_done=offset,
+        rows_per_sec=round(rows_per_sec, 1),
+        eta_seconds=round(max(eta_seconds, 0.0), 1) if eta_seconds is not None else None,
+    )
+
+
+def _cluster_state_path():
+    return RECIPE_NLG_INDEX_PATH.with_suffix(".tmp.lsh.sqlite3")
+
+
+def _remove_stale_shard_files(keep_names):
+    index_dir = RECIPE_NLG_INDEX_PATH.parent
+    for path in index_dir.glob(f"{RECIPE_NLG_INDEX_PATH.stem}.*.shard*.sqlite3"):
+        if path.name not in keep_names and ".tmp." not in path.name:
+            try:
+                path.unlink()
+            except OSError:
+                continue
+
+
+def _build_search_index(dataset_path, resume=True):
+    ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
+    shard_count = max(1, int(RECIPE_NLG_INDEX_SHARDS))
+    index_dir = RECIPE_NLG_INDEX_PATH.parent
+    temp_paths = [RECIPE_NLG_INDEX_PATH.with_suffix(".tmp.sqlite3")] + [
+        index_dir / f"{RECIPE_NLG_INDEX_PATH.stem}.tmp.shard{idx}.sqlite3" for idx in range(1, shard_count)
+    ]
     expected = _expected_index_metadata(dataset_path)
+    checkpoint = _resume_build_checkpoint(temp_paths, expected, shard_count) if resume else None
+    if checkpoint is None:
+        for temp_path in temp_paths + [_cluster_state_path()]:
+            if temp_path.exists():
+                temp_path.unlink()
+        fieldnames, header_offset = _read_csv_header(dataset_path)
+        checkpoint = {
+            "build_id": f"{time.time_ns():x}",
+            "fieldnames": fieldnames,
+            "offset": header_offset,
+            "row_id": 0,
+            "rows": 0,
+            "skipped": 0,
+            "shard_row_ids": [0] * shard_count,
+        }
+
+    build_id = checkpoint["build_id"]
+    shard_names = [f"{RECIPE_NLG_INDEX_PATH.stem}.{build_id}.shard{idx}.sqlite3" for idx in range(1, shard_count)]
+    previous_shard_names = _shard_file_names(_index_metadata(RECIPE_NLG_INDEX_PATH))
     started_at = str(int(time.time()))
-    row_count = 0
-    _SEARCH_INDEX_RUNTIME["last_error"] = None
+    offset = checkpoint["offset"]
+    row_id = checkpoint["row_id"]
+    row_count = checkpoint["rows"]
+    skipped = checkpoint["skipped"]
+    shard_row_ids = checkpoint["shard_row_ids"]
+    bytes_total = int(expected["source_size"])
+    run_start = {"at": time.monotonic(), "rows": row_count, "offset": offset}
+    _update_build_progress(resumed_from_rows=row_count, bytes_total=bytes_total)
+    _report_build_progress(row_count, skipped, offset, bytes_total, run_start)
+    connections = []
 
     try:
-        with sqlite3.connect(str(temp_path)) as conn:
-            conn.execute("PRAGMA journal_mode=OFF")
-            conn.execute("PRAGMA synchronous=OFF")
-            conn.execute("PRAGMA temp_store=MEMORY")
-            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
-            conn.execute(
-                """
-                CREATE VIRTUAL TABLE recipenlg_fts USING fts5(
-                    title,
-                    ingredients_text,
-                    directions_text,
-                    ner_text,
-                    category_tags,
-                    source UNINDEXED,
-                    tokenize='unicode61'
+        for shard_idx, temp_path in enumerate(temp_paths):
+            is_new = not temp_path.exists()
+            conn = sqlite3.connect(str(temp_path))
+            connections.append(conn)
+            _configure_build_connection(conn)
+            if is_new:
+                _create_search_index_tables(conn)
+                if shard_idx == 0:
+                    _create_ingredient_vocab_table(conn)
+                identity = [("build_id", build_id), ("shard_index", shard_idx)]
+                if shard_idx == 0:
+                    identity += [
+                        ("build_source", json.dumps(expected, sort_keys=True)),
+                        ("build_shard_count", shard_count),
+                        ("build_fieldnames", json.dumps(checkpoint["fieldnames"])),
+                    ]
+                _write_index_meta(conn, identity)
+                _write_index_meta(conn, _build_checkpoint_meta(offset, row_id, row_count, skipped).items())
+                conn.commit()
+
+        connections[0].execute("ATTACH DATABASE ? AS lsh", (str(_cluster_state_path()),))
+        connections[0].execute("PRAGMA lsh.journal_mode=DELETE")
+        connections[0].execute("PRAGMA lsh.synchronous=OFF")
+        _create_cluster_tables(connections[0], schema="lsh")
+        connections[0].commit()
+        cluster_state = _new_cluster_state()
+        vocab = _load_ingredient_vocab(connections[0])
+
+        batches = [[] for _ in connections]
+        pending = 0
+        for row, offset in _iter_recipenlg_rows(dataset_path, checkpoint["fieldnames"], checkpoint["offset"]):
+            row_id += 1
+            if row is None:
+                skipped += 1
+                continue
+            index_row = _index_row(row_id, row)
+            if index_row is None:
+                continue
+
+            fts_row, (_, body), signature, ingredient_names = index_row
+            cluster_id = _assign_recipe_cluster(connections[0], row_id, signature, cluster_state)
+            ingredient_ids = _ingredient_ids(ingredient_names, vocab)
+            shard_idx = _shard_for_title(fts_row[1], shard_count)
+            if row_id <= shard_row_ids[shard_idx]:
+                row_count += 1
+                continue
+            recipe_size = len(ingredient_ids)
+            batches[shard_idx].append(
+                (
+                    fts_row,
+                    (row_id, cluster_id, recipe_size, body),
+                    [(ingredient_id, row_id, recipe_size) for ingredient_id in ingredient_ids],
                 )
-                """
             )
+            pending += 1
+            if pending >= RECIPE_NLG_INDEX_BATCH_SIZE:
+                row_count += pending
+                pending = 0
+                _flush_index_batches(
+                    connections, batches, _build_checkpoint_meta(offset, row_id, row_count, skipped), cluster_state, vocab
+                )
+                _report_build_progress(row_count, skipped, offset, bytes_total, run_start)
 
-            batch = []
-            with open(dataset_path, "r", encoding="utf-8", errors="ignore") as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    title = str(row.get("title", "")).strip()
-                    ingredients_text = str(row.get("ingredients", "")).strip()
-                    directions_text = str(row.get("directions", "")).strip()
-                    ner_text = str(row.get("NER", "")).strip()
-                    source = str(row.get("source", "")).strip()
-                    if not title:
-                        continue
-
-                    batch.append(
-                        (
-                            title,
-                            ingredients_text,
-                            directions_text,
-                            ner_text,
-                            _compute_dataset_tags(title, ingredients_text, ner_text),
-                            source,
-                        )
-                    )
-                    if len(batch) >= RECIPE_NLG_INDEX_BATCH_SIZE:
-                        conn.executemany(
-                            """
-                            INSERT INTO recipenlg_fts(
-                                title, ingredients_text, directions_text, ner_text, category_tags, source
-                            ) VALUES (?, ?, ?, ?, ?, ?)
-                            """,
-                            batch,
-                        )
-                        conn.commit()
-                        row_count += len(batch)
-                        batch = []
-
-                if batch:
-                    conn.executemany(
-                        """
-                        INSERT INTO recipenlg_fts(
-                            title, ingredients_text, directions_text, ner_text, category_tags, source
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        batch,
-                    )
-                    conn.commit()
-                    row_count += len(batch)
-
-            metadata_rows = list(expected.items()) + [
-                ("row_count", str(row_count)),
-                ("built_at", started_at),
-            ]
-            conn.executemany("INSERT INTO meta(key, value) VALUES (?, ?)", metadata_rows)
+        row_count += pending
+        _flush_index_batches(
+            connections, batches, _build_checkpoint_meta(offset, row_id, row_count, skipped), cluster_state, vocab
+        )
+        _report_build_progress(row_count, skipped, offset, bytes_total, run_start)
+        cluster_count = connections[0].execute("SELECT COUNT(*) FROM lsh.recipenlg_minhash").fetchone()[0]
+        connections[0].execute("DETACH DATABASE lsh")
+
+        metadata_rows = list(expected.items()) + [
+            ("row_count", row_count),
+            ("skipped_rows", skipped),
+            ("cluster_count", cluster_count),
+            ("built_at", started_at),
+            ("shard_count", shard_count),
+            ("shard_files", json.dumps(shard_names)),
+        ]
+        for shard_idx, conn in enumerate(connections):
+            conn.execute("DELETE FROM meta WHERE key LIKE 'checkpoint_%' OR (key LIKE 'build_%' AND key != 'build_id')")
+            if shard_idx == 0:
+                _write_index_meta(conn, metadata_rows)
             conn.execute("INSERT INTO recipenlg_fts(recipenlg_fts) VALUES ('optimize')")
             conn.commit()
-
-        temp_path.replace(RECIPE_NLG_INDEX_PATH)
+            conn.close()
+        connections = []
+
+        # Shard files get build-unique names; the main file is swapped last and is the commit point.
+        # os.replace is atomic: readers holding the old files keep them open until their connection is drained.
+        for temp_path, shard_name in zip(temp_paths[1:], shard_names):
+            temp_path.replace(index_dir / shard_name)
+        temp_paths[0].replace(RECIPE_NLG_INDEX_PATH)
+        _cluster_state_path().unlink()
     except (OSError, sqlite3.Error, csv.Error) as exc:
-        _SEARCH_INDEX_RUNTIME["last_error"] = str(exc)
-        if temp_path.exists():
-            temp_path.unlink()
-        return get_search_index_status()
+        # Temp files keep their last checkpoint, so the next build resumes instead of starting over.
+        for conn in connections:
+            conn.close()
+        return str(exc)
+
+    # The previous generation's shards stay until the next swap for processes that have not revalidated yet.
+    _remove_stale_shard_files(set(shard_names) | set(previous_shard_names))
+    _SEARCH_INDEX_RUNTIME["index_signature"] = _search_index_signature()
+    _drain_search_index_runtime()
+    return None
+
+
+def ensure_recipenlg_search_index(force_rebuild=False):
+    dataset_path = recipenlg_csv_path()
+    if dataset_path is None:
+        _SEARCH_INDEX_RUNTIME["last_error"] = "RecipeNLG CSV not found"
+        return get_search_index_status(refresh=True)
+
+    with _SEARCH_INDEX_BUILD_LOCK:
+        current_status = get_search_index_status(refresh=True)
+        if current_status["ready"] and not force_rebuild:
+            return current_status
+
+        # Without a servable index there is nothing to fall back to, so wait for another builder.
+        with _search_index_build_lock(blocking=not current_status["serving"]) as acquired:
+            if not acquired:
+                _update_build_progress(state="external", finished_at=None, last_error=None)
+                return current_status
+
+            current_status = get_search_index_status(refresh=True)
+            if current_status["ready"] and not force_rebuild:
+                return current_status
+
+            _update_build_progress(
+                state="running",
+                force_rebuild=bool(force_rebuild),
+                rows_done=0,
+                rows_skipped=0,
+                resumed_from_rows=0,
+                bytes_done=0,
+                bytes_total=0,
+                rows_per_sec=0.0,
+                eta_seconds=None,
+                started_at=time.time(),
+                finished_at=None,
+                last_error=None,
+            )
+            # Whatever happens, the build leaves "running" before the lock is released.
+            error = "build interrupted"
+            try:
+                error = _build_search_index(dataset_path, resume=not force_rebuild)
+            except Exception as exc:  # e.g. a corrupt checkpoint or snapshot meta.json
+                error = f"{type(exc).__name__}: {exc}"
+            finally:
+                _SEARCH_INDEX_RUNTIME["last_error"] = error
+                _update_build_progress(
+                    state="failed" if error else "done",
+                    finished_at=time.time(),
+                    last_error=error,
+                )
+    return get_search_index_status(refresh=True)
+
+
+def _run_search_index_builds(force_rebuild):
+    """Build thread body: the requested build, then any forced rebuild requested while it was running."""
+    try:
+        while True:
+            ensure_recipenlg_search_index(force_rebuild=force_rebuild)
+            with _SEARCH_INDEX_STATE_LOCK:
+                if not _SEARCH_INDEX_BUILD["force_pending"]:
+                    _SEARCH_INDEX_BUILD_THREAD["accepting"] = False
+                    return
+                _SEARCH_INDEX_BUILD["force_pending"] = False
+            force_rebuild = True
+    finally:
+        with _SEARCH_INDEX_STATE_LOCK:
+            _SEARCH_INDEX_BUILD_THREAD["accepting"] = False
+
+
+def start_search_index_build(force_rebuild=False):
+    """Start the background build, or return the running build thread.
+
+    A forced rebuild requested while a build is running is queued (`build["force_pending"]` in the status)
+    and runs on the same thread right after it, so joining the returned thread waits for it too.
+    """
+    with _SEARCH_INDEX_STATE_LOCK:
+        thread = _SEARCH_INDEX_BUILD_THREAD["thread"]
+        if thread is not None and thread.is_alive() and _SEARCH_INDEX_BUILD_THREAD["accepting"]:
+            if force_rebuild:
+                _SEARCH_INDEX_BUILD["force_pending"] = True
+            return thread
+        # A forced rebuild left pending by a failed build is not dropped either.
+        force_rebuild = force_rebuild or _SEARCH_INDEX_BUILD["force_pending"]
+        thread = threading.Thread(
+            target=_run_search_index_builds,
+            args=(force_rebuild,),
+            name="recipenlg-index-builder",
+            daemon=True,
+        )
+        _SEARCH_INDEX_BUILD_THREAD.update({"thread": thread, "accepting": True})
+        _SEARCH_INDEX_BUILD["force_pending"] = False
+        thread.start()
+    return thread
+
+
+def _serving_search_index_status():
+    status = _cached_search_index_status()
+    if not status["needs_rebuild"] or status["source_path"] is None:
+        return status
+
+    thread = start_search_index_build()
+    if status["serving"]:
+        return status
+
+    # Nothing to serve yet (first build or schema change): wait for the background build.
+    thread.join()
+    return _cached_search_index_status(refresh=True)
+
+
+@lru_cache(maxsize=1)
+def _search_shard_executor():
+    return ThreadPoolExecutor(max_workers=RECIPE_NLG_SHARD_QUERY_WORKERS, thread_name_prefix="recipenlg-shard")
+
+
+def _fused_search_sql(strategy_count):
+    arms = [
+        f"""
+            SELECT * FROM (
+                SELECT rowid, {strategy} AS strategy, bm25(recipenlg_fts) AS rank
+                FROM recipenlg_fts
+                WHERE recipenlg_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            )
+        """
+        for strategy in range(strategy_count)
+    ]
+    return " UNION ALL ".join(arms)
+
+
+def _query_search_shard_hits(path, fts_queries, limit):
+    params = []
+    for fts_query in fts_queries:
+        params.extend((fts_query, limit))
+    sql = f"""
+        SELECT hits.rowid AS rowid, hits.strategy AS strategy, hits.rank AS rank, docs.cluster_id AS cluster_id
+        FROM ({_fused_search_sql(len(fts_queries))}) AS hits
+        JOIN recipenlg_docs AS docs ON docs.id = hits.rowid
+    """
+    with _search_connection(path) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [(path, row["rowid"], row["strategy"], row["rank"], row["cluster_id"]) for row in rows]
+
+
+def _fetch_search_documents(path, row_ids):
+    placeholders = ", ".join("?" for _ in row_ids)
+    with _search_connection(path) as conn:
+        rows = conn.execute(f"SELECT id, body FROM recipenlg_docs WHERE id IN ({placeholders})", list(row_ids)).fetchall()
+    return {row["id"]: row["body"] for row in rows}
+
+
+def _map_search_shards(func, jobs):
+    if len(jobs) <= 1:
+        return [func(*args) for args in jobs]
+    executor = _search_shard_executor()
+    futures = [executor.submit(func, *args) for args in jobs]
+    return [future.result() for future in futures]
+
+
+def _fuse_search_hits(hits, limit):
+    """Reciprocal-rank fusion of per-strategy hit lists, one row per near-duplicate cluster."""
+    by_strategy = {}
+    for hit in hits:
+        by_strategy.setdefault(hit[2], []).append(hit)
+
+    fused = {}
+    for strategy_hits in by_strategy.values():
+        # bm25 is shard-local, but hash partitions share term statistics closely enough to merge on it.
+        strategy_hits.sort(key=lambda hit: hit[3])
+        for position, (path, row_id, _, rank, cluster_id) in enumerate(strategy_hits[:limit], start=1):
+            entry = fused.setdefault(row_id, {"path": path, "rrf": 0.0, "rank": rank, "cluster_id": cluster_id})
+            entry["rrf"] += 1.0 / (RECIPE_NLG_RRF_K + position)
+            entry["rank"] = min(entry["rank"], rank)
+
+    ordered = sorted(fused.items(), key=lambda pair: (-pair[1]["rrf"], pair[1]["rank"], pair[0]))
+    representatives = []
+    seen_clusters = set()
+    for row_id, entry in ordered:
+        if entry["cluster_id"] in seen_clusters:
+            continue
+        seen_clusters.add(entry["cluster_id"])
+        representatives.append((row_id, entry))
+        if len(representatives) >= limit:
+            break
+    return representatives
 
-    _SEARCH_INDEX_RUNTIME["last_error"] = None
-    return get_search_index_status()
+
+def _query_search_shards(shard_paths, fts_queries, limit):
+    hit_lists = _map_search_shards(
+        _query_search_shard_hits,
+        [(path, fts_queries, limit) for path in shard_paths],
+    )
+    fused = _fuse_search_hits([hit for hits in hit_lists for hit in hits], limit)
+
+    row_ids_by_path = {}
+    for row_id, entry in fused:
+        row_ids_by_path.setdefault(entry["path"], []).append(row_id)
+    bodies = {}
+    for shard_bodies in _map_search_shards(_fetch_search_documents, list(row_ids_by_path.items())):
+        bodies.update(shard_bodies)
+
+    return [
+        {
+            "rowid": row_id,
+            "body": bodies[row_id],
+            "rank": entry["rank"],
+            "rrf": entry["rrf"],
+            "cluster_id": entry["cluster_id"],
+        }
+        for row_id, entry in fused
+        if row_id in bodies
+    ]
 
 
 def _dataset_recipe_document(item):
@@ -737,7 +1871,7 @@ def _dataset_rule_score(item, include_ingredients=None, exclude_ingredients=None
     return sum(signals) / len(signals) if signals else 0.0
 
 
-def _dataset_match_reason(item, include_ingredients, meal_type, cosine_score, fuzzy_score):
+def _dataset_match_reason(item, include_ingredients, meal_type, cosine_score, fuzzy_score, substitutions=None):
     reasons = []
     ingredient_set = _expand_dataset_alias_tokens(item.get("ingredients", []))
 
@@ -748,6 +1882,12 @@ def _dataset_match_reason(item, include_ingredients, meal_type, cosine_score, fu
         if matched:
             reasons.append(f"совпали ингредиенты: {', '.join(matched)}")
 
+    recipe_names = set(recipe_ingredient_names(item.get("ner", [])))
+    for excluded, substitutes in (substitutions or {}).items():
+        used = [entry["ingredient_ru"] for entry in substitutes if entry["ingredient"] in recipe_names]
+        if used:
+            reasons.append(f"вместо «{excluded}»: {', '.join(used)}")
+
     if meal_type and _dataset_recipe_matches_meal(item, meal_type):
         reasons.append(f"подходит под прием пищи: {meal_type}")
 
@@ -808,6 +1948,245 @@ def _candidate_search_score(item, query_text, query_tokens):
     return (2.5 * _title_phrase_score(item, query_text, query_tokens)) + overlap
 
 
+def _build_fts_queries(profile, meal_type):
+    fts_queries = []
+    if profile["category_key"]:
+        fts_queries.append(f"category_tags:{profile['category_key']}")
+    if meal_type and meal_type in MEAL_TAGS:
+        fts_queries.append(f"category_tags:{MEAL_TAGS[meal_type]}")
+    safe_tokens = [token for token in profile["search_tokens"] if re.fullmatch(r"[a-z0-9]+", token)]
+    if len(safe_tokens) >= 2:
+        fts_queries.append(" ".join(safe_tokens[:4]))
+    if safe_tokens:
+        fts_queries.append(" OR ".join(safe_tokens[:6]))
+    return fts_queries
+
+
+def recipe_feature_ids(terms):
+    mask = (1 << RECIPE_NLG_ANN_HASH_BITS) - 1
+    return np.asarray([zlib.crc32(term.encode("utf-8")) & mask for term in terms], dtype=np.int64)
+
+
+def recipe_feature_signs(feature_ids):
+    """Random-projection rows (+1/-1) of hashed features, derived from the feature id instead of a stored matrix."""
+    state = np.asarray(feature_ids, dtype=np.uint64) ^ np.uint64(RECIPE_NLG_ANN_SEED)
+    # splitmix64 finalizer: every output bit is an independent coin flip per feature.
+    state = state + np.uint64(0x9E3779B97F4A7C15)
+    state = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    state = (state ^ (state >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    state = state ^ (state >> np.uint64(31))
+    bits = (state[:, None] >> np.arange(RECIPE_NLG_ANN_DIMENSIONS, dtype=np.uint64)) & np.uint64(1)
+    return bits.astype(np.float32) * 2.0 - 1.0
+
+
+@lru_cache(maxsize=1)
+def _recipe_vector_hyperplanes():
+    rng = np.random.default_rng(RECIPE_NLG_ANN_SEED)
+    shape = (RECIPE_NLG_ANN_DIMENSIONS, RECIPE_NLG_ANN_TABLES * RECIPE_NLG_ANN_TABLE_BITS)
+    return rng.standard_normal(shape).astype(np.float32)
+
+
+def recipe_vector_bucket_codes(vectors):
+    """One LSH bucket code per table for each row: sign bits of the row against random hyperplanes."""
+    bits = (np.asarray(vectors, dtype=np.float32) @ _recipe_vector_hyperplanes()) > 0.0
+    bits = bits.reshape(len(bits), RECIPE_NLG_ANN_TABLES, RECIPE_NLG_ANN_TABLE_BITS)
+    weights = np.left_shift(1, np.arange(RECIPE_NLG_ANN_TABLE_BITS))
+    return (bits * weights).sum(axis=2).astype(np.uint16)
+
+
+@lru_cache(maxsize=1)
+def _load_recipe_ann_index(path, build_id):
+    # Keyed by build id: a swapped-in artifact is reopened, the old memory maps are released with the cache entry.
+    path = Path(path)
+    return {
+        name: np.load(path / f"{name}.npy", mmap_mode="r")
+        for name in ["row_ids", "cluster_ids", "vectors", "idf", "bucket_keys", "bucket_rows"]
+    }
+
+
+def _recipe_query_vector(terms, idf):
+    feature_ids = recipe_feature_ids(terms)
+    if not len(feature_ids):
+        return None
+    vector = (recipe_feature_signs(feature_ids) * idf[feature_ids][:, None]).sum(axis=0)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0.0 else None
+
+
+def _probe_recipe_buckets(ann, codes):
+    # Multi-probe: the query bucket and every bucket one flipped bit away, in each table.
+    flips = np.concatenate([[0], np.left_shift(1, np.arange(RECIPE_NLG_ANN_TABLE_BITS))]).astype(np.uint16)
+    positions = []
+    probed = 0
+    for table, code in enumerate(codes):
+        keys = ann["bucket_keys"][table]
+        probes = np.bitwise_xor(np.uint16(code), flips)
+        starts = np.searchsorted(keys, probes, side="left")
+        stops = np.searchsorted(keys, probes, side="right")
+        for start, stop in zip(starts, stops):
+            if stop > start:
+                positions.append(ann["bucket_rows"][table, start:stop])
+                probed += stop - start
+        if probed >= RECIPE_NLG_ANN_MAX_PROBE:
+            break
+    if not positions:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(positions))
+
+
+def _recipe_ann_hits(index_status, profile, limit):
+    """(row_id, score) of recipes whose vectors are closest to the query words, one per cluster."""
+    if not index_status["ann_ready"]:
+        return []
+    terms = [_singularize(token) for token in profile["search_tokens"]]
+    ann = _load_recipe_ann_index(str(recipenlg_ann_path()), index_status["build_id"])
+    query_vector = _recipe_query_vector(terms, ann["idf"])
+    if query_vector is None:
+        return []
+
+    positions = _probe_recipe_buckets(ann, recipe_vector_bucket_codes(query_vector[None, :])[0])
+    if not len(positions):
+        return []
+    scores = ann["vectors"][positions].astype(np.float32) @ query_vector
+    keep = min(len(positions), limit * 3)
+    best = np.argpartition(-scores, keep - 1)[:keep]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    hits = []
+    seen_clusters = set()
+    for position in best:
+        if scores[position] <= 0.0:
+            break
+        cluster_id = int(ann["cluster_ids"][positions[position]])
+        if cluster_id in seen_clusters:
+            continue
+        seen_clusters.add(cluster_id)
+        hits.append((int(ann["row_ids"][positions[position]]), float(scores[position])))
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+@lru_cache(maxsize=1)
+def _load_recipe_embeddings(path, build_id):
+    path = Path(path)
+    embeddings = {
+        name: np.load(path / f"{name}.npy", mmap_mode="r") for name in ["row_ids", "embeddings", "term_vectors", "idf"]
+    }
+    embeddings["term_ids"] = {str(term): term_id for term_id, term in enumerate(np.load(path / "terms.npy"))}
+    return embeddings
+
+
+def _recipe_embedding_scores(profile, row_ids):
+    """Embedding cosine between the folded-in query words and each recipe, as {row_id: score}."""
+    index_status = _cached_search_index_status()
+    if not index_status["embeddings_ready"] or not row_ids:
+        return {}
+    embeddings = _load_recipe_embeddings(str(recipenlg_embeddings_path()), index_status["build_id"])
+    term_ids = [
+        embeddings["term_ids"][term]
+        for term in dict.fromkeys(_singularize(token) for token in profile["search_tokens"])
+        if term in embeddings["term_ids"]
+    ]
+    if not term_ids:
+        return {}
+    # Fold-in: a query is projected like a recipe row, q @ V, so it lands in the same space as U * S.
+    query_vector = embeddings["idf"][term_ids] @ embeddings["term_vectors"][term_ids]
+    norm = float(np.linalg.norm(query_vector))
+    if norm <= 0.0:
+        return {}
+
+    known_ids = embeddings["row_ids"]
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(known_ids, row_ids), len(known_ids) - 1)
+    found = known_ids[positions] == row_ids
+    scores = embeddings["embeddings"][positions[found]].astype(np.float32) @ (query_vector / norm)
+    return {int(row_id): float(score) for row_id, score in zip(row_ids[found], scores)}
+
+
+@lru_cache(maxsize=1)
+def _load_ingredient_substitutions(path, build_id):
+    path = Path(path)
+    table = {name: np.load(path / f"{name}.npy") for name in ["names", "df", "substitutes", "substitute_scores"]}
+    table["names"] = [str(name) for name in table["names"]]
+    table["name_ids"] = {name: ingredient_id for ingredient_id, name in enumerate(table["names"])}
+    table["head_ids"] = {}
+    # Ids are ordered by document frequency, so the first id per head is its most common ingredient.
+    for ingredient_id, name in enumerate(table["names"]):
+        table["head_ids"].setdefault(_ingredient_head(name), ingredient_id)
+    return table
+
+
+@lru_cache(maxsize=256)
+def _ingredient_substitutes_cached(ingredient, build_id, limit):
+    table = _load_ingredient_substitutions(str(recipenlg_substitutions_path()), build_id)
+    heads = _pantry_heads([ingredient])
+    phrase = " ".join(tokenize(translate_to_en(ingredient)))
+    ingredient_ids = [table["name_ids"][name] for name in [phrase, *heads] if name in table["name_ids"]]
+    ingredient_ids = ingredient_ids or [table["head_ids"][head] for head in heads if head in table["head_ids"]]
+    if not ingredient_ids:
+        return ()
+    ingredient_id = min(ingredient_ids)
+    substitutes = []
+    for substitute_id, score in zip(table["substitutes"][ingredient_id], table["substitute_scores"][ingredient_id]):
+        if substitute_id < 0 or len(substitutes) >= limit:
+            break
+        name = table["names"][substitute_id]
+        substitutes.append({"ingredient": name, "ingredient_ru": translate_to_ru(name), "score": round(float(score), 4)})
+    return tuple(substitutes)
+
+
+def ingredient_substitutes(ingredient, limit=RECIPE_NLG_SUBSTITUTES_LIMIT):
+    """Ingredients used in the same recipes' contexts as the given one but rarely together with it (PMI)."""
+    index_status = _cached_search_index_status()
+    if not index_status["substitutions_ready"] or not str(ingredient or "").strip():
+        return []
+    return list(_ingredient_substitutes_cached(normalize(ingredient), index_status["build_id"], int(limit)))
+
+
+@lru_cache(maxsize=1)
+def _load_recipe_graph(path, build_id):
+    return load_knowledge_graph(path, version=build_id)
+
+
+def get_recipe_knowledge_graph():
+    """Default NLP data source: the ingredient/allergen/recipe graph of the current index, if built."""
+    index_status = _cached_search_index_status()
+    if not index_status["graph_ready"]:
+        return None
+    return _load_recipe_graph(str(recipenlg_graph_path()), index_status["build_id"])
+
+
+def _ann_candidates(index_status, profile, results, seen_titles):
+    """Mark FTS candidates that are also vector neighbours of the query and return the vector-only ones."""
+    hits = dict(_recipe_ann_hits(index_status, profile, RECIPE_NLG_ANN_CANDIDATES))
+    if not hits:
+        return []
+    for item in results:
+        if item["_rowid"] in hits:
+            item["_ann_score"] = hits.pop(item["_rowid"])
+    recipes = _fetch_recipes_by_id(index_status["shard_paths"], list(hits)) if hits else {}
+    ann_items = []
+    for row_id, score in hits.items():
+        item = recipes.get(row_id)
+        if item is None:
+            continue
+        key = normalize(item["title"])
+        if not key or key in seen_titles:
+            continue
+        if profile["category_key"] and not _item_matches_category(item, profile["category_key"]):
+            continue
+        item["_rowid"] = row_id
+        item["_ann_score"] = score
+        item["_search_score"] = _candidate_search_score(
+            item,
+            profile["translated_query"] or profile["query_text"],
+            profile["query_tokens"] or profile["search_tokens"],
+        )
+        ann_items.append(item)
+        seen_titles.add(key)
+    return ann_items
+
+
 @lru_cache(maxsize=64)
 def _search_recipenlg_candidates_cached(query_text, include_ingredients_key, meal_type, limit):
     profile = _dataset_query_profile(
@@ -820,82 +2199,59 @@ def _search_recipenlg_candidates_cached(query_text, include_ingredients_key, mea
     if not query_tokens and not search_tokens:
         return []
 
-    index_status = ensure_recipenlg_search_index()
-    if not index_status["ready"]:
+    index_status = _serving_search_index_status()
+    if not index_status["serving"]:
         return []
 
-    try:
-        conn = _open_search_index()
-    except sqlite3.Error as exc:
-        _SEARCH_INDEX_RUNTIME["last_error"] = str(exc)
-        return []
-
-    fts_queries = []
-    if profile["category_key"]:
-        category_query = f"category_tags:{profile['category_key']}*"
-        fts_queries.append(category_query)
-    if meal_type and meal_type in MEAL_TAGS:
-        fts_queries.append(f"category_tags:{MEAL_TAGS[meal_type]}*")
-    safe_tokens = [token for token in search_tokens if re.fullmatch(r"[a-z0-9]+", token)]
-    if len(safe_tokens) >= 2:
-        fts_queries.append(" ".join(f"{token}*" for token in safe_tokens[:4]))
-    if safe_tokens:
-        fts_queries.append(" OR ".join(f"{token}*" for token in safe_tokens[:6]))
+    fts_queries = _build_fts_queries(profile, meal_type)
 
     results = []
     seen_titles = set()
 
+    shard_paths = index_status["shard_paths"]
+    fts_queries = list(dict.fromkeys(query.strip() for query in fts_queries if query.strip()))
     try:
-        for fts_query in dict.fromkeys(query.strip() for query in fts_queries if query.strip()):
-            rows = conn.execute(
-                """
-                SELECT title, ingredients_text, directions_text, ner_text, category_tags, source,
-                       bm25(recipenlg_fts) AS rank
-                FROM recipenlg_fts
-                WHERE recipenlg_fts MATCH ?
-                ORDER BY rank
-                LIMIT ?
-                """,
-                (fts_query, RECIPE_NLG_SEARCH_POOL),
-            ).fetchall()
-            for row in rows:
-                title = str(row["title"]).strip()
-                key = normalize(title)
-                if not key or key in seen_titles:
-                    continue
-                item = {
-                    "title": title,
-                    "ingredients": _parse_list_like(row["ingredients_text"]),
-                    "directions": _parse_list_like(row["directions_text"]),
-                    "ner": _parse_list_like(row["ner_text"]),
-                    "source": str(row["source"]).strip(),
-                    "category_tags": tokenize(row["category_tags"]),
-                    "_fts_rank": float(row["rank"]),
-                }
-                if profile["category_key"] and not _item_matches_category(item, profile["category_key"]):
-                    continue
-                item["_search_score"] = _candidate_search_score(
-                    item,
-                    profile["translated_query"] or profile["query_text"],
-                    query_tokens or search_tokens,
-                )
-                results.append(item)
-                seen_titles.add(key)
-                if len(results) >= RECIPE_NLG_SEARCH_POOL:
-                    break
-            if len(results) >= RECIPE_NLG_SEARCH_POOL:
-                break
+        rows = _query_search_shards(shard_paths, fts_queries, RECIPE_NLG_SEARCH_POOL) if fts_queries else []
+        for row in rows:
+            item = _decode_recipe_document(row["body"])
+            key = normalize(item["title"])
+            if not key or key in seen_titles:
+                continue
+            item["_rowid"] = row["rowid"]
+            item["_fts_rank"] = float(row["rank"])
+            item["_rrf_score"] = float(row["rrf"])
+            if profile["category_key"] and not _item_matches_category(item, profile["category_key"]):
+                continue
+            item["_search_score"] = _candidate_search_score(
+                item,
+                profile["translated_query"] or profile["query_text"],
+                query_tokens or search_tokens,
+            )
+            results.append(item)
+            seen_titles.add(key)
     except sqlite3.Error as exc:
         _SEARCH_INDEX_RUNTIME["last_error"] = str(exc)
         return []
-    finally:
-        conn.close()
+    try:
+        ann_items = _ann_candidates(index_status, profile, results, seen_titles)
+    except (sqlite3.Error, OSError, ValueError) as exc:
+        # A missing or half-swapped ANN artifact only costs the vector-only hits, never the FTS ones.
+        _SEARCH_INDEX_RUNTIME["last_error"] = str(exc)
+        ann_items = []
 
     results.sort(
-        key=lambda item: (item.get("_search_score", 0.0), -item.get("_fts_rank", 0.0), item.get("title", "")),
+        key=lambda item: (
+            item.get("_search_score", 0.0),
+            item.get("_rrf_score", 0.0),
+            -item.get("_fts_rank", 0.0),
+            item.get("title", ""),
+        ),
         reverse=True,
     )
-    return results[:limit]
+    # Vector-only hits share no words with the FTS query and would never survive the lexical sort,
+    # so they get a capped share of the limit and lexical matches fill the rest.
+    ann_items = ann_items[: max(1, limit // RECIPE_NLG_ANN_SHARE_DIVISOR)] if limit > 0 else []
+    return results[: max(limit - len(ann_items), 0)] + ann_items
 
 
 def search_recipenlg_candidates(query_text, include_ingredients=None, limit=RECIPE_NLG_MAX_CANDIDATES):
@@ -904,6 +2260,68 @@ def search_recipenlg_candidates(query_text, include_ingredients=None, limit=RECI
     return _search_recipenlg_candidates_cached(str(query_text or ""), include_key, "", int(limit))
 
 
+def iter_indexed_recipes():
+    """Yield (row_id, cluster_id, recipe) for every recipe in the serving index, shard by shard."""
+    index_status = _serving_search_index_status()
+    if not index_status["serving"]:
+        return
+    for path in index_status["shard_paths"]:
+        with closing(sqlite3.connect(str(path))) as conn:
+            for row_id, cluster_id, body in conn.execute("SELECT id, cluster_id, body FROM recipenlg_docs ORDER BY id"):
+                yield row_id, cluster_id, _decode_recipe_document(body)
+
+
+def _fetch_recipes_by_id(shard_paths, row_ids):
+    bodies = {}
+    for shard_bodies in _map_search_shards(_fetch_search_documents, [(path, row_ids) for path in shard_paths]):
+        bodies.update(shard_bodies)
+    return {row_id: _decode_recipe_document(body) for row_id, body in bodies.items()}
+
+
+def _recipe_neighbors(seed_row_id):
+    with _search_connection(recipenlg_neighbors_path()) as conn:
+        rows = conn.execute(
+            "SELECT neighbor_id, score FROM recipenlg_neighbors WHERE recipe_id = ? ORDER BY rank",
+            (seed_row_id,),
+        ).fetchall()
+    return [(row["neighbor_id"], row["score"]) for row in rows]
+
+
+def _neighbor_candidates(candidates, profile):
+    """Seed recipe named by the query plus its precomputed neighbours, or None to keep FTS candidates."""
+    index_status = _cached_search_index_status()
+    if not index_status["neighbors_ready"]:
+        return None
+
+    query_text = profile["translated_query"] or profile["query_text"]
+    query_tokens = profile["query_tokens"] or profile["search_tokens"]
+    seed = next(
+        (
+            item
+            for item in candidates
+            if "_rowid" in item and _title_phrase_score(item, query_text, query_tokens) >= RECIPE_NLG_SEED_TITLE_SCORE
+        ),
+        None,
+    )
+    if seed is None:
+        return None
+
+    try:
+        neighbors = _recipe_neighbors(seed["_rowid"])
+        if not neighbors:
+            return None
+        recipes = _fetch_recipes_by_id(index_status["shard_paths"], [row_id for row_id, _ in neighbors])
+    except sqlite3.Error as exc:
+        _SEARCH_INDEX_RUNTIME["last_error"] = str(exc)
+        return None
+
+    selected = [dict(seed, _neighbor_score=1.0, _neighbor_seed=True)]
+    for row_id, score in neighbors:
+        if row_id in recipes:
+            selected.append(dict(recipes[row_id], _rowid=row_id, _neighbor_score=float(score)))
+    return selected
+
+
 def rank_recipenlg_candidates(
     query_text,
     include_ingredients=None,
@@ -911,6 +2329,7 @@ def rank_recipenlg_candidates(
     exclude_titles=None,
     meal_type=None,
     limit=8,
+    similar_to_seed=False,
 ):
     include_ingredients = include_ingredients or []
     exclude_ingredients = exclude_ingredients or []
@@ -925,7 +2344,13 @@ def rank_recipenlg_candidates(
         return []
 
     profile = _dataset_query_profile(query_text, include_ingredients=include_ingredients, meal_type=meal_type)
+    if similar_to_seed:
+        # "похожие на плов": when the query names a concrete recipe, score only its offline neighbours.
+        candidates = _neighbor_candidates(candidates, profile) or candidates
     query_tokens = profile["query_tokens"] or profile["search_tokens"]
+    substitutions = {entry: ingredient_substitutes(entry) for entry in exclude_ingredients}
+    substitutions = {entry: substitutes for entry, substitutes in substitutions.items() if substitutes}
+    embedding_scores = _recipe_embedding_scores(profile, [item["_rowid"] for item in candidates if "_rowid" in item])
     dataset_query_text = " ".join(query_tokens)
     query_vector = vectorize_text(dataset_query_text)
     query_normalized = normalize(dataset_query_text)
@@ -968,6 +2393,12 @@ def rank_recipenlg_candidates(
             + (0.2 * title_score)
             + (0.1 * category_score)
         )
+        if "_neighbor_score" in item:
+            total_score += 0.2 * item["_neighbor_score"]
+        if "_ann_score" in item:
+            total_score += 0.15 * item["_ann_score"]
+        embedding_score = max(embedding_scores.get(item.get("_rowid"), 0.0), 0.0)
+        total_score += 0.15 * embedding_score
         ranked.append(
             {
                 "title": item.get("title", ""),
@@ -987,9 +2418,18 @@ def rank_recipenlg_candidates(
                     meal_type,
                     cosine_score,
                     fuzzy_score,
+                    substitutions=substitutions,
                 ),
             }
         )
+        if "_neighbor_score" in item:
+            ranked[-1]["neighbor_score"] = round(item["_neighbor_score"], 4)
+        if item.get("_neighbor_seed"):
+            ranked[-1]["neighbor_seed"] = True
+        if "_ann_score" in item:
+            ranked[-1]["ann_score"] = round(item["_ann_score"], 4)
+        if embedding_scores:
+            ranked[-1]["embedding_score"] = round(embedding_score, 4)
 
     ranked.sort(
         key=lambda item: (item["total_score"], item["cosine_similarity"], item["fuzzy_score"]),
@@ -998,6 +2438,158 @@ def rank_recipenlg_candidates(
     return [localize_recipenlg_item(item, with_details=False) for item in ranked[:limit]]
 
 
+def _pantry_heads(items):
+    heads = set()
+    for item in items:
+        tokens = tokenize(item) + tokenize(translate_to_en(item))
+        tokens.extend(
+            normalize(alias)
+            for token in list(tokens)
+            for stem, aliases in DATASET_TOKEN_ALIASES.items()
+            if token.startswith(stem)
+            for alias in aliases
+        )
+        heads.update(
+            _singularize(token)
+            for token in tokens
+            if re.fullmatch(r"[a-z0-9]+", token) and len(token) >= 3 and token not in STOP_TOKENS
+        )
+    return heads
+
+
+def _word_forms(head):
+    """The singular head and the plurals _singularize folds into it ("egg" -> "eggs", "berry" -> "berries")."""
+    forms = {head, f"{head}s", f"{head}es"}
+    if head.endswith("y"):
+        forms.add(f"{head[:-1]}ies")
+    return forms
+
+
+def _like_escape(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _pantry_ingredient_id_list(main_path, heads, match_any_word=False):
+    if not heads:
+        return []
+    sql = "SELECT id FROM recipenlg_ingredients WHERE head IN (SELECT value FROM json_each(?1))"
+    params = [json.dumps(sorted(heads))]
+    if match_any_word:
+        # Exclusions are stricter: "feta" must also rule out "feta cheese", not only ingredients headed by it.
+        # Whole words only, so excluding "egg" keeps "eggplant".
+        sql += (
+            " OR EXISTS (SELECT 1 FROM json_each(?2) AS words"
+            " WHERE ' ' || name || ' ' LIKE '% ' || words.value || ' %' ESCAPE '\\')"
+        )
+        params.append(json.dumps(sorted(_like_escape(form) for head in heads for form in _word_forms(head))))
+    with _search_connection(main_path) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [row["id"] for row in rows]
+
+
+def _query_pantry_shard(path, have_ids, exclude_ids, limit):
+    with _search_connection(path) as conn:
+        rows = conn.execute(
+            """
+            SELECT hits.recipe_id AS rowid, hits.matched AS matched, hits.total AS total, docs.cluster_id AS cluster_id
+            FROM (
+                SELECT recipe_id, COUNT(*) AS matched, MAX(recipe_size) AS total
+                FROM recipenlg_postings
+                WHERE ingredient_id IN (SELECT value FROM json_each(?))
+                  AND recipe_id NOT IN (
+                      SELECT recipe_id FROM recipenlg_postings WHERE ingredient_id IN (SELECT value FROM json_each(?))
+                  )
+                GROUP BY recipe_id
+                ORDER BY CAST(COUNT(*) AS REAL) / MAX(recipe_size) DESC, COUNT(*) DESC, recipe_id
+                LIMIT ?
+            ) AS hits
+            JOIN recipenlg_docs AS docs ON docs.id = hits.recipe_id
+            """,
+            (json.dumps(have_ids), json.dumps(exclude_ids), limit),
+        ).fetchall()
+    return [(path, row["rowid"], row["matched"], row["total"], row["cluster_id"]) for row in rows]
+
+
+def rank_recipenlg_pantry(pantry_ingredients, exclude_ingredients=None, exclude_titles=None, limit=8):
+    """Recipes ranked by the share of their ingredients the user already has."""
+    pantry_heads = _pantry_heads(pantry_ingredients or [])
+    if not pantry_heads:
+        return []
+
+    index_status = _serving_search_index_status()
+    if not index_status["serving"]:
+        return []
+
+    shard_paths = index_status["shard_paths"]
+    excluded_titles_normalized = {normalize(title) for title in exclude_titles or []}
+    try:
+        have_ids = _pantry_ingredient_id_list(shard_paths[0], pantry_heads)
+        if not have_ids:
+            return []
+        exclude_ids = _pantry_ingredient_id_list(
+            shard_paths[0], _pantry_heads(exclude_ingredients or []), match_any_word=True
+        )
+        hit_lists = _map_search_shards(
+            _query_pantry_shard,
+            [(path, have_ids, exclude_ids, RECIPE_NLG_SEARCH_POOL) for path in shard_paths],
+        )
+        hits = sorted(
+            (hit for hits in hit_lists for hit in hits),
+            key=lambda hit: (-hit[2] / max(hit[3], 1), -hit[2], hit[1]),
+        )
+        selected = []
+        seen_clusters = set()
+        for hit in hits:
+            if hit[4] in seen_clusters:
+                continue
+            seen_clusters.add(hit[4])
+            selected.append(hit)
+            if len(selected) >= limit + len(excluded_titles_normalized):
+                break
+
+        row_ids_by_path = {}
+        for path, row_id, _, _, _ in selected:
+            row_ids_by_path.setdefault(path, []).append(row_id)
+        bodies = {}
+        for shard_bodies in _map_search_shards(_fetch_search_documents, list(row_ids_by_path.items())):
+            bodies.update(shard_bodies)
+    except sqlite3.Error as exc:
+        _SEARCH_INDEX_RUNTIME["last_error"] = str(exc)
+        return []
+
+    ranked = []
+    for _, row_id, matched, total, _ in selected:
+        if row_id not in bodies:
+            continue
+        item = _decode_recipe_document(bodies[row_id])
+        if normalize(item["title"]) in excluded_titles_normalized:
+            continue
+        missing = [
+            name for name in recipe_ingredient_names(item["ner"]) if _ingredient_head(name) not in pantry_heads
+        ]
+        coverage = matched / max(total, 1)
+        reason = f"есть {matched} из {total} ингредиентов"
+        if missing:
+            reason += f"; не хватает: {', '.join(missing[:5])}"
+        ranked.append(
+            {
+                "title": item["title"],
+                "ingredients": item["ingredients"],
+                "directions": item["directions"],
+                "source": item["source"],
+                "total_score": round(coverage, 4),
+                "pantry_coverage": round(coverage, 4),
+                "matched_count": matched,
+                "ingredient_count": total,
+                "missing_ingredients": missing,
+                "match_reason": reason,
+            }
+        )
+        if len(ranked) >= limit:
+            break
+    return [localize_recipenlg_item(item, with_details=False) for item in ranked]
+
+
 def vectorize_text(text):
     return Counter(tokenize(text))
 
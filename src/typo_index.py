@@ -0,0 +1,88 @@
+from difflib import SequenceMatcher
+
+
+TYPO_MAX_EDIT_DISTANCE = 2
+TYPO_PREFIX_LENGTH = 7
+
+
+def _deletes(word, max_distance):
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {
+            variant[:position] + variant[position + 1 :]
+            for variant in frontier
+            if len(variant) > 1
+            for position in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+def build_typo_index(keys, max_distance=TYPO_MAX_EDIT_DISTANCE, prefix_length=TYPO_PREFIX_LENGTH):
+    """SymSpell-style deletion index over catalog keys.
+
+    Only deletions of each key's first `prefix_length` characters are stored, which keeps the index
+    linear in the catalog size; candidates are verified against the full key on lookup.
+    """
+    keys = list(dict.fromkeys(keys))
+    deletes = {}
+    for position, key in enumerate(keys):
+        if not key:
+            continue
+        for variant in _deletes(key[:prefix_length], max_distance):
+            deletes.setdefault(variant, []).append(position)
+    return {
+        "keys": keys,
+        "deletes": deletes,
+        "max_distance": max_distance,
+        "prefix_length": prefix_length,
+    }
+
+
+def _edit_distance(left, right, max_distance):
+    """Levenshtein distance, or max_distance + 1 as soon as it is known to exceed the bound."""
+    if abs(len(left) - len(right)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(right) + 1))
+    for row, left_char in enumerate(left, start=1):
+        current = [row]
+        for column, right_char in enumerate(right, start=1):
+            current.append(
+                min(
+                    previous[column] + 1,
+                    current[column - 1] + 1,
+                    previous[column - 1] + (left_char != right_char),
+                )
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def lookup_close_key(index, word, cutoff):
+    """Best key within the edit-distance bound whose difflib ratio reaches `cutoff`, else None.
+
+    Ranking mirrors difflib.get_close_matches(word, keys, n=1, cutoff=cutoff) restricted to the
+    candidates the deletion index can reach.
+    """
+    max_distance = index["max_distance"]
+    candidates = set()
+    for variant in _deletes(word[: index["prefix_length"]], max_distance):
+        candidates.update(index["deletes"].get(variant, ()))
+
+    matcher = SequenceMatcher()
+    matcher.set_seq2(word)
+    best = None
+    for position in candidates:
+        key = index["keys"][position]
+        if _edit_distance(word, key, max_distance) > max_distance:
+            continue
+        matcher.set_seq1(key)
+        if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+            continue
+        score = matcher.ratio()
+        if score >= cutoff and (best is None or (score, key) > best):
+            best = (score, key)
+    return best[1] if best else None
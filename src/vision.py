@@ -1,7 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
 import ast
-import csv
 import importlib.util
 import re
 
@@ -10,10 +9,10 @@ import numpy as np
 
 try:
     from .nlp import get_known_datasets
-    from .recommender import search_recipenlg_candidates
+    from .recommender import iter_recipenlg_records, search_recipenlg_candidates
 except ImportError:
     from nlp import get_known_datasets
-    from recommender import search_recipenlg_candidates
+    from recommender import iter_recipenlg_records, search_recipenlg_candidates
 
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
@@ -370,16 +369,12 @@ def _dataset_ingredient_catalog():
 
     counter = {}
     try:
-        with open(dataset_path, "r", encoding="utf-8", errors="ignore") as file:
-            reader = csv.DictReader(file)
-            for row_idx, row in enumerate(reader):
-                for ingredient in _parse_list_like(row.get("ingredients", "")):
-                    token = _normalize(ingredient)
-                    if len(token) < 3 or token.isdigit():
-                        continue
-                    counter[token] = counter.get(token, 0) + 1
-                if row_idx + 1 >= RECIPE_NLG_PREVIEW_ROWS:
-                    break
+        for row in iter_recipenlg_records(["ingredients"], limit=RECIPE_NLG_PREVIEW_ROWS):
+            for ingredient in _parse_list_like(row.get("ingredients", "")):
+                token = _normalize(ingredient)
+                if len(token) < 3 or token.isdigit():
+                    continue
+                counter[token] = counter.get(token, 0) + 1
     except Exception:
         return []
 
@@ -1,7 +1,9 @@
 import unittest
+from unittest import mock
 
 from fastapi.testclient import TestClient
 
+from src import nlp
 from src.api import app
 from src.app_service import (
     get_demo_day_report,
@@ -43,6 +45,23 @@ class AppServiceTests(unittest.TestCase):
         self.assertTrue(second["ok"])
         self.assertEqual(first["query_bucket"], second["query_bucket"])
 
+    def test_chat_message_is_parsed_once(self):
+        nlp.clear_parse_cache()
+        with mock.patch.object(nlp, "analyze_cooking_request", wraps=nlp.analyze_cooking_request) as analyze:
+            result = handle_chat_message("ужин с курицей", context=initial_chat_context())
+        self.assertTrue(result["ok"])
+        self.assertEqual(analyze.call_count, 1)
+
+    def test_broken_graph_artifact_falls_back_to_no_data_source(self):
+        with mock.patch(
+            "src.app_service.get_recipe_knowledge_graph", side_effect=ValueError("mmap length is greater than file size")
+        ), mock.patch(
+            "src.app_service.process_text_interaction", return_value={"response": "ok", "recipe_title": ""}
+        ) as process:
+            result = handle_chat_message("ужин с курицей")
+        self.assertTrue(result["ok"])
+        self.assertIsNone(process.call_args.args[1])
+
     def test_demo_day_report_contains_core_sections(self):
         report = get_demo_day_report()
         self.assertIn("summary", report)
@@ -72,6 +91,17 @@ class ApiSmokeTests(unittest.TestCase):
         self.assertIn("recipe_title", response.json())
         self.assertIn("query_bucket", response.json())
 
+    def test_pantry_endpoint_requires_ingredients(self):
+        response = self.client.post("/recipes/pantry", json={"ingredients": []})
+        self.assertEqual(response.status_code, 422)
+
+    def test_pantry_endpoint(self):
+        response = self.client.post("/recipes/pantry", json={"ingredients": ["курица", "рис", "лук"], "limit": 3})
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertTrue(payload["ok"])
+        self.assertIn("recipes", payload)
+
     def test_demo_report_endpoint(self):
         response = self.client.get("/demo/report")
         self.assertEqual(response.status_code, 200)
@@ -0,0 +1,354 @@
+from difflib import get_close_matches
+import random
+import re
+import unittest
+from unittest import mock
+
+import networkx as nx
+import spacy
+
+from src import nlp
+from src.app_service import get_demo_scenarios, get_sample_queries
+from src.keyword_automaton import build_keyword_automaton, find_keywords
+from src.typo_index import build_typo_index, lookup_close_key
+
+
+class SpacyProfileTests(unittest.TestCase):
+    def setUp(self):
+        nlp._load_spacy.cache_clear()
+        self.addCleanup(nlp._load_spacy.cache_clear)
+        patcher = mock.patch.dict(nlp._SPACY_FAILED_AT, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _blank_pipeline(self, *args, **kwargs):
+        pipeline = spacy.blank("ru")
+        pipeline.add_pipe("sentencizer")
+        return pipeline
+
+    def test_profile_excludes_components_on_load(self):
+        with mock.patch("spacy.load", side_effect=self._blank_pipeline) as load:
+            nlp._load_spacy("lemmas")
+        load.assert_called_once_with(nlp.SPACY_MODEL_NAME, exclude=["parser", "ner"])
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            nlp._load_spacy("tagger-only")
+
+    def test_analysis_reports_per_component_timings(self):
+        with mock.patch("spacy.load", side_effect=self._blank_pipeline):
+            result = nlp.analyze_cooking_request("ужин с курицей", profile="lemmas")
+        self.assertEqual(result["nlp_profile"], "lemmas")
+        self.assertEqual(set(result["nlp_timings_ms"]), {"tokenizer", "sentencizer"})
+        self.assertIn("sentencizer", nlp.get_spacy_latency()["lemmas"])
+
+
+class MorphEngineTests(unittest.TestCase):
+    def setUp(self):
+        nlp._load_spacy.cache_clear()
+        self.addCleanup(nlp._load_spacy.cache_clear)
+        patcher = mock.patch.dict(nlp._SPACY_FAILED_AT, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pymorphy_engine_lemmatizes(self):
+        result = nlp.analyze_cooking_request("ужин с курицей и грибами", engine="pymorphy3")
+        self.assertEqual(result["engine"], "pymorphy3")
+        self.assertEqual(result["lemmas"], ["ужин", "курица", "гриб"])
+        self.assertEqual(set(result["nlp_timings_ms"]), {"tokenizer", "lemmatizer"})
+
+    def test_auto_falls_back_when_spacy_model_is_missing(self):
+        with mock.patch("spacy.load", side_effect=OSError("no model")):
+            result = nlp.analyze_cooking_request("ужин с курицей")
+        self.assertEqual(result["engine"], "pymorphy3")
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ValueError):
+            nlp.analyze_cooking_request("ужин", engine="stanza")
+
+    def test_default_engine_comes_from_environment(self):
+        with mock.patch.dict("os.environ", {nlp.NLP_ENGINE_ENV: "pymorphy3"}), mock.patch("spacy.load") as load:
+            result = nlp.analyze_cooking_request("ужин с курицей")
+        self.assertEqual(result["engine"], "pymorphy3")
+        load.assert_not_called()
+        with mock.patch.dict("os.environ", {nlp.NLP_ENGINE_ENV: "stanza"}), self.assertRaises(ValueError):
+            nlp.get_default_engine()
+
+    def test_failed_spacy_load_is_retried_after_interval(self):
+        with mock.patch("spacy.load", side_effect=OSError("no model")) as load:
+            self.assertEqual(nlp._resolve_engine("auto", "default"), "pymorphy3")
+            self.assertEqual(nlp._resolve_engine("auto", "default"), "pymorphy3")
+        self.assertEqual(load.call_count, 1)
+        with mock.patch.object(nlp, "NLP_ENGINE_RETRY_SECONDS", 0.0), mock.patch(
+            "spacy.load", side_effect=lambda *args, **kwargs: spacy.blank("ru")
+        ):
+            self.assertEqual(nlp._resolve_engine("auto", "default"), "spacy")
+
+
+class BatchAnalysisTests(unittest.TestCase):
+    def setUp(self):
+        nlp._load_spacy.cache_clear()
+        self.addCleanup(nlp._load_spacy.cache_clear)
+        patcher = mock.patch.dict(nlp._SPACY_FAILED_AT, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("spacy.load", side_effect=lambda *args, **kwargs: spacy.blank("ru"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batch_matches_single_analysis(self):
+        texts = ["ужин до 500 ккал без молока", "", "у меня есть яйца, сыр", "покажи 3 рецепта завтрака"]
+        batch = nlp.analyze_cooking_requests(texts, batch_size=2)
+        self.assertEqual(len(batch), len(texts))
+        for text, result in zip(texts, batch):
+            single = nlp.analyze_cooking_request(text)
+            single.pop("nlp_timings_ms")
+            result.pop("nlp_timings_ms")
+            self.assertEqual(result, single)
+
+    def test_empty_batch(self):
+        self.assertEqual(nlp.analyze_cooking_requests([]), [])
+
+
+class ParseCacheTests(unittest.TestCase):
+    def setUp(self):
+        nlp.clear_parse_cache()
+        self.addCleanup(nlp.clear_parse_cache)
+        patcher = mock.patch.object(nlp, "analyze_cooking_request", side_effect=lambda text, *args: {"text": text})
+        self.analyze = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_normalized_text_is_parsed_once(self):
+        first = nlp.parse_cooking_request("ужин  с курицей")
+        first["text"] = "changed"
+        second = nlp.parse_cooking_request(" ужин с курицей ")
+        self.assertEqual(self.analyze.call_count, 1)
+        self.assertEqual(second, {"text": "ужин с курицей"})
+        self.assertEqual(nlp.get_parse_cache_stats()["hits"], 1)
+
+    def test_expired_entries_are_parsed_again(self):
+        with mock.patch.object(nlp, "PARSE_CACHE_TTL_SECONDS", 0):
+            nlp.parse_cooking_request("салат")
+            nlp.parse_cooking_request("салат")
+        self.assertEqual(self.analyze.call_count, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with mock.patch.object(nlp, "PARSE_CACHE_SIZE", 2):
+            for text in ["суп", "салат", "суп", "плов", "суп", "салат"]:
+                nlp.parse_cooking_request(text)
+        self.assertEqual([call.args[0] for call in self.analyze.call_args_list], ["суп", "салат", "плов", "салат"])
+
+
+class KeywordAutomatonTests(unittest.TestCase):
+    def test_matches_naive_substring_search(self):
+        rng = random.Random(7)
+        patterns = sorted({"".join(rng.choice("абв ") for _ in range(rng.randint(1, 4))) for _ in range(40)})
+        automaton = build_keyword_automaton((pattern, pattern) for pattern in patterns)
+        for _ in range(200):
+            text = "".join(rng.choice("абвг ") for _ in range(rng.randint(0, 30)))
+            expected = sorted(
+                (start, pattern)
+                for pattern in patterns
+                for start in range(len(text))
+                if text.startswith(pattern, start)
+            )
+            self.assertEqual(sorted(find_keywords(automaton, text)), expected)
+
+    def test_keyword_tables_keep_first_match_semantics(self):
+        self.assertEqual(nlp._detect_meal_type("вечером или утром"), "завтрак")
+        self.assertEqual(nlp._classify_cooking_intent("похожие блюда без молока"), "Поиск похожих рецептов")
+        self.assertEqual(nlp._detect_diet_tags("кето веган"), ["vegan", "keto"])
+        self.assertEqual(nlp._detect_query_mode("покажи список аллергенов", {}), "list_allergens")
+        self.assertEqual(nlp._extract_dataset_entities("инфо про food-11"), ["Food-11 Image Classification Dataset"])
+
+    def test_catalog_matches_follow_catalog_order(self):
+        catalog = nlp._compile_catalog(["Рис", "Курица", "рис"])
+        self.assertEqual(nlp._extract_matches("курица с рисом", catalog), ["рис", "Курица"])
+        self.assertEqual(nlp._extract_matches("что угодно", nlp._compile_catalog([])), [])
+
+
+class TypoIndexTests(unittest.TestCase):
+    def test_agrees_with_difflib_for_small_typos(self):
+        keys = ["курица", "картофель", "морковь", "молоко", "мука", "помидор", "говядина", "свинина"]
+        index = build_typo_index(keys)
+        for word in ["курца", "картофел", "маркофь", "малоко", "говядена", "помидоры", "сахар"]:
+            expected = (get_close_matches(word, keys, n=1, cutoff=0.8) or [None])[0]
+            self.assertEqual(lookup_close_key(index, word, 0.8), expected, word)
+
+    def test_edit_distance_bound(self):
+        index = build_typo_index(["абвгдежз"], max_distance=1)
+        self.assertEqual(lookup_close_key(index, "абвгдежк", 0.5), "абвгдежз")
+        self.assertIsNone(lookup_close_key(index, "абвгдекк", 0.5))
+
+    def test_typo_in_graph_catalog_query(self):
+        catalog = nlp._compile_catalog(["Курица", "Картофель"])
+        self.assertEqual(nlp._extract_matches("суп с картофелем", catalog, cutoff=0.8), ["Картофель"])
+
+
+class CatalogIndexTests(unittest.TestCase):
+    def _graph(self):
+        graph = nx.Graph()
+        for node, node_type in [("Курица", "ingredient"), ("Молоко", "allergen"), ("Плов", "recipe")]:
+            graph.add_node(node, type=node_type)
+        return graph
+
+    def test_index_is_built_once_per_version(self):
+        graph = self._graph()
+        index = nlp.get_catalog_index(graph)
+        self.assertIs(nlp.get_catalog_index(graph), index)
+        self.assertEqual(index["partitions"]["recipe"], ["Плов"])
+
+        graph.graph["version"] = 2
+        graph.nodes["Курица"]["type"] = "recipe"
+        rebuilt = nlp.get_catalog_index(graph)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt["partitions"]["recipe"], ["Курица", "Плов"])
+
+    def test_analysis_uses_graph_catalogs(self):
+        result = nlp.analyze_cooking_request("плов с курицей без молока", self._graph(), engine="pymorphy3")
+        self.assertEqual(result["entities"]["recipes"], ["Плов"])
+        self.assertEqual(result["filters"]["exclude_allergens"], ["Молоко"])
+
+
+def _legacy_calorie_constraints(query):
+    range_match = re.search(r"(\d{2,4})\s*[-–]\s*(\d{2,4})\s*ккал", query)
+    if range_match:
+        low = int(range_match.group(1))
+        high = int(range_match.group(2))
+        return min(low, high), max(low, high), int((low + high) / 2)
+
+    max_match = re.search(r"(до|меньше|не более)\s*(\d{2,4})", query)
+    min_match = re.search(r"(от|больше|не менее)\s*(\d{2,4})", query)
+    around_match = re.search(r"(около|примерно|~)\s*(\d{2,4})\s*ккал", query)
+    max_cal = int(max_match.group(2)) if max_match else None
+    min_cal = int(min_match.group(2)) if min_match else None
+    target = int(around_match.group(2)) if around_match else None
+    if target is not None and min_cal is None and max_cal is None:
+        min_cal = max(0, target - 100)
+        max_cal = target + 100
+    if max_cal is None and "низкокал" in query:
+        max_cal = 450
+    if min_cal is None and "высококал" in query:
+        min_cal = 600
+    if target is None and min_cal is not None and max_cal is not None:
+        target = int((min_cal + max_cal) / 2)
+    return min_cal, max_cal, target
+
+
+def _legacy_servings(query):
+    digit_match = re.search(r"(\d{1,2})\s*(порц|чел|персон|people|servings?)", query)
+    if digit_match:
+        return int(digit_match.group(1))
+    word_match = re.search(r"на\s+(одного|одну|один|одной|двоих|двух|троих|трех|четверых|четырех)", query)
+    if word_match:
+        return nlp.SERVINGS_WORDS.get(word_match.group(1))
+    return None
+
+
+def _legacy_result_limit(query):
+    patterns = [
+        r"(?:покажи|дай|подбери|предложи|выведи)\s*(\d{1,2})\s*(?:рецепт|вариант|блюд)",
+        r"топ\s*(\d{1,2})",
+        r"(\d{1,2})\s*(?:рецепт|вариант|блюд)",
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, query)
+        if match:
+            return max(1, min(20, int(match.group(1))))
+    return nlp.RESULT_LIMIT_DEFAULT
+
+
+def _legacy_negative_segments(query):
+    segments = []
+    for marker in ["без ", "кроме ", "исключи ", "убери ", "не добавляй "]:
+        start = 0
+        while True:
+            idx = query.find(marker, start)
+            if idx == -1:
+                break
+            fragment = query[idx + len(marker) :]
+            for delimiter in [".", "?", "!", " на ", " до ", " от ", " для "]:
+                cut_idx = fragment.find(delimiter)
+                if cut_idx != -1:
+                    fragment = fragment[:cut_idx]
+            for part in re.split(r",| и |/|;", fragment):
+                if len(part.strip()) >= 3:
+                    segments.append(part.strip())
+            start = idx + len(marker)
+    return nlp._dedupe_keep_order(segments)
+
+
+# Reference: the per-field regex extractors the constraint lexer replaced.
+LEGACY_CONSTRAINT_EXTRACTORS = {
+    "calories": _legacy_calorie_constraints,
+    "servings": _legacy_servings,
+    "max_results": _legacy_result_limit,
+    "negative_segments": _legacy_negative_segments,
+}
+
+CONSTRAINT_FRAGMENTS = [
+    "подбери ужин", "покажи 3 рецепта", "дай 5 вариантов", "топ 7", "выведи 12 блюд", "2 рецепта",
+    "до 500 ккал", "от 300", "не более 450 ккал", "не менее 200", "меньше 700", "больше 900 ккал",
+    "около 600 ккал", "примерно 350 ккал", "~400 ккал", "300-500 ккал", "400 – 650ккал", "низкокалорийный",
+    "высококалорийный", "на двоих", "на одного", "на 4 порции", "для 3 человек", "6 servings", "2 people",
+    "без молока", "без лука и чеснока", "кроме орехов, арахиса", "исключи глютен/сахар", "убери рыбу;",
+    "не добавляй яйца", "с курицей", "салат", "суп.", "что приготовить?", "быстро!", "на ужин", "для детей",
+]
+
+
+class ConstraintLexerTests(unittest.TestCase):
+    def _corpus(self):
+        rng = random.Random(11)
+        queries = list(get_sample_queries()) + [scenario["query"] for scenario in get_demo_scenarios()]
+        queries.extend(
+            " ".join(rng.choice(CONSTRAINT_FRAGMENTS) for _ in range(rng.randint(1, 6))) for _ in range(500)
+        )
+        return [nlp._normalize(query) for query in queries]
+
+    def test_matches_legacy_extractors(self):
+        for query in self._corpus():
+            scanned = nlp._scan_constraints(query)
+            for field, legacy in LEGACY_CONSTRAINT_EXTRACTORS.items():
+                value = list(scanned[field]) if field == "negative_segments" else scanned[field]
+                self.assertEqual(value, legacy(query), f"{field}: {query}")
+
+    def test_adjacent_scope_ends_close_at_the_first_one(self):
+        # Intended difference: the legacy find loop cut at " до " and kept the preceding "для" in the segment.
+        query = nlp._normalize("без 450 150 для до топ")
+        self.assertEqual(LEGACY_CONSTRAINT_EXTRACTORS["negative_segments"](query), ["450 150 для"])
+        self.assertEqual(nlp._scan_constraints(query)["negative_segments"], ("450 150",))
+
+    def test_triggers_do_not_hide_each_other(self):
+        scanned = nlp._scan_constraints("от 300-500 ккал без лука на 2 порции, топ 3")
+        self.assertEqual(scanned["calories"], (300, 500, 400))
+        self.assertEqual(scanned["servings"], 2)
+        self.assertEqual(scanned["max_results"], 3)
+        self.assertEqual(scanned["negative_segments"], ("лука",))
+
+    def test_public_extractors_share_one_scan(self):
+        nlp._scan_constraints.cache_clear()
+        text = "Покажи 3 рецепта без сахара до 400 ккал на двоих"
+        self.assertEqual(nlp._extract_calorie_constraints(text), (None, 400, None))
+        self.assertEqual(nlp._extract_servings(text), 2)
+        self.assertEqual(nlp._extract_result_limit(text), 3)
+        self.assertEqual(nlp._extract_negative_segments(text), ["сахара"])
+        self.assertEqual(nlp._scan_constraints.cache_info().misses, 1)
+
+
+class PantryExtractionTests(unittest.TestCase):
+    def test_single_marker_without_filler_words(self):
+        self.assertEqual(nlp._extract_pantry_ingredients("У меня есть только рис и яйца"), ["рис", "яйца"])
+        self.assertEqual(nlp._extract_pantry_ingredients("в холодильнике есть только морковь, сыр"), ["морковь", "сыр"])
+        self.assertEqual(
+            nlp._extract_pantry_ingredients("что можно приготовить из курицы и риса"), ["курицы", "риса"]
+        )
+
+    def test_non_ingredient_fragments_keep_regular_mode(self):
+        for text in ["у меня есть аллергия на орехи", "у меня есть вопрос про плов"]:
+            self.assertEqual(nlp._extract_pantry_ingredients(text), [], text)
+            analysis = nlp.analyze_cooking_request(text, None, engine="pymorphy3")
+            self.assertNotEqual(analysis["query_mode"], "pantry_search", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
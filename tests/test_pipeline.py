@@ -1,6 +1,9 @@
 import unittest
 
+from src import recipe_vectors, recommender
 from src.pipeline import run_text_pipeline
+from test_recipe_vectors import EXTRA_RECIPES
+from test_recommender import SAMPLE_RECIPES, RecipeIndexTestCase, write_sample_csv
 
 
 class PipelineTests(unittest.TestCase):
@@ -8,6 +11,7 @@ class PipelineTests(unittest.TestCase):
         result = run_text_pipeline("похожие на плов")
         self.assertTrue(result["handled"])
         self.assertEqual(result["stages"]["decision"]["strategy"], "recipenlg_cosine_fuzzy")
+        self.assertIn(result["stages"]["decision"]["similarity_source"], ["neighbors", "query"])
         self.assertIn("Похожие рецепты", result["response"])
 
     def test_breakfast_recommendation_returns_recipe(self):
@@ -20,11 +24,39 @@ class PipelineTests(unittest.TestCase):
         self.assertTrue(result["handled"])
         self.assertIn("Рецепт:", result["response"])
 
+    def test_pantry_query_uses_ingredient_index(self):
+        result = run_text_pipeline("у меня есть курица, рис, лук, морковь")
+        self.assertTrue(result["handled"])
+        self.assertEqual(result["stages"]["decision"]["strategy"], "recipenlg_pantry_containment")
+        self.assertEqual(result["stages"]["rules"]["pantry_ingredients"], ["курица", "рис", "лук", "морковь"])
+
     def test_dataset_listing_works(self):
         result = run_text_pipeline("покажи датасеты")
         self.assertTrue(result["handled"])
         self.assertIn("Подключенные датасеты", result["response"])
 
 
+class SimilarityNeighborsPipelineTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        write_sample_csv(self.csv_path, SAMPLE_RECIPES + EXTRA_RECIPES)
+        recommender.ensure_recipenlg_search_index()
+
+    def test_similarity_uses_seed_neighbors(self):
+        recipe_vectors.build_recipe_neighbors(top_k=2)
+        result = run_text_pipeline("похожие на lamb pilaf")
+        decision = result["stages"]["decision"]
+        self.assertEqual(decision["strategy"], "recipenlg_cosine_fuzzy")
+        self.assertEqual(decision["similarity_source"], "neighbors")
+        self.assertEqual(decision["seed_recipe"], "Lamb Pilaf")
+        self.assertTrue(all("neighbor_score" in item for item in decision["ranked"]))
+
+    def test_similarity_without_neighbors_has_no_seed(self):
+        result = run_text_pipeline("похожие на lamb pilaf")
+        decision = result["stages"]["decision"]
+        self.assertEqual(decision["similarity_source"], "query")
+        self.assertIsNone(decision["seed_recipe"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,216 @@
+from contextlib import closing
+import sqlite3
+import unittest
+from unittest import mock
+
+from src import nlp, recipe_vectors, recommender
+from test_recommender import SAMPLE_RECIPES, RecipeIndexTestCase, write_sample_csv
+
+
+EXTRA_RECIPES = [
+    ("Lamb Pilaf", ["1 lb lamb", "2 c. rice", "1 onion", "1 carrot"], ["Brown lamb.", "Add rice."], ["lamb", "rice", "onion", "carrot"]),
+    ("Chicken Fried Rice", ["2 c. rice", "1 c. chicken", "2 eggs"], ["Fry."], ["rice", "chicken", "eggs"]),
+]
+
+
+class RecipeNeighborsTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        write_sample_csv(self.csv_path, SAMPLE_RECIPES + EXTRA_RECIPES)
+        recommender.ensure_recipenlg_search_index()
+
+    def neighbors_of(self, row_id):
+        with closing(sqlite3.connect(str(recommender.recipenlg_neighbors_path()))) as conn:
+            return conn.execute(
+                "SELECT neighbor_id, score FROM recipenlg_neighbors WHERE recipe_id = ? ORDER BY rank", (row_id,)
+            ).fetchall()
+
+    def test_neighbors_are_ranked_by_tfidf_cosine(self):
+        result = recipe_vectors.build_recipe_neighbors(top_k=3)
+        self.assertEqual(result["recipe_count"], len(SAMPLE_RECIPES) + len(EXTRA_RECIPES))
+
+        neighbors = self.neighbors_of(3)  # Beef Pilaf
+        self.assertEqual([row_id for row_id, _ in neighbors][:2], [7, 1])
+        scores = [score for _, score in neighbors]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertNotIn(3, [row_id for row_id, _ in neighbors])
+        self.assertTrue(recommender.get_search_index_status(refresh=True)["neighbors_ready"])
+
+    def test_neighbors_are_ignored_after_index_rebuild(self):
+        recipe_vectors.build_recipe_neighbors()
+        self.assertTrue(recommender.get_search_index_status(refresh=True)["neighbors_ready"])
+        recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertFalse(recommender.get_search_index_status(refresh=True)["neighbors_ready"])
+
+    def test_similarity_ranking_scores_only_seed_neighbors(self):
+        recipe_vectors.build_recipe_neighbors(top_k=2)
+        with mock.patch.object(recommender, "_recipe_neighbors", wraps=recommender._recipe_neighbors) as lookup:
+            ranked = recommender.rank_recipenlg_candidates("lamb pilaf", limit=5, similar_to_seed=True)
+        lookup.assert_called_once_with(7)
+        self.assertEqual(ranked[0]["title"], "Lamb Pilaf")
+        self.assertEqual(len(ranked), 3)
+        self.assertTrue(all("neighbor_score" in item for item in ranked))
+
+
+class RecipeAnnIndexTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        write_sample_csv(self.csv_path, SAMPLE_RECIPES + EXTRA_RECIPES)
+        recommender.ensure_recipenlg_search_index()
+
+    def test_ann_candidates_reach_recipes_without_lexical_hits(self):
+        result = recipe_vectors.build_recipe_ann_index()
+        self.assertEqual(result["recipe_count"], len(SAMPLE_RECIPES) + len(EXTRA_RECIPES))
+        self.assertTrue(recommender.get_search_index_status(refresh=True)["ann_ready"])
+
+        with mock.patch.object(recommender, "_query_search_shards", return_value=[]):
+            candidates = recommender.search_recipenlg_candidates("lamb carrot")
+        self.assertEqual([item["title"] for item in candidates], ["Lamb Pilaf"])
+        self.assertGreater(candidates[0]["_ann_score"], 0.5)
+
+    def test_ann_hits_take_a_capped_share_of_the_limit(self):
+        recipe_vectors.build_recipe_ann_index()
+        lexical = recommender.search_recipenlg_candidates("rice")
+        vector_only = [{"title": f"Vector {index}", "_ann_score": 0.9} for index in range(10)]
+        recommender._search_recipenlg_candidates_cached.cache_clear()
+        with mock.patch.object(recommender, "_ann_candidates", return_value=vector_only):
+            candidates = recommender.search_recipenlg_candidates("rice", limit=4)
+        self.assertEqual(len(candidates), 4)
+        self.assertEqual([item["title"] for item in candidates[3:]], ["Vector 0"])
+        self.assertEqual([item["title"] for item in candidates[:3]], [item["title"] for item in lexical[:3]])
+
+    def test_broken_ann_artifact_falls_back_to_fts(self):
+        recipe_vectors.build_recipe_ann_index()
+        expected = [item["title"] for item in recommender.search_recipenlg_candidates("rice")]
+        recommender._search_recipenlg_candidates_cached.cache_clear()
+        recommender._load_recipe_ann_index.cache_clear()
+        self.addCleanup(recommender._load_recipe_ann_index.cache_clear)
+        with mock.patch.object(recommender.np, "load", side_effect=ValueError("truncated .npy")):
+            candidates = recommender.search_recipenlg_candidates("rice")
+        self.assertEqual([item["title"] for item in candidates], expected)
+
+    def test_ann_index_is_ignored_after_index_rebuild(self):
+        recipe_vectors.build_recipe_ann_index()
+        recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        status = recommender.get_search_index_status(refresh=True)
+        self.assertFalse(status["ann_ready"])
+        profile = recommender._dataset_query_profile("lamb carrot")
+        self.assertEqual(recommender._recipe_ann_hits(status, profile, 5), [])
+
+
+class RecipeEmbeddingTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        write_sample_csv(self.csv_path, SAMPLE_RECIPES + EXTRA_RECIPES)
+        recommender.ensure_recipenlg_search_index()
+
+    def test_embedding_cosine_groups_rice_dishes(self):
+        result = recipe_vectors.build_recipe_embeddings(rank=4)
+        self.assertEqual(result["dimensions"], 4)
+        self.assertTrue(recommender.get_search_index_status(refresh=True)["embeddings_ready"])
+
+        profile = recommender._dataset_query_profile("pilaf")
+        scores = recommender._recipe_embedding_scores(profile, list(range(1, 9)))
+        pilafs = [scores[1], scores[3], scores[7]]
+        others = [scores[row_id] for row_id in [2, 4, 5, 6]]
+        self.assertGreater(min(pilafs), max(others))
+
+        ranked = recommender.rank_recipenlg_candidates("pilaf", limit=3)
+        self.assertTrue(all("embedding_score" in item for item in ranked))
+
+    def test_embeddings_are_ignored_after_index_rebuild(self):
+        recipe_vectors.build_recipe_embeddings(rank=4)
+        recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertFalse(recommender.get_search_index_status(refresh=True)["embeddings_ready"])
+        profile = recommender._dataset_query_profile("pilaf")
+        self.assertEqual(recommender._recipe_embedding_scores(profile, [1, 3]), {})
+
+
+SUBSTITUTION_RECIPES = [
+    ("Sugar Cookies", ["2 c. flour", "1 c. sugar", "1 c. butter", "1 egg"], ["Mix.", "Bake."], ["flour", "sugar", "butter", "egg"]),
+    ("Margarine Cookies", ["2 c. flour", "1 c. sugar", "1 c. margarine", "1 egg"], ["Mix.", "Bake."], ["flour", "sugar", "margarine", "egg"]),
+    ("Shortbread", ["2 c. flour", "1/2 c. sugar", "1 c. butter"], ["Mix.", "Bake."], ["flour", "sugar", "butter"]),
+    ("Easy Shortbread", ["2 c. flour", "1/2 c. sugar", "1 c. margarine"], ["Mix.", "Bake."], ["flour", "sugar", "margarine"]),
+]
+
+
+class IngredientSubstitutionTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        write_sample_csv(self.csv_path, SAMPLE_RECIPES + SUBSTITUTION_RECIPES)
+        recommender.ensure_recipenlg_search_index()
+
+    def build(self):
+        return recipe_vectors.build_ingredient_substitutions(min_df=1, min_pair=1)
+
+    def test_substitutes_share_contexts_but_not_recipes(self):
+        result = self.build()
+        self.assertGreater(result["pmi_nonzero"], 0)
+        self.assertTrue(recommender.get_search_index_status(refresh=True)["substitutions_ready"])
+
+        substitutes = recommender.ingredient_substitutes("butter")
+        self.assertEqual(substitutes[0]["ingredient"], "margarine")
+        self.assertGreater(substitutes[0]["score"], max(entry["score"] for entry in substitutes[1:]))
+
+    def test_match_reason_mentions_substitute_used_by_recipe(self):
+        self.build()
+        with mock.patch.object(recommender, "translate_to_ru", side_effect=lambda text: text):
+            ranked = recommender.rank_recipenlg_candidates("cookies", exclude_ingredients=["butter"], limit=3)
+        self.assertEqual(ranked[0]["title"], "Margarine Cookies")
+        self.assertIn("вместо «butter»: margarine", ranked[0]["match_reason"])
+
+    def test_substitutions_are_ignored_after_index_rebuild(self):
+        self.build()
+        recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertEqual(recommender.ingredient_substitutes("butter"), [])
+
+
+class RecipeKnowledgeGraphTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        recommender.ensure_recipenlg_search_index()
+        recommender._load_recipe_graph.cache_clear()
+        self.addCleanup(recommender._load_recipe_graph.cache_clear)
+
+    def build(self):
+        return recipe_vectors.build_recipe_knowledge_graph(min_df=1, min_title_count=1)
+
+    def test_graph_links_recipes_ingredients_and_allergens(self):
+        result = self.build()
+        self.assertEqual(result["recipe_count"], len(SAMPLE_RECIPES))
+        self.assertTrue(recommender.get_search_index_status(refresh=True)["graph_ready"])
+
+        graph = recommender.get_recipe_knowledge_graph()
+        self.assertEqual(graph.nodes["chicken"]["type"], "ingredient")
+        self.assertEqual(graph.nodes["Молоко"]["type"], "allergen")
+        self.assertEqual(graph.nodes["Beef Pilaf"]["type"], "recipe")
+        self.assertEqual(set(graph.neighbors("Beef Pilaf")), {"beef", "rice", "carrot"})
+        self.assertEqual(set(graph.neighbors("Молоко")), {"cheese", "butter", "feta cheese"})
+        self.assertIn("Cheese Omelette", graph.neighbors("eggs", node_type="recipe"))
+        self.assertEqual(graph.graph["version"], recommender.get_search_index_status()["build_id"])
+
+    def test_graph_is_an_nlp_data_source(self):
+        self.build()
+        graph = recommender.get_recipe_knowledge_graph()
+        parsed = nlp.analyze_cooking_request("ужин с курицей", graph, engine="pymorphy3")
+        self.assertIn("chicken", parsed["entities"]["ingredients"])
+        self.assertEqual(set(recipe_vectors.RECIPE_GRAPH_ALLERGENS), set(nlp.ALLERGEN_ALIASES.values()))
+
+    def test_common_russian_ingredients_have_graph_aliases(self):
+        self.build()
+        graph = recommender.get_recipe_knowledge_graph()
+        parsed = nlp.analyze_cooking_request("омлет: яйца, сыр и рис с луком", graph, engine="pymorphy3")
+        self.assertEqual(set(parsed["entities"]["ingredients"]), {"eggs", "cheese", "rice", "onion"})
+        # Stems only match at a word start.
+        parsed = nlp.analyze_cooking_request("нарисуй меню", graph, engine="pymorphy3")
+        self.assertNotIn("rice", parsed["entities"]["ingredients"])
+
+    def test_graph_is_ignored_after_index_rebuild(self):
+        self.build()
+        recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertFalse(recommender.get_search_index_status(refresh=True)["graph_ready"])
+        self.assertIsNone(recommender.get_recipe_knowledge_graph())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,485 @@
+import csv
+import json
+import os
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from src import recommender
+
+
+SAMPLE_RECIPES = [
+    ("Chicken Rice Pilaf", ["1 lb chicken", "2 c. rice", "1 onion"], ["Brown chicken.", "Add rice."], ["chicken", "rice", "onion"]),
+    ("Chicken Salad", ["2 c. chicken", "1 c. celery", "1/2 c. mayonnaise"], ["Mix all."], ["chicken", "celery", "mayonnaise"]),
+    ("Beef Pilaf", ["1 lb beef", "2 c. rice", "1 carrot"], ["Brown beef.", "Add rice."], ["beef", "rice", "carrot"]),
+    ("Cheese Omelette", ["3 eggs", "1/4 c. cheese", "1 Tbsp. butter"], ["Beat eggs.", "Fry."], ["eggs", "cheese", "butter"]),
+    ("Tomato Soup", ["4 tomatoes", "1 onion", "2 c. broth"], ["Simmer.", "Blend."], ["tomatoes", "onion", "broth"]),
+    ("Greek Salad", ["2 tomatoes", "1 cucumber", "1/2 c. feta cheese"], ["Chop.", "Toss."], ["tomatoes", "cucumber", "feta cheese"]),
+]
+
+
+def write_sample_csv(path, recipes=SAMPLE_RECIPES):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["", "title", "ingredients", "directions", "link", "source", "NER"])
+        for idx, (title, ingredients, directions, ner) in enumerate(recipes):
+            writer.writerow([idx, title, repr(ingredients), repr(directions), f"example.com/{idx}", "Gathered", repr(ner)])
+
+
+class RecipeIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.csv_path = root / "full_dataset.csv"
+        write_sample_csv(self.csv_path)
+        artifacts_dir = root / "artifacts"
+        patches = [
+            mock.patch.object(recommender, "ARTIFACTS_DIR", artifacts_dir),
+            mock.patch.object(recommender, "RECIPE_NLG_INDEX_PATH", artifacts_dir / "recipenlg_search.sqlite3"),
+            mock.patch.object(recommender, "recipenlg_csv_path", return_value=self.csv_path),
+            mock.patch.object(recommender, "RECIPE_NLG_STATUS_RECHECK_SECONDS", 0.0),
+            mock.patch.dict(recommender._SEARCH_INDEX_STATUS_CACHE, {"status": None, "signature": None}),
+            mock.patch.dict(recommender._SEARCH_INDEX_RUNTIME, {"build_lock": None, "build_lock_checked_at": 0.0}),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        recommender._search_recipenlg_candidates_cached.cache_clear()
+        self.addCleanup(recommender._search_recipenlg_candidates_cached.cache_clear)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def touch_csv(self):
+        stats = self.csv_path.stat()
+        os.utime(self.csv_path, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1_000_000_000))
+
+
+class SearchIndexTests(RecipeIndexTestCase):
+    def test_build_and_search(self):
+        status = recommender.ensure_recipenlg_search_index()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["row_count"], len(SAMPLE_RECIPES))
+
+        candidates = recommender.search_recipenlg_candidates("pilaf", limit=5)
+        titles = [item["title"] for item in candidates]
+        self.assertIn("Chicken Rice Pilaf", titles)
+        self.assertIn("Beef Pilaf", titles)
+        pilaf = candidates[titles.index("Chicken Rice Pilaf")]
+        self.assertEqual(pilaf["directions"], ["Brown chicken.", "Add rice."])
+        self.assertEqual(pilaf["ner"], ["chicken", "rice", "onion"])
+
+    def test_directions_are_stored_but_not_searchable(self):
+        recommender.ensure_recipenlg_search_index()
+        self.assertEqual(recommender.search_recipenlg_candidates("simmer", limit=5), [])
+
+    def test_stemmed_terms_match_without_prefix_wildcards(self):
+        recommender.ensure_recipenlg_search_index()
+        profile = recommender._dataset_query_profile("omelettes with tomatoes")
+        fts_queries = recommender._build_fts_queries(profile, None)
+        self.assertTrue(fts_queries)
+        self.assertFalse(any("*" in query for query in fts_queries))
+
+        titles = [item["title"] for item in recommender.search_recipenlg_candidates("omelettes", limit=5)]
+        self.assertIn("Cheese Omelette", titles)
+
+    def test_fused_query_ranks_rows_matched_by_several_strategies_first(self):
+        status = recommender.ensure_recipenlg_search_index()
+        rows = recommender._query_search_shards(status["shard_paths"], ["chicken rice", "chicken OR rice"], 10)
+        row_ids = [row["rowid"] for row in rows]
+        self.assertEqual(len(row_ids), len(set(row_ids)))
+        self.assertEqual(recommender._decode_recipe_document(rows[0]["body"])["title"], "Chicken Rice Pilaf")
+        self.assertGreater(rows[0]["rrf"], rows[1]["rrf"])
+
+    def test_fused_query_runs_one_statement_per_shard(self):
+        recommender.ensure_recipenlg_search_index()
+        with mock.patch.object(
+            recommender, "_query_search_shard_hits", wraps=recommender._query_search_shard_hits
+        ) as query_hits:
+            recommender.search_recipenlg_candidates("chicken rice", limit=5)
+        self.assertEqual(query_hits.call_count, 1)
+        self.assertEqual(len(query_hits.call_args.args[1]), 2)
+
+    def test_rebuild_swaps_generation_and_drains_cache(self):
+        recommender.ensure_recipenlg_search_index()
+        generation = recommender.get_search_index_status()["generation"]
+        recommender.search_recipenlg_candidates("salad", limit=5)
+        self.assertEqual(recommender._search_recipenlg_candidates_cached.cache_info().currsize, 1)
+
+        status = recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertEqual(status["generation"], generation + 1)
+        self.assertEqual(recommender._search_recipenlg_candidates_cached.cache_info().currsize, 0)
+
+    def test_stale_index_serves_while_rebuilding_in_background(self):
+        recommender.ensure_recipenlg_search_index()
+        self.touch_csv()
+        status = recommender.get_search_index_status()
+        self.assertTrue(status["needs_rebuild"])
+        self.assertTrue(status["serving"])
+
+        titles = [item["title"] for item in recommender.search_recipenlg_candidates("omelette", limit=5)]
+        self.assertIn("Cheese Omelette", titles)
+
+        recommender._SEARCH_INDEX_BUILD_THREAD["thread"].join()
+        status = recommender.get_search_index_status()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["build"]["state"], "done")
+
+    def test_unexpected_build_error_marks_build_failed(self):
+        with mock.patch.object(recommender, "_build_search_index", side_effect=ValueError("corrupt checkpoint")):
+            recommender.start_search_index_build(force_rebuild=True).join(5)
+        status = recommender.get_search_index_status()
+        self.assertEqual(status["build"]["state"], "failed")
+        self.assertIsNotNone(status["build"]["finished_at"])
+        self.assertEqual(status["last_error"], "ValueError: corrupt checkpoint")
+        self.assertFalse(status["build_lock"]["locked"])
+
+    def test_force_rebuild_during_a_build_runs_after_it(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_build(force_rebuild=False):
+            calls.append(force_rebuild)
+            started.set()
+            release.wait(5)
+
+        with mock.patch.object(recommender, "ensure_recipenlg_search_index", side_effect=slow_build):
+            thread = recommender.start_search_index_build()
+            self.assertTrue(started.wait(5))
+            self.assertIs(recommender.start_search_index_build(force_rebuild=True), thread)
+            self.assertTrue(recommender.get_search_index_status()["build"]["force_pending"])
+            release.set()
+            thread.join(5)
+        self.assertEqual(calls, [False, True])
+        self.assertFalse(recommender.get_search_index_status()["build"]["force_pending"])
+
+    @unittest.skipIf(recommender.fcntl is None, "flock is POSIX-only")
+    def test_build_skipped_while_another_process_holds_lock(self):
+        recommender.ensure_recipenlg_search_index()
+        self.touch_csv()
+        lock_path = recommender._search_index_lock_path()
+        holder = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import fcntl, json, os, sys\n"
+                "file = open(sys.argv[1], 'a+')\n"
+                "fcntl.flock(file.fileno(), fcntl.LOCK_EX)\n"
+                "file.write(json.dumps({'pid': os.getpid(), 'host': 'builder'})); file.flush()\n"
+                "print('locked', flush=True)\n"
+                "sys.stdin.readline()\n",
+                str(lock_path),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.stdin.close)
+        self.addCleanup(holder.stdout.close)
+        self.assertEqual(holder.stdout.readline().strip(), "locked")
+
+        status = recommender.ensure_recipenlg_search_index()
+        self.assertTrue(status["needs_rebuild"])
+        self.assertTrue(status["serving"])
+        self.assertTrue(status["build_lock"]["locked"])
+        self.assertFalse(status["build_lock"]["owned_by_current_process"])
+        self.assertEqual(status["build_lock"]["owner"], {"pid": holder.pid, "host": "builder"})
+        self.assertEqual(recommender.get_search_index_status()["build"]["state"], "external")
+
+    @unittest.skipIf(recommender.fcntl is None, "flock is POSIX-only")
+    def test_lock_is_reported_released_after_holder_releases(self):
+        recommender.ensure_recipenlg_search_index()
+        lock_path = recommender._search_index_lock_path()
+        holder = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import fcntl, json, os, sys\n"
+                "file = open(sys.argv[1], 'a+')\n"
+                "fcntl.flock(file.fileno(), fcntl.LOCK_EX)\n"
+                "file.write(json.dumps({'pid': os.getpid(), 'host': 'builder'})); file.flush()\n"
+                "print('locked', flush=True)\n"
+                "sys.stdin.readline()\n"
+                "file.seek(0); file.truncate(); file.flush()\n"
+                "fcntl.flock(file.fileno(), fcntl.LOCK_UN)\n"
+                "print('released', flush=True)\n"
+                "sys.stdin.readline()\n",
+                str(lock_path),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.stdin.close)
+        self.addCleanup(holder.stdout.close)
+        self.assertEqual(holder.stdout.readline().strip(), "locked")
+        with mock.patch.object(recommender, "_lock_file", wraps=recommender._lock_file) as lock_file:
+            self.assertTrue(recommender.get_search_index_status()["build_lock"]["locked"])
+            holder.stdin.write("\n")
+            holder.stdin.flush()
+            self.assertEqual(holder.stdout.readline().strip(), "released")
+            for _ in range(3):
+                self.assertFalse(recommender.get_search_index_status()["build_lock"]["locked"])
+        lock_file.assert_not_called()
+
+    def test_stale_lock_owner_is_not_reported(self):
+        recommender.ensure_recipenlg_search_index()
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        recommender._search_index_lock_path().write_text(
+            json.dumps({"pid": dead.pid, "host": socket.gethostname()}), encoding="utf-8"
+        )
+        self.assertFalse(recommender.get_search_index_status(refresh=True)["build_lock"]["locked"])
+
+    def test_status_is_cached_until_file_stat_changes(self):
+        recommender.ensure_recipenlg_search_index()
+        with mock.patch.object(recommender, "_index_metadata", wraps=recommender._index_metadata) as metadata:
+            recommender.get_search_index_status()
+            recommender.get_search_index_status()
+            self.assertEqual(metadata.call_count, 0)
+
+            self.touch_csv()
+            self.assertTrue(recommender.get_search_index_status()["needs_rebuild"])
+            self.assertEqual(metadata.call_count, 1)
+
+    def test_status_recheck_interval_skips_filesystem(self):
+        recommender.ensure_recipenlg_search_index()
+        with mock.patch.object(recommender, "RECIPE_NLG_STATUS_RECHECK_SECONDS", 3600.0):
+            recommender.get_search_index_status()
+            recommender.recipenlg_csv_path.reset_mock()
+            self.touch_csv()
+            self.assertTrue(recommender.get_search_index_status()["ready"])
+            self.assertFalse(recommender.recipenlg_csv_path.called)
+            self.assertTrue(recommender.get_search_index_status(refresh=True)["needs_rebuild"])
+
+
+class ResumableBuildTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(recommender, "RECIPE_NLG_INDEX_BATCH_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def interrupt_build_at_row(self, failing_row_id):
+        original = recommender._index_row
+
+        def flaky_index_row(row_id, row):
+            if row_id == failing_row_id:
+                raise OSError("disk went away")
+            return original(row_id, row)
+
+        with mock.patch.object(recommender, "_index_row", side_effect=flaky_index_row):
+            return recommender.ensure_recipenlg_search_index()
+
+    def test_interrupted_build_resumes_from_checkpoint(self):
+        status = self.interrupt_build_at_row(5)
+        self.assertFalse(status["serving"])
+        self.assertEqual(status["last_error"], "disk went away")
+        self.assertEqual(status["build"]["rows_done"], 4)
+
+        status = recommender.ensure_recipenlg_search_index()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["row_count"], len(SAMPLE_RECIPES))
+        self.assertEqual(status["build"]["resumed_from_rows"], 4)
+        self.assertEqual(status["build"]["bytes_done"], status["build"]["bytes_total"])
+        titles = [item["title"] for item in recommender.search_recipenlg_candidates("salad", limit=10)]
+        self.assertEqual(sorted(titles), ["Chicken Salad", "Greek Salad"])
+
+    def test_resume_skips_rows_already_committed_in_a_shard(self):
+        with mock.patch.object(recommender, "RECIPE_NLG_INDEX_SHARDS", 2):
+            self.interrupt_build_at_row(5)
+            # Simulate a crash between shard commits: shard 0 is one checkpoint behind shard 1.
+            temp_path = recommender.RECIPE_NLG_INDEX_PATH.with_suffix(".tmp.sqlite3")
+            with recommender.closing(recommender.sqlite3.connect(str(temp_path))) as conn:
+                rolled_back = [
+                    row_id
+                    for (row_id,) in conn.execute("SELECT id FROM recipenlg_docs WHERE id > 2").fetchall()
+                ]
+                conn.executemany("DELETE FROM recipenlg_docs WHERE id = ?", [(row_id,) for row_id in rolled_back])
+                conn.executemany(
+                    "INSERT INTO recipenlg_fts(recipenlg_fts, rowid, title, ingredients_text, ner_text, category_tags) "
+                    "SELECT 'delete', ?, '', '', '', ''",
+                    [(row_id,) for row_id in rolled_back],
+                )
+                header_offset = recommender._read_csv_header(self.csv_path)[1]
+                with open(self.csv_path, "rb") as file:
+                    file.seek(header_offset)
+                    offset = header_offset + len(file.readline()) + len(file.readline())
+                conn.executemany(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                    [("checkpoint_offset", str(offset)), ("checkpoint_row_id", "2"), ("checkpoint_rows", "2")],
+                )
+                conn.commit()
+
+            status = recommender.ensure_recipenlg_search_index()
+            self.assertTrue(status["ready"])
+            self.assertEqual(status["row_count"], len(SAMPLE_RECIPES))
+            candidates = recommender.search_recipenlg_candidates("chicken OR beef OR cheese OR tomato", limit=20)
+            self.assertEqual(len(candidates), len(SAMPLE_RECIPES))
+
+    def test_force_rebuild_discards_checkpoint(self):
+        self.interrupt_build_at_row(5)
+        status = recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["build"]["resumed_from_rows"], 0)
+
+
+class NearDuplicateClusterTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        clones = [
+            ("Chicken and Rice Pilaf", ["1 lb chicken", "2 c. rice", "1 onion"], ["Cook."], ["chicken", "rice", "onion"]),
+            ("Chicken Rice Pilaf", ["2 lb chicken", "3 c. rice", "1 onion"], ["Stew."], ["chicken", "rice", "onion"]),
+        ]
+        write_sample_csv(self.csv_path, SAMPLE_RECIPES + clones)
+
+    def cluster_ids(self):
+        with recommender.closing(recommender.sqlite3.connect(str(recommender.RECIPE_NLG_INDEX_PATH))) as conn:
+            return dict(conn.execute("SELECT id, cluster_id FROM recipenlg_docs").fetchall())
+
+    def test_near_duplicates_share_the_first_recipe_cluster(self):
+        status = recommender.ensure_recipenlg_search_index()
+        self.assertEqual(status["row_count"], len(SAMPLE_RECIPES) + 2)
+        self.assertEqual(status["cluster_count"], len(SAMPLE_RECIPES))
+        cluster_ids = self.cluster_ids()
+        self.assertEqual(cluster_ids[7], 1)
+        self.assertEqual(cluster_ids[8], 1)
+        self.assertEqual(cluster_ids[3], 3)
+        self.assertFalse(recommender._cluster_state_path().exists())
+
+    def test_retrieval_keeps_one_row_per_cluster(self):
+        status = recommender.ensure_recipenlg_search_index()
+        rows = recommender._query_search_shards(status["shard_paths"], ["chicken OR rice"], 20)
+        cluster_ids = [row["cluster_id"] for row in rows]
+        self.assertEqual(len(cluster_ids), len(set(cluster_ids)))
+        self.assertEqual(sorted(cluster_ids), [1, 2, 3])
+
+    def test_resumed_build_assigns_the_same_clusters(self):
+        original = recommender._index_row
+
+        def flaky_index_row(row_id, row):
+            if row_id == 8:
+                raise OSError("disk went away")
+            return original(row_id, row)
+
+        with mock.patch.object(recommender, "RECIPE_NLG_INDEX_BATCH_SIZE", 2):
+            with mock.patch.object(recommender, "_index_row", side_effect=flaky_index_row):
+                self.assertFalse(recommender.ensure_recipenlg_search_index()["serving"])
+            self.assertTrue(recommender._cluster_state_path().exists())
+            status = recommender.ensure_recipenlg_search_index()
+        self.assertEqual(status["build"]["resumed_from_rows"], 6)
+        resumed = self.cluster_ids()
+
+        recommender.ensure_recipenlg_search_index(force_rebuild=True)
+        self.assertEqual(self.cluster_ids(), resumed)
+
+
+class PantrySearchTests(RecipeIndexTestCase):
+    def test_recipes_ranked_by_share_of_ingredients_on_hand(self):
+        recommender.ensure_recipenlg_search_index()
+        ranked = recommender.rank_recipenlg_pantry(["chicken", "rice", "onions", "carrot"], limit=3)
+        self.assertEqual([item["title"] for item in ranked[:2]], ["Chicken Rice Pilaf", "Beef Pilaf"])
+        self.assertEqual(ranked[0]["pantry_coverage"], 1.0)
+        self.assertEqual(ranked[0]["missing_ingredients"], [])
+        self.assertEqual((ranked[1]["matched_count"], ranked[1]["ingredient_count"]), (2, 3))
+        self.assertEqual(ranked[1]["missing_ingredients"], ["beef"])
+
+    def test_excluded_ingredients_and_unknown_pantry(self):
+        recommender.ensure_recipenlg_search_index()
+        titles = [item["title"] for item in recommender.rank_recipenlg_pantry(["tomato"], exclude_ingredients=["feta"])]
+        self.assertEqual(titles, ["Tomato Soup"])
+        self.assertEqual(recommender.rank_recipenlg_pantry(["durian"]), [])
+
+    def test_exclusions_match_whole_words(self):
+        write_sample_csv(
+            self.csv_path,
+            SAMPLE_RECIPES
+            + [("Eggplant Stew", ["1 eggplant", "2 tomatoes"], ["Stew."], ["eggplant", "tomatoes"])],
+        )
+        main_path = recommender.ensure_recipenlg_search_index()["shard_paths"][0]
+        titles = [item["title"] for item in recommender.rank_recipenlg_pantry(["tomato"], exclude_ingredients=["egg"])]
+        self.assertIn("Eggplant Stew", titles)
+        titles = [item["title"] for item in recommender.rank_recipenlg_pantry(["cheese"], exclude_ingredients=["egg"])]
+        self.assertNotIn("Cheese Omelette", titles)
+        self.assertEqual(recommender._pantry_ingredient_id_list(main_path, {"to%"}, match_any_word=True), [])
+
+    def test_ingredient_vocabulary_is_shared_across_shards(self):
+        with mock.patch.object(recommender, "RECIPE_NLG_INDEX_SHARDS", 3):
+            status = recommender.ensure_recipenlg_search_index()
+            ranked = recommender.rank_recipenlg_pantry(["cheese", "eggs", "butter"], limit=10)
+        self.assertEqual(status["shard_count"], 3)
+        self.assertEqual(ranked[0]["title"], "Cheese Omelette")
+        self.assertIn("Greek Salad", [item["title"] for item in ranked])
+
+
+class ColumnSnapshotTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        recommender.get_recipenlg_preview.cache_clear()
+        self.addCleanup(recommender.get_recipenlg_preview.cache_clear)
+
+    def test_snapshot_serves_preview_and_index_build_without_csv_parsing(self):
+        expected_preview = recommender.get_recipenlg_preview(limit=3)
+        recommender.get_recipenlg_preview.cache_clear()
+        result = recommender.build_recipenlg_snapshot()
+        self.assertEqual((result["row_count"], result["valid_row_count"]), (len(SAMPLE_RECIPES), len(SAMPLE_RECIPES)))
+
+        with mock.patch.object(recommender.csv, "DictReader", side_effect=AssertionError("CSV parsed")):
+            self.assertEqual(recommender.get_recipenlg_preview(limit=3), expected_preview)
+            status = recommender.ensure_recipenlg_search_index()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["row_count"], len(SAMPLE_RECIPES))
+        titles = [item["title"] for item in recommender.search_recipenlg_candidates("salad", limit=10)]
+        self.assertEqual(sorted(titles), ["Chicken Salad", "Greek Salad"])
+
+    def test_snapshot_resume_offsets_match_csv_rows(self):
+        recommender.build_recipenlg_snapshot()
+        snapshot = recommender.get_recipenlg_snapshot()
+        fieldnames, header_offset = recommender._read_csv_header(self.csv_path)
+        csv_rows = list(recommender._iter_csv_rows(self.csv_path, fieldnames, header_offset))
+        resume_offset = csv_rows[2][1]
+        snapshot_rows = list(recommender._iter_recipenlg_rows(self.csv_path, fieldnames, resume_offset))
+        self.assertEqual([offset for _, offset in snapshot_rows], [offset for _, offset in csv_rows[3:]])
+        self.assertEqual(snapshot_rows[0][0]["title"], csv_rows[3][0]["title"])
+        self.assertEqual(snapshot["metadata"]["fieldnames"], fieldnames)
+
+    def test_snapshot_is_ignored_once_csv_changes(self):
+        recommender.build_recipenlg_snapshot()
+        self.assertIsNotNone(recommender.get_recipenlg_snapshot())
+        self.touch_csv()
+        self.assertIsNone(recommender.get_recipenlg_snapshot())
+
+
+class ShardedSearchIndexTests(RecipeIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(recommender, "RECIPE_NLG_INDEX_SHARDS", 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build_writes_shards_and_fans_out_queries(self):
+        status = recommender.ensure_recipenlg_search_index()
+        self.assertTrue(status["ready"])
+        self.assertEqual(status["shard_count"], 3)
+        self.assertTrue(all(Path(path).exists() for path in status["shard_paths"]))
+        self.assertEqual(status["row_count"], len(SAMPLE_RECIPES))
+
+        titles = {item["title"] for item in recommender.search_recipenlg_candidates("chicken OR salad", limit=10)}
+        self.assertEqual(titles, {"Chicken Rice Pilaf", "Chicken Salad", "Greek Salad"})
+
+    def test_rebuild_keeps_only_current_and_previous_shards(self):
+        first = recommender.ensure_recipenlg_search_index()["shard_paths"][1:]
+        second = recommender.ensure_recipenlg_search_index(force_rebuild=True)["shard_paths"][1:]
+        third = recommender.ensure_recipenlg_search_index(force_rebuild=True)["shard_paths"][1:]
+        self.assertFalse(any(Path(path).exists() for path in first))
+        self.assertTrue(all(Path(path).exists() for path in second + third))
+
+
+if __name__ == "__main__":
+    unittest.main()